@@ -0,0 +1,92 @@
+import re
+import random
+import timeit
+from src.utils.message_classifier import classify_message
+
+ITERATIONS = 20
+
+# Shapes of messages the bot actually sees in busy channels
+TEMPLATES = [
+    "lol", "lmao same", "gg", "nice", "wait what", "ok", "brb",
+    "<@{id}> what do you think about {topic}?",
+    "<@{id}> can you help me with my {topic} build please",
+    "*walks into the tavern and orders a drink* evening everyone",
+    "anyone else playing {topic} tonight",
+    "i'm so {mood} right now, {topic} has been rough this week",
+    "who won the {topic} game last night",
+    "what's the latest news on {topic}",
+    "<@{id}> search for {topic} patch notes",
+    "did anyone see the {topic} announcement for march 2025",
+    "currently grinding {topic}, anybody want to join in a bit",
+    "https://tenor.com/view/{topic}-gif-{id}",
+    "honestly {topic} is overrated and i will die on this hill",
+    "could you explain how {topic} works in simple terms",
+]
+TOPICS = ["elden ring", "the election", "valorant", "minecraft", "stock price of nvidia", "weather forecast", "league"]
+MOODS = ["sad", "happy", "anxious", "excited", "tired"]
+
+
+def build_corpus(size: int = 5000) -> list:
+    """Generate a reproducible corpus of realistic Discord messages."""
+    rng = random.Random(42)
+    return [
+        rng.choice(TEMPLATES).format(id=rng.randint(10**17, 10**18), topic=rng.choice(TOPICS), mood=rng.choice(MOODS))
+        for _ in range(size)
+    ]
+
+
+def legacy_classify(content: str) -> tuple:
+    """The per-list `in` scans used before the compiled matcher."""
+    content_lower = content.lower()
+
+    if "?" in content or any(q in content_lower for q in ["what", "how", "why", "who", "when", "where", "explain"]):
+        conversation_type = "question"
+    elif any(word in content_lower for word in ["sad", "happy", "angry", "worried", "excited", "scared", "depressed", "anxious"]):
+        conversation_type = "emotional"
+    elif "*" in content:
+        conversation_type = "roleplay"
+    elif any(word in content_lower for word in ["please", "can you", "could you", "would you", "help me"]):
+        conversation_type = "request"
+    else:
+        conversation_type = "casual"
+
+    explicit = any(term in content_lower for term in [
+        "search for", "look up", "find information about", "what's happening",
+        "latest news", "recent news", "current events", "breaking news"
+    ])
+    has_date = bool(re.search(r'\b(202[4-5]|january|february|march|april|may|june|july|august|september|october|november|december)\b', content_lower))
+    is_question = "?" in content or any(q in content_lower for q in ["what", "who", "when", "how"])
+    has_time_signal = any(i in content_lower for i in ["today", "this week", "this month", "right now", "currently", "recent", "latest", "new"])
+    has_current_topic = any(k in content_lower for k in ["score", "election", "weather forecast", "stock price", "who won", "who's winning", "game result"])
+
+    search_worthy = explicit or (is_question and (has_date or has_current_topic)) or (
+        is_question and has_time_signal and len(content.split()) >= 6
+    )
+    return conversation_type, search_worthy
+
+
+def compiled_classify(content: str) -> tuple:
+    """The compiled matcher, bypassing its per-message cache."""
+    signals = classify_message.__wrapped__(content)
+    return signals.conversation_type, signals.search_worthy
+
+
+def bench(label: str, func, corpus: list, iterations: int = ITERATIONS):
+    """Time a classifier over the corpus and print the mean cost per message."""
+    total = timeit.timeit(lambda: [func(message) for message in corpus], number=iterations)
+    print(f"{label:<40} {total / (iterations * len(corpus)) * 1_000_000:8.2f} µs/msg")
+
+
+def run():
+    corpus = build_corpus()
+
+    mismatches = sum(legacy_classify(message) != compiled_classify(message) for message in corpus)
+    print(f"\n=== Message Classification ({len(corpus)} messages, {ITERATIONS} iterations) ===")
+    print(f"Results differ on {mismatches} messages")
+
+    bench("legacy keyword scans", legacy_classify, corpus)
+    bench("compiled matcher", compiled_classify, corpus)
+
+
+if __name__ == "__main__":
+    run()
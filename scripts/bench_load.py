@@ -0,0 +1,470 @@
+import os
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+from aiohttp import web
+
+# The bot reads its model endpoint from the environment when src.aclient is
+# imported, so point it at the fake server before anything from src loads
+FAKE_HOST = "127.0.0.1"
+os.environ.setdefault("FAKE_KOBOLD_PORT", "5099")
+os.environ["KOBOLD_TEXT_API"] = f"http://{FAKE_HOST}:{os.environ['FAKE_KOBOLD_PORT']}/v1/chat/completions"
+
+import aiosqlite
+from src import bot
+from src.aclient import client
+from src.moderation import database, logging as bot_logging
+from src.utils.koboldcpp_util import llm_lane
+from src.utils.loop_monitor import loop_monitor
+from src.utils.perf_trace import perf_tracer
+from src.utils.rate_limiter import llm_limiter
+from src.utils.response_generator import is_search_worthy
+
+RESULTS_DIR = "data/bench"
+BOT_ID = 900000000000000001
+
+# Chatter shapes seen in busy channels; search-worthy ones are dropped so a
+# run never leaves the machine
+CHAT_LINES = [
+    "lol", "lmao same", "gg", "nice one", "ok", "brb", "anyone up for {topic} tonight",
+    "i'm so {mood} right now, {topic} has been rough",
+    "honestly {topic} is overrated and i will die on this hill",
+    "*walks into the tavern and orders a drink* evening everyone",
+    "can you help me with my {topic} build please",
+    "could you explain how {topic} works in simple terms",
+    "thoughts on {topic}? 🤔🔥😂",
+    "tell me a story about a dragon who plays {topic}",
+]
+TOPICS = ["elden ring", "valorant", "minecraft", "league", "chess", "the raid", "dnd"]
+MOODS = ["sad", "happy", "anxious", "excited", "tired"]
+REPLY_WORDS = (
+    "the dragon tavern gold quest night raid build sword shield arrow rogue mage spell "
+    "roll dice laugh honestly maybe probably indeed friend chaos goblin treasure map"
+).split()
+
+# Summary keys compared against a saved baseline, and whether higher is better
+COMPARE_KEYS = {
+    "messages_per_sec": True,
+    "reply_p50_ms": False,
+    "reply_p95_ms": False,
+    "reply_p99_ms": False,
+    "rss_growth_mb": False,
+    "db_writes_per_message": False,
+    "db_commits_per_message": False,
+    "llm_requests_per_reply": False,
+    "loop_lag_max_ms": False,
+}
+
+
+# ============================================================================
+# FAKE KOBOLDCPP
+# ============================================================================
+
+class FakeKobold:
+    """OpenAI-compatible chat endpoint with configurable latency and token rate."""
+
+    def __init__(self, latency: float, tokens_per_sec: float, slots: int, seed: int):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self._slots = asyncio.Semaphore(slots)
+        self._rng = random.Random(seed)
+        self.requests = 0
+        self.choices = 0
+        self.tokens = 0
+        self._runner = None
+
+    async def handle(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        max_tokens = int(payload.get("max_tokens", 400))
+        n = int(payload.get("n", 1))
+
+        choices = []
+        generated = 0
+        for i in range(n):
+            length = self._rng.randint(min(20, max_tokens), max_tokens)
+            text = " ".join(self._rng.choice(REPLY_WORDS) for _ in range(max(1, int(length * 0.75))))
+            choices.append({
+                "index": i,
+                "message": {"role": "assistant", "content": text.capitalize() + "."},
+                "finish_reason": "length" if length >= max_tokens else "stop"
+            })
+            generated += length
+
+        # A single-slot model serves one request at a time, like KoboldCPP
+        async with self._slots:
+            await asyncio.sleep(self.latency + generated / self.tokens_per_sec)
+
+        self.requests += 1
+        self.choices += n
+        self.tokens += generated
+        return web.json_response({"choices": choices, "usage": {"completion_tokens": generated}})
+
+    async def start(self, port: int):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, FAKE_HOST, port).start()
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+# ============================================================================
+# FAKE DISCORD
+# ============================================================================
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.bot = False
+        self.mention = f"<@{user_id}>"
+
+    def mentioned_in(self, message) -> bool:
+        return self in message.mentions
+
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+
+
+class _Typing:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int, guild=None):
+        self.id = channel_id
+        self.guild = guild
+        self.sent = 0
+
+    def typing(self):
+        return _Typing()
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+
+
+class FakeMessage:
+    def __init__(self, content: str, author: FakeUser, channel: FakeChannel, mentions: list):
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.mentions = mentions
+        self.attachments = []
+        self.reference = None
+        self.created = time.perf_counter()
+        self.replied_at = None
+        self.reply_text = None
+        self.throttled = False
+
+    async def reply(self, content=None, **kwargs):
+        if self.replied_at is None:
+            self.replied_at = time.perf_counter()
+            self.reply_text = content
+
+    async def add_reaction(self, emoji):
+        self.throttled = True
+
+
+# ============================================================================
+# DATABASE WRITE COUNTING
+# ============================================================================
+
+db_counts = {"writes": 0, "rows": 0, "commits": 0}
+
+
+def _is_write(sql: str) -> bool:
+    return sql.lstrip().split(None, 1)[0].upper() in ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def instrument_sqlite():
+    """Count write statements and commits issued through aiosqlite."""
+    connection = aiosqlite.Connection
+    execute, executemany, commit = connection.execute, connection.executemany, connection.commit
+
+    def counted_execute(self, sql, parameters=None):
+        if _is_write(sql):
+            db_counts["writes"] += 1
+            db_counts["rows"] += 1
+        return execute(self, sql, parameters)
+
+    def counted_executemany(self, sql, parameters):
+        parameters = list(parameters)
+        if _is_write(sql):
+            db_counts["writes"] += 1
+            db_counts["rows"] += len(parameters)
+        return executemany(self, sql, parameters)
+
+    async def counted_commit(self):
+        db_counts["commits"] += 1
+        return await commit(self)
+
+    connection.execute = counted_execute
+    connection.executemany = counted_executemany
+    connection.commit = counted_commit
+
+
+# ============================================================================
+# LOAD GENERATION
+# ============================================================================
+
+def rss_mb() -> float:
+    """Current resident set size, falling back to the peak where /proc is missing."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[int((len(ordered) - 1) * pct)]
+
+
+def build_workload(args, bot_user: FakeUser) -> list:
+    """Generate a reproducible list of messages across guilds, channels and DMs."""
+    rng = random.Random(args.seed)
+    users = [FakeUser(100000000000000000 + i, f"user{i}") for i in range(args.users)]
+    guilds = [FakeGuild(200000000000000000 + g) for g in range(args.guilds)]
+    channels = [
+        FakeChannel(300000000000000000 + g * 1000 + c, guild)
+        for g, guild in enumerate(guilds) for c in range(args.channels)
+    ]
+    dm_channels = {}
+
+    lines = []
+    for template in CHAT_LINES:
+        for topic in TOPICS:
+            line = template.format(topic=topic, mood=rng.choice(MOODS))
+            if not is_search_worthy(line):
+                lines.append(line)
+
+    workload = []
+    for _ in range(args.messages):
+        author = rng.choice(users)
+        content = rng.choice(lines)
+        if rng.random() < args.dm_ratio:
+            channel = dm_channels.setdefault(author.id, FakeChannel(400000000000000000 + author.id))
+            workload.append(("dm", FakeMessage(content, author, channel, [])))
+        elif rng.random() < args.mention_ratio:
+            workload.append(("server", FakeMessage(f"{bot_user.mention} {content}", author, rng.choice(channels), [bot_user])))
+        else:
+            workload.append(("server", FakeMessage(content, author, rng.choice(channels), [])))
+    return workload
+
+
+async def dispatch(kind: str, message: FakeMessage):
+    # Mirrors on_message; DMs get their trace there rather than in the handler
+    if kind == "dm":
+        with perf_tracer.trace("dm_reply"):
+            await bot.handle_dm_message(message)
+    else:
+        await bot.handle_server_message(message)
+
+
+async def start_bot(bot_user: FakeUser, tmp_dir: str) -> list:
+    """Run the on_ready setup against throwaway databases, minus Discord and RSS."""
+    database.DB_PATH = os.path.join(tmp_dir, "user_data.db")
+    bot_logging.DB_PATH = os.path.join(tmp_dir, "analytics.db")
+    client._connection.user = bot_user
+
+    await database.init_db()
+    await bot_logging.init_logging_db()
+    await database.load_interaction_cache()
+    await bot.personality_manager.load_from_database()
+    bot.apply_guild_limits(await database.load_all_rate_limits())
+
+    return [
+        asyncio.create_task(database.increment_server_interaction()),
+        asyncio.create_task(database.flush_user_logs_periodically()),
+        asyncio.create_task(database.flush_pending_notes_periodically()),
+        asyncio.create_task(database.world_memory_worker()),
+        asyncio.create_task(loop_monitor.run()),
+    ]
+
+
+async def drain(timeout: float = 30.0):
+    """Wait for batched writes and background model jobs to finish."""
+    deadline = time.monotonic() + timeout
+    await asyncio.wait_for(database.write_queue.join(), timeout)
+    await asyncio.sleep(database.BATCH_TIMEOUT + 0.5)  # Last interaction batch
+    await database.flush_user_logs()
+    while llm_lane.get_stats()["background_queued"] and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+
+
+async def run_load(args) -> dict:
+    fake = FakeKobold(args.latency, args.token_rate, args.slots, args.seed)
+    await fake.start(int(os.environ["FAKE_KOBOLD_PORT"]))
+    instrument_sqlite()
+
+    bot_user = FakeUser(BOT_ID, "Chopperbot")
+    tmp_dir = tempfile.mkdtemp(prefix="chopperbot_load_")
+    background = await start_bot(bot_user, tmp_dir)
+    if args.no_rate_limit:
+        llm_limiter.default_limit = 10 ** 9
+
+    workload = build_workload(args, bot_user)
+    perf_tracer.reset()
+    for key in db_counts:
+        db_counts[key] = 0
+    rss_start = rss_mb()
+
+    # Open-loop arrivals: messages keep coming whether or not replies keep up
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    tasks = []
+    for kind, message in workload:
+        message.created = time.perf_counter()
+        tasks.append(asyncio.create_task(dispatch(kind, message)))
+        await asyncio.sleep(rng.expovariate(args.rate))
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    await drain()
+
+    rss_end = rss_mb()
+    for task in background:
+        task.cancel()
+    await fake.stop()
+    await database.close_connection_pool()
+
+    messages = [message for _, message in workload]
+    replied = [m for m in messages if m.replied_at is not None]
+    latencies = [(m.replied_at - m.created) * 1000 for m in replied]
+    failed_replies = [m for m in replied if m.reply_text and "unavailable" in m.reply_text]
+    db_bytes = sum(
+        os.path.getsize(os.path.join(tmp_dir, name)) for name in os.listdir(tmp_dir)
+    )
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    loop_stats = loop_monitor.get_stats()
+
+    summary = {
+        "messages": len(messages),
+        "replies": len(replied),
+        "failed_replies": len(failed_replies),
+        "throttled": sum(m.throttled for m in messages),
+        "handler_errors": sum(isinstance(r, Exception) for r in results),
+        "elapsed_sec": elapsed,
+        "messages_per_sec": len(messages) / elapsed,
+        "reply_p50_ms": percentile(latencies, 0.50),
+        "reply_p95_ms": percentile(latencies, 0.95),
+        "reply_p99_ms": percentile(latencies, 0.99),
+        "reply_max_ms": max(latencies, default=0.0),
+        "rss_start_mb": rss_start,
+        "rss_end_mb": rss_end,
+        "rss_growth_mb": rss_end - rss_start,
+        "db_writes": db_counts["writes"],
+        "db_rows_written": db_counts["rows"],
+        "db_commits": db_counts["commits"],
+        "db_writes_per_message": db_counts["writes"] / len(messages),
+        "db_commits_per_message": db_counts["commits"] / len(messages),
+        "db_bytes": db_bytes,
+        "llm_requests": fake.requests,
+        "llm_tokens": fake.tokens,
+        "llm_requests_per_reply": fake.requests / len(replied) if replied else 0.0,
+        "loop_lag_p99_ms": loop_stats["p99_ms"],
+        "loop_lag_max_ms": loop_stats["max_ms"],
+        "loop_slow_steps": loop_stats["slow_steps"],
+    }
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "summary": summary,
+        "stages": perf_tracer.get_stats(),
+    }
+
+
+# ============================================================================
+# REPORTING
+# ============================================================================
+
+def print_report(result: dict):
+    s = result["summary"]
+    print(f"\n=== Load Test ({s['messages']} messages in {s['elapsed_sec']:.1f}s) ===")
+    print(f"Throughput:      {s['messages_per_sec']:.1f} msg/s")
+    print(f"Replies:         {s['replies']} ({s['failed_replies']} failed, {s['throttled']} throttled, "
+          f"{s['handler_errors']} handler errors)")
+    print(f"Reply latency:   p50 {s['reply_p50_ms']:.0f}ms / p95 {s['reply_p95_ms']:.0f}ms / "
+          f"p99 {s['reply_p99_ms']:.0f}ms / max {s['reply_max_ms']:.0f}ms")
+    print(f"Memory:          {s['rss_start_mb']:.1f} -> {s['rss_end_mb']:.1f}MB ({s['rss_growth_mb']:+.1f}MB)")
+    print(f"DB writes:       {s['db_writes']} statements, {s['db_rows_written']} rows, {s['db_commits']} commits "
+          f"({s['db_writes_per_message']:.2f} writes/msg, {s['db_bytes'] / 1024:.0f}KB on disk)")
+    print(f"LLM:             {s['llm_requests']} requests ({s['llm_requests_per_reply']:.2f}/reply), "
+          f"{s['llm_tokens']} tokens")
+    print(f"Event loop:      lag p99 {s['loop_lag_p99_ms']:.0f}ms, max {s['loop_lag_max_ms']:.0f}ms, "
+          f"{s['loop_slow_steps']} slow steps")
+
+    print("\nStage                      count    p50ms    p95ms    p99ms")
+    for stage, stats in sorted(result["stages"].items()):
+        print(f"{stage:<24} {stats['count']:>7} {stats['p50_ms']:>8.1f} {stats['p95_ms']:>8.1f} {stats['p99_ms']:>8.1f}")
+
+
+def print_comparison(result: dict, baseline: dict):
+    print(f"\n=== Compared to baseline from {baseline.get('timestamp', '?')} ===")
+    for key, higher_is_better in COMPARE_KEYS.items():
+        old, new = baseline["summary"].get(key), result["summary"][key]
+        if old is None:
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        better = (change > 0) == higher_is_better
+        marker = "" if abs(change) < 5 else " better" if better else " WORSE"
+        print(f"{key:<26} {old:>10.2f} -> {new:>10.2f} ({change:+6.1f}%){marker}")
+
+
+def save_result(result: dict, path: str = None) -> str:
+    if path is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"load_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+    return path
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Drive the message handlers with synthetic traffic against a fake model.")
+    parser.add_argument("--messages", type=int, default=500, help="Total messages to send")
+    parser.add_argument("--rate", type=float, default=20.0, help="Mean arrival rate (messages/sec)")
+    parser.add_argument("--guilds", type=int, default=20)
+    parser.add_argument("--channels", type=int, default=5, help="Channels per guild")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--mention-ratio", type=float, default=0.3, help="Share of server messages that mention the bot")
+    parser.add_argument("--dm-ratio", type=float, default=0.05, help="Share of messages sent as DMs")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake model time to first token (seconds)")
+    parser.add_argument("--token-rate", type=float, default=2000.0, help="Fake model generation speed (tokens/sec)")
+    parser.add_argument("--slots", type=int, default=1, help="Requests the fake model serves at once")
+    parser.add_argument("--no-rate-limit", action="store_true", help="Lift the per-user LLM rate limit")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Where to save the JSON result (default: data/bench/load_<time>.json)")
+    parser.add_argument("--compare", help="Baseline JSON result to compare against")
+    return parser.parse_args(argv)
+
+
+def run(argv=None):
+    args = parse_args(argv)
+    result = asyncio.run(run_load(args))
+    print_report(result)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(result, json.load(f))
+    print(f"\nSaved results to {save_result(result, args.output)}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+import time
+import random
+import timeit
+import string
+import argparse
+from src.utils import history_util, content_filter
+from src.utils.history_util import count_tokens, trim_history
+from src.utils.response_generator import (ResponseTracker, check_response_quality, detect_conversation_type,
+                                         sanitize_response)
+from src.utils.message_util import chunk_message
+from src.utils.websearch_util import format_results_for_prompt
+from src.utils.content_filter import censor_curse_words
+
+BASELINE_PATH = "data/bench/micro_baseline.json"
+REPEATS = 5
+TARGET_SECONDS = 0.2         # Per repeat; iterations are scaled to reach it
+
+# Allowed slowdown vs the baseline before a benchmark counts as a regression.
+# Sub-microsecond functions are noisier, so they get more slack.
+DEFAULT_THRESHOLD = 0.25
+THRESHOLDS = {
+    "detect_conversation_type": 0.50,
+    "check_response_quality[chat]": 0.50,
+}
+
+# ============================================================================
+# REALISTIC INPUTS
+# ============================================================================
+
+DM_SCENE = (
+    "*The torchlight flickers as the party descends the spiral stair into the Sunken Vault.* "
+    "The air grows cold and damp, heavy with the smell of old stone and something metallic. "
+    "At the bottom, a vast chamber opens before you: pillars carved with coiling serpents rise "
+    "into darkness, and between them lie the bones of adventurers who came before.\n\n"
+    "**Thorin**, as you step forward your boot catches a pressure plate. *Click.* Roll a DC 15 "
+    "Dexterity saving throw! 🎲\n\n"
+    "**Elara**, your arcane senses tingle. Somewhere in the chamber, a ward hums with faint "
+    "necrotic energy. Make an Arcana check to learn more.\n\n"
+    "From the shadows beyond the farthest pillar, two pale eyes open. A voice like grinding "
+    "stone echoes through the vault: *\"Who dares disturb the rest of the Bone King?\"*\n\n"
+)
+DM_REPLY = "Chopperbot: " + DM_SCENE * 3 + "What do you do?\nUser: I attack"
+DM_REPLY_HUGE = DM_SCENE * 12 + "What do you do?"
+
+CHAT_LINES = [
+    "lmaooo 😂😂😂 no way", "gg wp 🔥🔥", "bro what 💀💀💀", "ok ok 👀", "yessss 🎉🎉🎉🥳",
+    "who's up for raid tonight? 🐉⚔️🛡️", "that patch was so bad 😭😭 they nerfed my main",
+    "*throws a fireball at the goblin* 🔥🧙‍♂️", "anyone seen my cat 🐈‍⬛ she ran off with my dice 🎲",
+    "can you explain how initiative works? i keep forgetting 🤔",
+]
+REPLIES = [
+    "Ah, a classic blunder! 😄 Initiative is rolled once at the start of combat, and everyone acts in order.",
+    "Honestly? That patch nerfed half the meta. Your main will bounce back though, they always do. 🔥",
+    "*catches the cat mid-leap* She was guarding your d20 the whole time. Suspicious, if you ask me. 🐈‍⬛",
+    "The goblin shrieks as the fireball engulfs it! Roll 8d6 fire damage and tell me what you get. 🎲",
+    DM_SCENE,
+]
+
+SEARCH_RESULTS = [
+    {
+        "title": f"Patch {i}.2 notes: balance changes, new raid and quality of life fixes",
+        "url": f"https://example.com/news/patch-{i}-2-notes",
+        "desc": "The latest update reworks several classes and adds a new eight-player raid. " * 2,
+        "content": "Developers detailed the changes in a lengthy post covering every class. " * 12
+    }
+    for i in range(8)
+]
+
+
+# Public profanity lists run to several hundred entries and censor_curse_words
+# does one replace per entry, so the one-line list shipped in the repo would
+# make it look free. A generated list of that size stands in for a real one.
+WORD_LIST_SIZE = 400
+
+
+def build_word_list(size: int = WORD_LIST_SIZE) -> set:
+    """Deterministic 3-10 letter words, with a few that occur in the DM scene so replacements happen too."""
+    rng = random.Random(5)
+    words = {"bones", "darkness", "stone"}
+    while len(words) < size:
+        words.add("".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))))
+    return words
+
+
+def build_history(tokens: int = 2000) -> list:
+    """Alternate emoji-heavy chatter and long DM replies until the history is well over the budget."""
+    rng = random.Random(7)
+    history = []
+    while sum(count_tokens(m["content"]) for m in history) < tokens * 2:
+        name = f"user{rng.randint(0, 5)}"
+        history.append({"role": "user", "name": name, "content": f"{name}: {rng.choice(CHAT_LINES)}"})
+        history.append({"role": "assistant", "content": rng.choice(REPLIES)})
+    return history
+
+
+def build_chat(size: int = 500) -> list:
+    """Distinct chat messages so per-message caches don't hide the real cost."""
+    rng = random.Random(11)
+    return [f"{rng.choice(CHAT_LINES)} #{i}" for i in range(size)]
+
+
+def build_tracker() -> tuple:
+    """A tracker with full channel and server windows, plus fresh replies to check against it."""
+    rng = random.Random(3)
+    tracker = ResponseTracker()
+    channels = [f"server_1234_{c}" for c in range(10)]
+    for i in range(200):
+        tracker.add_response(rng.choice(channels), f"{rng.choice(REPLIES)} {i}")
+    candidates = [(rng.choice(channels), f"{rng.choice(REPLIES)} variant {i}") for i in range(200)]
+    return tracker, candidates
+
+
+# ============================================================================
+# BENCHMARKS
+# ============================================================================
+
+def build_benchmarks() -> dict:
+    """Name -> (function, inputs); each input is passed to the function once per pass."""
+    history = build_history()
+    chat = build_chat()
+    tracker, candidates = build_tracker()
+    long_text = DM_REPLY_HUGE + "\n" + "\n".join(chat)
+    content_filter.curse_words = build_word_list()  # Read by censor_curse_words on every call
+
+    return {
+        "trim_history[2000 tokens]": (lambda h: trim_history(h, max_tokens=2000), [history]),
+        "count_tokens[dm reply]": (count_tokens, [DM_SCENE * 3]),
+        "count_tokens[chat]": (count_tokens, chat),
+        "sanitize_response[dm reply]": (sanitize_response, [DM_REPLY]),
+        "check_response_quality[dm reply]": (check_response_quality, [DM_SCENE * 3]),
+        "check_response_quality[chat]": (check_response_quality, REPLIES[:4]),
+        "detect_conversation_type": (detect_conversation_type, chat),
+        "chunk_message[long]": (chunk_message, [long_text]),
+        "format_results_for_prompt": (format_results_for_prompt, [SEARCH_RESULTS]),
+        f"censor_curse_words[dm reply, {WORD_LIST_SIZE} words]": (censor_curse_words, [DM_SCENE * 3]),
+        "ResponseTracker.is_repetitive": (lambda c: tracker.is_repetitive(*c), candidates),
+    }
+
+
+def measure(func, inputs: list) -> float:
+    """Best-of-REPEATS cost of one call in microseconds."""
+    def one_pass():
+        for item in inputs:
+            func(item)
+
+    # Scale iterations so each repeat runs long enough to time reliably
+    number = 1
+    while timeit.timeit(one_pass, number=number) < TARGET_SECONDS / 10:
+        number *= 10
+    best = min(timeit.repeat(one_pass, number=number, repeat=REPEATS))
+    return best / (number * len(inputs)) * 1_000_000
+
+
+def tokenizer_name() -> str:
+    return "tiktoken cl100k_base" if history_util._enc else "whitespace fallback"
+
+
+# ============================================================================
+# BASELINE COMPARISON
+# ============================================================================
+
+def compare(results: dict, baseline: dict, default_threshold: float) -> list:
+    """Print each benchmark against the baseline and return the ones over their threshold."""
+    if baseline.get("tokenizer") != tokenizer_name():
+        print(f"Warning: baseline used {baseline.get('tokenizer')}, this run uses {tokenizer_name()}")
+
+    regressions = []
+    print(f"\n{'benchmark':<36} {'baseline':>10} {'now':>10} {'change':>8}")
+    for name, now in results.items():
+        old = baseline["results"].get(name)
+        if old is None:
+            print(f"{name:<36} {'-':>10} {now:>8.2f}µs      new")
+            continue
+        change = (now - old) / old
+        threshold = THRESHOLDS.get(name, default_threshold)
+        flag = " REGRESSION" if change > threshold else ""
+        print(f"{name:<36} {old:>8.2f}µs {now:>8.2f}µs {change:>+7.0%}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def save_baseline(results: dict, path: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "tokenizer": tokenizer_name(),
+            "results": results
+        }, f, indent=2)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the per-message utility functions.")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help=f"Baseline file (default: {BASELINE_PATH})")
+    parser.add_argument("--save", action="store_true", help="Save this run as the new baseline")
+    parser.add_argument("--compare", action="store_true", help="Compare against the baseline; exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown as a fraction (default: 0.25)")
+    parser.add_argument("--only", nargs="+", help="Run benchmarks whose name contains any of these strings")
+    return parser.parse_args(argv)
+
+
+def run(argv=None) -> int:
+    args = parse_args(argv)
+    benchmarks = build_benchmarks()
+    if args.only:
+        benchmarks = {name: b for name, b in benchmarks.items() if any(s in name for s in args.only)}
+
+    print(f"\n=== Micro-benchmarks (best of {REPEATS}, tokenizer: {tokenizer_name()}) ===")
+    results = {}
+    for name, (func, inputs) in benchmarks.items():
+        results[name] = measure(func, inputs)
+        print(f"{name:<36} {results[name]:10.2f} µs/call")
+
+    status = 0
+    if args.compare:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            status = 1
+        else:
+            print("\nNo regressions")
+
+    if args.save:
+        save_baseline(results, args.baseline)
+        print(f"Saved baseline to {args.baseline}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,45 @@
+import timeit
+from src.personalities import personalities, custom_personalities, CONVERSATION_TYPES
+from src.utils.prompt_layout import build_layout
+
+ITERATIONS = 20000
+
+USER_NOTES = (
+    "Technical developer who enjoys dark jokes about game engines, "
+    "asks about music production and prefers short, concise answers."
+)
+
+HISTORY = [
+    {"role": "user", "name": f"user{i % 4}", "content": f"user{i % 4}: message number {i} about the raid tonight"}
+    for i in range(30)
+]
+
+
+def bench(label: str, func, iterations: int = ITERATIONS):
+    """Time a callable and print the mean cost per call."""
+    total = timeit.timeit(func, number=iterations)
+    print(f"{label:<40} {total / iterations * 1_000_000:8.2f} µs/call")
+
+
+def run():
+    personality = personalities["Default"]
+
+    print(f"\n=== Prompt Assembly ({ITERATIONS} iterations) ===")
+    for conversation_type in CONVERSATION_TYPES:
+        bench(
+            f"adapt_for_context[{conversation_type}]",
+            lambda: personality.adapt_for_context(conversation_type, USER_NOTES)
+        )
+
+    bench("get_generation_params[question]", lambda: personality.get_generation_params("question"))
+    bench("get_user_note_prompt", lambda: personality.get_user_note_prompt(USER_NOTES))
+    bench("custom_personalities (cached)", lambda: custom_personalities("Gandalf"))
+    bench(
+        "build_layout (30 msg history)",
+        lambda: build_layout(personality, "question", HISTORY, user_notes=USER_NOTES),
+        iterations=ITERATIONS // 10
+    )
+
+
+if __name__ == "__main__":
+    run()
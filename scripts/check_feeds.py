@@ -0,0 +1,127 @@
+import asyncio
+from aiohttp import web
+from src.utils.feed_service import FeedService, MAX_FEED_ITEMS
+
+FIXTURE_HOST = "127.0.0.1"
+FIXTURE_PORT = 5098
+ETAG = '"fixture-v1"'
+BIG_FEED_ITEMS = 20000
+
+MEDIA_NS = "http://search.yahoo.com/mrss/"
+
+
+def rss_item(i: int) -> str:
+    """One item carrying the namespaced extras many real feeds add after the plain fields."""
+    return (
+        f"<item><title>Headline {i}</title><link>https://example.com/{i}</link>"
+        f"<description>Story {i}</description><pubDate>Mon, 19 Oct 2026 12:00:00 GMT</pubDate>"
+        f"<media:title>Photo caption {i}</media:title><media:description/></item>"
+    )
+
+
+def rss_feed(items: int) -> bytes:
+    return (
+        f'<?xml version="1.0"?><rss version="2.0" xmlns:media="{MEDIA_NS}"><channel><title>Fixture</title>'
+        + "".join(rss_item(i) for i in range(items))
+        + "</channel></rss>"
+    ).encode("utf-8")
+
+
+class FixtureServer:
+    """Local RSS server that counts requests and how much of each body was sent."""
+
+    def __init__(self):
+        self.requests = {"small": 0, "big": 0, "slow": 0}
+        self.not_modified = 0
+        self.big_bytes_sent = 0
+        self.big_body = rss_feed(BIG_FEED_ITEMS)
+        self._runner = None
+
+    async def small(self, request: web.Request) -> web.StreamResponse:
+        self.requests["small"] += 1
+        if request.headers.get("If-None-Match") == ETAG:
+            self.not_modified += 1
+            return web.Response(status=304, headers={"ETag": ETAG})
+        return web.Response(body=rss_feed(MAX_FEED_ITEMS * 2), content_type="application/rss+xml",
+                            headers={"ETag": ETAG})
+
+    async def big(self, request: web.Request) -> web.StreamResponse:
+        # Streamed in small pieces so an early disconnect leaves most of it unsent
+        self.requests["big"] += 1
+        response = web.StreamResponse(headers={"Content-Type": "application/rss+xml"})
+        await response.prepare(request)
+        try:
+            for start in range(0, len(self.big_body), 4096):
+                await response.write(self.big_body[start:start + 4096])
+                self.big_bytes_sent = start + 4096
+                await asyncio.sleep(0.001)
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        return response
+
+    async def slow(self, request: web.Request) -> web.StreamResponse:
+        self.requests["slow"] += 1
+        await asyncio.sleep(0.3)
+        return web.Response(body=rss_feed(MAX_FEED_ITEMS), content_type="application/rss+xml")
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/small.xml", self.small)
+        app.router.add_get("/big.xml", self.big)
+        app.router.add_get("/slow.xml", self.slow)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, FIXTURE_HOST, FIXTURE_PORT).start()
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+def check(label: str, condition: bool, detail: str = ""):
+    print(f"{'ok  ' if condition else 'FAIL'} {label}{f' ({detail})' if detail else ''}")
+    if not condition:
+        raise SystemExit(1)
+
+
+async def run_checks():
+    server = FixtureServer()
+    await server.start()
+    base = f"http://{FIXTURE_HOST}:{FIXTURE_PORT}"
+    feeds = FeedService("fixture", {
+        "small": f"{base}/small.xml",
+        "big": f"{base}/big.xml",
+        "slow": f"{base}/slow.xml",
+    }, refresh_seconds=60)
+
+    try:
+        articles = await feeds.get_articles("small")
+        check("parses up to max_items", len(articles) == MAX_FEED_ITEMS, f"{len(articles)} articles")
+        check("plain title wins over media:title", articles[0]["title"] == "Headline 0", articles[0]["title"])
+        check("empty media:description doesn't blank the description", articles[0]["description"] == "Story 0")
+
+        await feeds.refresh("small")
+        entry = feeds.entries["small"]
+        check("sends If-None-Match and accepts 304", server.not_modified == 1 and entry.not_modified_count == 1)
+        check("keeps articles across a 304", entry.articles == articles)
+
+        await feeds.refresh("big")
+        await asyncio.sleep(0.2)  # Let the fixture notice the disconnect
+        total = len(server.big_body)
+        check("stops reading a large feed early", server.big_bytes_sent < total // 4,
+              f"{server.big_bytes_sent}/{total} bytes sent")
+        check("large feed still yields max_items", len(feeds.entries["big"].articles) == MAX_FEED_ITEMS)
+
+        results = await asyncio.gather(*(feeds.refresh("slow") for _ in range(5)))
+        check("coalesces concurrent refreshes", server.requests["slow"] == 1 and all(results),
+              f"{server.requests['slow']} request(s) for 5 refreshes")
+    finally:
+        await feeds.close()
+        await server.stop()
+
+
+def run():
+    asyncio.run(run_checks())
+
+
+if __name__ == "__main__":
+    run()
@@ -28,6 +28,9 @@ class aclient(discord.Client):
 
         # Other API integrations
         self.weatherAPI = os.getenv('WEATHER_API_KEY')
+
+        # Local Prometheus metrics endpoint (disabled when unset)
+        self.metrics_port = os.getenv('METRICS_PORT')
         
     
 client = aclient()
\ No newline at end of file
@@ -1,21 +1,28 @@
 import os
 import asyncio
 from collections import OrderedDict
-from discord import DMChannel, File, Interaction, app_commands
+from discord import DMChannel, File, Interaction, HTTPException, app_commands
 from src.aclient import client
 from src.utils.history_util import trim_history
 from src.moderation.database import (init_db, increment_server_interaction, queue_increment, flush_user_logs_periodically,
                                     queue_user_log, maybe_queue_notes_update, get_user_interactions,
-                                    interaction_cache, load_interaction_cache, maybe_update_world, add_to_world_history,
-                                    close_connection_pool, flush_user_logs, flush_pending_notes_periodically)
+                                    interaction_cache, load_interaction_cache, world_memory_worker, add_to_world_history,
+                                    close_connection_pool, flush_user_logs, flush_pending_notes_periodically,
+                                    load_all_rate_limits)
 from src.moderation.logging import init_logging_db, logger, log_chat_message
 from src.commands import (admin, user, mystical, news, recommend, relationship, weather, chatgpt, images,
                         personality, web, memes, crime, finance)
 from src.utils.message_util import to_discord_output
 from src.utils.vision_util import analyze_discord_attachment, is_image_attachment
-from src.utils.response_generator import (detect_conversation_type, generate_and_track_response, sanitize_response)
+from src.utils.response_generator import (detect_conversation_type, generate_and_track_response, sanitize_response,
+                                         start_web_search)
 from src.utils.context_builder import (build_dm_context, build_server_context, format_user_message)
-from src.utils.personality_manager import personality_manager
+from src.utils.personality_manager import personality_manager, resolve_server_personality
+from src.utils.feed_service import run_feed_prefetcher
+from src.utils.loop_monitor import loop_monitor
+from src.utils.rate_limiter import llm_limiter, apply_guild_limits
+from src.utils.perf_trace import perf_tracer, span
+from src.utils.metrics import messages_processed, start_metrics_server, stop_metrics_server
 
 
 # ============================================================================
@@ -46,7 +53,7 @@ def get_or_create_history(server_id: str, channel_id: str) -> list:
     # Evict oldest entry if cache is full
     if len(conversation_histories_cache) >= max_cache:
         evicted_key, _ = conversation_histories_cache.popitem(last=False)
-        logger.debug(f"LRU evicted: {evicted_key[0]}/{evicted_key[1]}/{evicted_key[2]}")
+        logger.debug(f"LRU evicted: {evicted_key[0]}/{evicted_key[1]}")
     
     # Create new history
     conversation_histories_cache[key] = []
@@ -76,11 +83,18 @@ async def on_ready():
     await client.tree.sync()
     await load_interaction_cache()
     await personality_manager.load_from_database()
+    apply_guild_limits(await load_all_rate_limits())
 
     # Background tasks
     client.loop.create_task(increment_server_interaction())
     client.loop.create_task(flush_user_logs_periodically())
     client.loop.create_task(flush_pending_notes_periodically()) 
+    client.loop.create_task(world_memory_worker())
+    client.loop.create_task(run_feed_prefetcher())
+    client.loop.create_task(loop_monitor.run())
+
+    if client.metrics_port:
+        await start_metrics_server(int(client.metrics_port))
 
     print(f'Logged in as {client.user.name}')
     logger.info(f"Logged in as {client.user.name}")
@@ -90,6 +104,7 @@ async def shutdown():
     try:
         await flush_user_logs()
         await close_connection_pool()
+        await stop_metrics_server()
         logger.info("Shutdown complete")
     except Exception as e:
         logger.error(f"Error during shutdown: {e}")
@@ -98,14 +113,27 @@ async def shutdown():
 # MESSAGE HANDLING
 # ============================================================================
 
+async def is_throttled(message, user_id: str, server_id: str = None) -> bool:
+    # Per-user LLM request cap; a reaction instead of a reply keeps spam quiet
+    if llm_limiter.try_acquire(user_id, server_id):
+        return False
+    try:
+        await message.add_reaction("⏳")
+    except HTTPException:
+        pass
+    return True
+
 @client.event
 async def on_message(message):
     if message.author == client.user:
         return
     
     if isinstance(message.channel, DMChannel):
-        await handle_dm_message(message)
+        messages_processed.inc(source="dm")
+        with perf_tracer.trace("dm_reply"):
+            await handle_dm_message(message)
     else:
+        messages_processed.inc(source="server")
         await handle_server_message(message)
 
 async def handle_dm_message(message):
@@ -118,27 +146,46 @@ async def handle_dm_message(message):
     # Add user message
     user_msg = format_user_message(user_name, message.content, is_dm=True)
     history.append(user_msg)
-    history[:] = trim_history(history, max_tokens=2000)
+    with span("history_trim"):
+        history[:] = trim_history(history, max_tokens=2000)
+
+    if await is_throttled(message, user_id):
+        return
 
     # Detect conversation type for adaptive responses
     conv_type = detect_conversation_type(message.content)
 
+    # Resolve personality once for the whole pipeline
+    with span("personality_lookup"):
+        personality = resolve_server_personality(None)
+
+    # Start any web search now so it overlaps with context building
+    search = start_web_search(message.content, f"dm_{user_id}", personality)
+
     # Build context (includes system prompt, user notes, history)
-    messages = await build_dm_context(history, user_id, user_name, conv_type)
+    with span("context_build"):
+        messages = await build_dm_context(
+            history, user_id, user_name, conv_type,
+            channel_key=f"dm_{user_id}", personality=personality
+        )
 
     try:
         async with message.channel.typing():
             # Generate response with quality checks and tracking
-            response = await generate_and_track_response(
-                messages, 
-                conv_type, 
-                f"dm_{user_id}",
-                server_id=None
-            )
+            with span("generate"):
+                response = await generate_and_track_response(
+                    messages, 
+                    conv_type, 
+                    f"dm_{user_id}",
+                    server_id=None,
+                    personality=personality,
+                    search=search
+                )
         
         # Add to history and send
         history.append({"role": "assistant", "content": response})
-        await message.reply(response)
+        with span("discord_send"):
+            await message.reply(response)
         
     except Exception as e:
         logger.exception(f"[DM Error] {e}")
@@ -163,7 +210,8 @@ async def handle_server_message(message):
     add_to_world_history(server_id, message.author.display_name, user_message)
 
     # Trim history
-    history[:] = trim_history(history, max_tokens=2000)
+    with span("history_trim"):
+        history[:] = trim_history(history, max_tokens=2000)
 
     # Respond when mentioned OR when replying with images
     should_respond = client.user.mentioned_in(message) or (
@@ -172,12 +220,18 @@ async def handle_server_message(message):
         message.reference.resolved.author == client.user
     )
     
-    if should_respond:
-        await generate_and_send_response(
-            message, history, user_id, user_name, 
-            server_id, channel_id, user_message,
-            has_images=has_images
-        )
+    if should_respond and not await is_throttled(message, user_id, server_id):
+        with perf_tracer.trace("server_reply"):
+            # Resolve personality once and start any web search while context is built
+            with span("personality_lookup"):
+                personality = resolve_server_personality(server_id)
+            search = start_web_search(user_message, f"server_{server_id}_{channel_id}", personality)
+
+            await generate_and_send_response(
+                message, history, user_id, user_name, 
+                server_id, channel_id, user_message,
+                has_images=has_images, personality=personality, search=search
+            )
     
     # Background tasks (non-blocking)
     await update_user_stats(server_id, user_id, user_name, history)
@@ -186,7 +240,7 @@ async def handle_server_message(message):
 async def generate_and_send_response(
     message, history, user_id, user_name, 
     server_id, channel_id, user_message,
-    has_images=False
+    has_images=False, personality=None, search=None
 ):
 
     image_analysis = None
@@ -197,7 +251,8 @@ async def generate_and_send_response(
             
             # Analyze image with user's question
             prompt = user_message if user_message else "Describe this image in detail."
-            image_analysis = await analyze_discord_attachment(image_att, prompt, use_personality=False, server_id=server_id)
+            with span("image_analysis"):
+                image_analysis = await analyze_discord_attachment(image_att, prompt, use_personality=False, server_id=server_id)
             
             logger.info(f"Image analyzed in {server_id}/{channel_id}")
             
@@ -209,10 +264,16 @@ async def generate_and_send_response(
     # Detect conversation type
     conv_type = detect_conversation_type(user_message)
     
+    # Resolve personality once for the whole pipeline
+    if personality is None:
+        personality = resolve_server_personality(server_id)
+    
     # Build context
-    messages = await build_server_context(
-        history, user_id, user_name, server_id, conv_type
-    )
+    with span("context_build"):
+        messages = await build_server_context(
+            history, user_id, user_name, server_id, conv_type,
+            channel_key=f"server_{server_id}_{channel_id}", personality=personality
+        )
     
     if image_analysis:
         messages.append({
@@ -223,30 +284,35 @@ async def generate_and_send_response(
     try:
         async with message.channel.typing():
             # Generate response
-            response = await generate_and_track_response(
-                messages,
-                conv_type,
-                f"server_{server_id}_{channel_id}",
-                server_id=server_id
-            )
+            with span("generate"):
+                response = await generate_and_track_response(
+                    messages,
+                    conv_type,
+                    f"server_{server_id}_{channel_id}",
+                    server_id=server_id,
+                    personality=personality,
+                    search=search
+                )
             
             # Sanitize output
-            response = sanitize_response(response)
+            with span("sanitize"):
+                response = sanitize_response(response)
 
         # Add to history
         history.append({"role": "assistant", "content": response})
 
         # Send response (handle long messages)
-        output = to_discord_output(response)
-        
-        if isinstance(output, File):
-            await message.reply("📄 Response was too long, see attached file:", file=output)
-        else:
-            for i, chunk in enumerate(output):
-                if i == 0:
-                    await message.reply(chunk)
-                else:
-                    await message.channel.send(chunk)
+        with span("discord_send"):
+            output = to_discord_output(response)
+            
+            if isinstance(output, File):
+                await message.reply("📄 Response was too long, see attached file:", file=output)
+            else:
+                for i, chunk in enumerate(output):
+                    if i == 0:
+                        await message.reply(chunk)
+                    else:
+                        await message.channel.send(chunk)
 
         # Log assistant message
         await log_chat_message(
@@ -272,7 +338,6 @@ async def update_user_stats(server_id, user_id, user_name, history):
     
     # Run these in background (non-blocking)
     asyncio.create_task(maybe_queue_notes_update(user_id, user_name, user_history, interactions))
-    # asyncio.create_task(maybe_update_world(server_id))
 
 # ============================================================================
 # GLOBAL ERROR HANDLER
@@ -298,9 +363,10 @@ async def on_app_command_error(interaction: Interaction, error: app_commands.App
 # STARTUP
 # ============================================================================
 
-try:
-    client.run(os.getenv('DISCORD_BOT_TOKEN'))
-except KeyboardInterrupt:
-    logger.info("Received shutdown signal")
-finally:
-    asyncio.run(shutdown())
\ No newline at end of file
+def run_discord_bot():
+    try:
+        client.run(os.getenv('DISCORD_BOT_TOKEN'))
+    except KeyboardInterrupt:
+        logger.info("Received shutdown signal")
+    finally:
+        asyncio.run(shutdown())
\ No newline at end of file
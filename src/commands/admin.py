@@ -1,6 +1,6 @@
 import time
 import asyncio
-from discord import Interaction, Embed, Color, Member, app_commands
+from discord import Interaction, Embed, Color, Member, File, app_commands
 from src.aclient import client
 from src.personalities import personalities
 from src.utils.personality_manager import (
@@ -16,12 +16,13 @@ from src.moderation.database import (
     delete_world_context, reset_database, delete_world_entry, get_pool_stats,
     invalidate_user_log_cache, list_world_facts, set_server_personality_lock,
     get_server_personality_lock, update_personality_notes_with_username,
-    pending_notes_queue, clear_criminal_record
+    pending_notes_queue, clear_criminal_record, save_rate_limit, delete_rate_limit
 )
 from src.utils.koboldcpp_util import get_kobold_response
 from src.moderation.logging import logger
 from src.utils.content_filter import filter_controversial, censor_curse_words
 from src.utils.permissions import is_admin, is_owner
+from src.utils.rate_limiter import rate_limiters
 
 # Personality locks persist in database 
 async def is_personality_locked(server_id: str) -> bool:
@@ -268,6 +269,20 @@ async def personality_info(interaction: Interaction):
         inline=True
     )
     
+    # Token efficiency since startup
+    from src.utils.generation_controller import generation_controller
+    
+    token_stats = generation_controller.get_stats()["personalities"].get(personality.name)
+    if token_stats:
+        embed.add_field(
+            name="Token Usage",
+            value=f"**Replies:** {token_stats['replies']}\n"
+                  f"**Generated:** {token_stats['generated']}\n"
+                  f"**Kept:** {token_stats['kept']} ({token_stats['kept_ratio']:.0%})\n"
+                  f"**Cut Off:** {token_stats['truncated']}",
+            inline=True
+        )
+    
     # Preview of prompt
     prompt_preview = personality.get_base_prompt()[:200] + "..."
     embed.add_field(
@@ -380,11 +395,8 @@ async def delete_world(interaction: Interaction):
     server_id = str(interaction.guild.id)
     await delete_world_context(server_id)
 
-    from src.moderation.database import world_histories, world_update_cooldowns
-    if server_id in world_histories:
-        del world_histories[server_id]
-    if server_id in world_update_cooldowns:
-        del world_update_cooldowns[server_id]
+    from src.moderation.database import clear_world_tracking
+    clear_world_tracking(server_id)
     
     logger.info(f"Deleted world context for {interaction.guild.name}")
     await interaction.response.send_message("✅ Deleted world context for this server", ephemeral=True)
@@ -813,13 +825,21 @@ async def health_check(interaction: Interaction):
     
     # 5. Cache Statistics
     from src.bot import conversation_histories_cache
-    from src.moderation.database import user_log_cache, interaction_cache
+    from src.moderation.database import user_log_cache, interaction_cache, world_context_cache
+    from src.utils.weather_util import weather_client
+    from src.utils.websearch_util import get_search_cache_stats
+    
+    weather_stats = weather_client.get_stats()["data"]
+    search_stats = get_search_cache_stats()
     
     embed.add_field(
         name="🗂️ Cache Status",
         value=f"💬 **Conversations:** {len(conversation_histories_cache)}\n"
               f"👤 **User Logs:** {len(user_log_cache)}\n"
-              f"📈 **Interactions:** {len(interaction_cache)}",
+              f"📈 **Interactions:** {len(interaction_cache)}\n"
+              f"🌍 **World Contexts:** {len(world_context_cache)}\n"
+              f"⛅ **Weather:** {weather_stats['entries']} ({weather_stats['hit_rate']:.0%} hits)\n"
+              f"🔎 **Web Search:** {search_stats['entries']} ({search_stats['hit_rate']:.0%} hits)",
         inline=True
     )
     
@@ -862,14 +882,117 @@ async def health_check(interaction: Interaction):
     )
     
     # 8. World Memory System
-    from src.moderation.database import world_histories
+    from src.moderation.database import get_world_memory_stats
+    
+    world_stats = get_world_memory_stats()
+    
+    world_value = (
+        f"🟢 **Status:** Active\n"
+        f"📚 **Tracking:** {world_stats['tracked_servers']}/{world_stats['max_servers']} servers"
+    )
     
-    active_worlds = len(world_histories)
+    # Per-server counters for this guild
+    this_world = world_stats["servers"].get(str(interaction.guild.id))
+    if this_world:
+        last_run = f"<t:{int(this_world['last_run'])}:R>" if this_world["last_run"] else "Never"
+        world_value += (
+            f"\n🕒 **Last Run:** {last_run}\n"
+            f"📥 **Backlog:** {this_world['backlog']} msgs\n"
+            f"⏭️ **Skipped:** {this_world['skipped']} | ✅ **Runs:** {this_world['runs']}"
+        )
     
     embed.add_field(
         name="🌍 World Memory",
-        value=f"🟢 **Status:** Active\n"
-              f"📚 **Tracking:** {active_worlds} servers",
+        value=world_value,
+        inline=True
+    )
+    
+    # 9. Prompt Prefix Stability
+    from src.utils.prompt_layout import prefix_tracker
+    
+    prefix_stats = prefix_tracker.get_stats()
+    
+    embed.add_field(
+        name="🧩 Prompt Prefix Reuse",
+        value=f"📐 **Avg Stability:** {prefix_stats['average_stability']:.1%}\n"
+              f"💬 **Channels:** {prefix_stats['tracked_channels']}\n"
+              f"🔢 **Samples:** {prefix_stats['samples']}",
+        inline=True
+    )
+    
+    # 10. Vision Pipeline
+    from src.utils.vision_util import get_vision_stats
+    from src.utils.vision_cache import vision_cache
+    
+    vision = get_vision_stats()
+    vision_cache_stats = vision_cache.get_stats()
+    
+    embed.add_field(
+        name="👁️ Vision",
+        value=f"🖼️ **Images:** {vision['images']}\n"
+              f"📉 **Saved:** {vision['bytes_saved'] / (1024 * 1024):.1f}MB\n"
+              f"⏱️ **Avg Latency:** {vision['avg_request_ms']:.0f}ms "
+              f"(prep {vision['avg_preprocess_ms']:.0f}ms)\n"
+              f"♻️ **Cache:** {vision_cache_stats['hit_rate']:.0%} hits "
+              f"({vision_cache_stats['near_hits']} near-duplicate)",
+        inline=True
+    )
+    
+    # 11. Event Loop Responsiveness
+    from src.utils.loop_monitor import loop_monitor
+    from src.utils.image_executor import get_image_executor_stats
+    
+    loop_stats = loop_monitor.get_stats()
+    image_workers = get_image_executor_stats()
+    loop_icon = "🟢" if loop_stats["p99_ms"] <= 100 else "🟡" if loop_stats["p99_ms"] <= 500 else "🔴"
+    last_slow = loop_stats["last_slow_step"]
+    slow_step_line = (
+        f" (last {last_slow['blocked_ms']:.0f}ms in `{last_slow['task']}` at `{last_slow['location']}`)"
+        if last_slow else ""
+    )
+    
+    embed.add_field(
+        name="⏳ Event Loop",
+        value=f"{loop_icon} **Lag p50/p99:** {loop_stats['p50_ms']:.0f}/{loop_stats['p99_ms']:.0f}ms\n"
+              f"📈 **Max Lag:** {loop_stats['max_ms']:.0f}ms\n"
+              f"🐢 **Slow Steps:** {loop_stats['slow_steps']}"
+              f"{slow_step_line}\n"
+              f"🖼️ **Image Jobs:** {image_workers['jobs']} "
+              f"(avg {image_workers['avg_ms']:.0f}ms, {image_workers['waiting']} waiting)",
+        inline=True
+    )
+    
+    # 12. Rate Limits
+    limit_lines = []
+    for name, limiter in rate_limiters.items():
+        stats = limiter.get_stats()
+        limit_lines.append(
+            f"**{name.title()}:** {limiter.limit_for(str(interaction.guild.id))}/{stats['window_seconds'] / 60:.0f}min "
+            f"({stats['denied']} denied, {stats['tracked_keys']} keys)"
+        )
+    
+    embed.add_field(
+        name="🚦 Rate Limits",
+        value="\n".join(limit_lines),
+        inline=True
+    )
+    
+    # 13. Reply Generation
+    from src.utils.response_generator import get_generation_stats
+    
+    from src.utils.generation_controller import generation_controller
+    
+    gen = get_generation_stats()
+    tokens = generation_controller.get_stats()
+    n_mode = {True: "n-best", False: "single", None: "unprobed"}[gen["n_supported"]]
+    
+    embed.add_field(
+        name="✍️ Reply Generation",
+        value=f"🎲 **Candidates:** {gen['avg_candidates']:.1f}/request ({n_mode})\n"
+              f"🛟 **Rescued:** {gen['rescued']}\n"
+              f"🔁 **Regenerations:** {gen['regenerations']}\n"
+              f"🪙 **Tokens Kept:** {tokens['kept_ratio']:.0%} of {tokens['generated']} "
+              f"({tokens['truncated']} cut off)",
         inline=True
     )
     
@@ -906,12 +1029,11 @@ async def reset_db(interaction: Interaction, confirm: str):
     await reset_database()
 
     from src.bot import conversation_histories_cache
-    from src.moderation.database import interaction_cache, world_histories, world_update_cooldowns
+    from src.moderation.database import interaction_cache, clear_world_tracking
     
     conversation_histories_cache.clear()
     interaction_cache.clear()
-    world_histories.clear()
-    world_update_cooldowns.clear()
+    clear_world_tracking()
     
     logger.warning("DATABASE FULLY RESET by admin")
 
@@ -921,16 +1043,19 @@ async def reset_db(interaction: Interaction, confirm: str):
 @is_admin()
 async def clear_cache(interaction: Interaction):
     from src.bot import conversation_histories_cache
-    from src.moderation.database import clear_user_log_cache, interaction_cache
+    from src.moderation.database import clear_user_log_cache, interaction_cache, clear_world_context_cache
+    from src.utils.websearch_util import clear_search_cache
     
     # Clear all caches
     conversation_histories_cache.clear()
     clear_user_log_cache()
     interaction_cache.clear()
+    clear_world_context_cache()
+    clear_search_cache()
     
     logger.info("All caches cleared by admin")
     await interaction.response.send_message(
-        "✅ Cleared all in-memory caches (conversation history, user logs, interactions)",
+        "✅ Cleared all in-memory caches (conversation history, user logs, interactions, world context, web search)",
         ephemeral=True
     )
 
@@ -993,6 +1118,80 @@ async def pool_stats(interaction: Interaction):
     
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
+@admin_only_command(name="rate_limit", description="Set a per-user rate limit for THIS server")
+@app_commands.describe(
+    kind="Which limit to change",
+    limit="Requests allowed per user per window (leave empty to reset to default)"
+)
+@app_commands.choices(kind=[
+    app_commands.Choice(name="LLM replies (per minute)", value="llm"),
+    app_commands.Choice(name="Image generation (per 10 minutes)", value="image"),
+    app_commands.Choice(name="Web searches (per channel per hour)", value="search")
+])
+@is_admin()
+async def rate_limit(interaction: Interaction, kind: str, limit: app_commands.Range[int, 0, 1000] = None):
+    server_id = str(interaction.guild.id)
+    limiter = rate_limiters[kind]
+    
+    limiter.set_guild_limit(server_id, limit)
+    if limit is None:
+        await delete_rate_limit(server_id, kind)
+    else:
+        await save_rate_limit(server_id, kind, limit)
+    
+    logger.info(f"Rate limit '{kind}' set to {limit if limit is not None else 'default'} for {interaction.guild.name}")
+    await interaction.response.send_message(
+        f"✅ **{kind}** limit for this server is now **{limiter.limit_for(server_id)}** "
+        f"per {limiter.window / 60:.0f} min" + (" (default)" if limit is None else ""),
+        ephemeral=True
+    )
+
+@admin_only_command(name="perf", description="Show per-stage latency of the message-to-reply pipeline")
+@app_commands.describe(
+    export="Also write recent traces to a Chrome trace file (chrome://tracing, ui.perfetto.dev)",
+    reset="Clear collected timings after showing them"
+)
+@is_admin()
+async def perf(interaction: Interaction, export: bool = False, reset: bool = False):
+    from src.utils.perf_trace import perf_tracer
+    
+    await interaction.response.defer(ephemeral=True)
+    stats = perf_tracer.get_stats()
+    
+    if not stats:
+        await interaction.followup.send("No timings collected yet.", ephemeral=True)
+        return
+    
+    # Whole replies first, then stages by their tail latency
+    totals = [name for name in ("server_reply", "dm_reply") if name in stats]
+    stages = sorted((name for name in stats if name not in totals), key=lambda name: stats[name]["p95_ms"], reverse=True)
+    
+    lines = [f"{'stage':<18}{'n':>6}{'p50':>8}{'p95':>8}{'p99':>8}"]
+    for name in totals + stages:
+        s = stats[name]
+        lines.append(f"{name[:18]:<18}{s['count']:>6}{s['p50_ms']:>8.0f}{s['p95_ms']:>8.0f}{s['p99_ms']:>8.0f}")
+    
+    embed = Embed(
+        title="⏱️ Pipeline Latency (ms)",
+        description="```\n" + "\n".join(lines)[:4000] + "\n```",
+        color=Color.blue()
+    )
+    embed.set_footer(text=f"Last {len(perf_tracer.recent_traces)} traces kept")
+    
+    file = None
+    if export:
+        path = await asyncio.to_thread(perf_tracer.export)
+        file = File(path)
+        logger.info(f"Exported performance traces to {path}")
+    
+    if reset:
+        perf_tracer.reset()
+    
+    if file:
+        await interaction.followup.send(embed=embed, file=file, ephemeral=True)
+    else:
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
 # ============================================================================
 # MISC COMMANDS
 # ============================================================================
@@ -1,84 +1,31 @@
-import aiohttp
-import asyncio
-import xml.etree.ElementTree as ET
 from datetime import datetime, timezone
-from typing import Optional, List, Dict
 from discord import Interaction, Embed, app_commands, Color
 from src.aclient import client
-from src.utils.response_generator import generate_command_response
+from src.utils.feed_service import finance_feeds
+from src.utils.personality_manager import resolve_server_personality
 from src.moderation.logging import logger
 from src.utils.news_sources import FINANCE_SOURCES, FINANCE_ICONS
 
 
-# Simple in-memory cache
-_finance_cache: Dict[str, tuple[List[Dict], datetime]] = {}
-CACHE_DURATION_MINUTES = 5
-
-async def fetch_rss_feed(url: str, source: str) -> Optional[str]:
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=aiohttp.ClientTimeout(total=10)) as resp:
-                if resp.status != 200:
-                    logger.error(f"Failed to fetch finance news from {source}. (HTTP {resp.status})")
-                    return None
-                return await resp.text()
-    except aiohttp.ClientError as e:
-        logger.error(f"Network error fetching from {source}: {str(e)}")
-        return None
-    except asyncio.TimeoutError:
-        logger.error(f"Timeout error fetching from {source}")
-        return None
-    except Exception as e:
-        logger.error(f"Unexpected error fetching from {source}: {str(e)}")
-        return None
-
-def parse_rss_items(xml_text: str, source: str, max_items: int = 5) -> Optional[List[Dict]]:
-    try:
-        root = ET.fromstring(xml_text)
-    except ET.ParseError as e:
-        logger.error(f"XML parse error for {source}: {str(e)}")
-        return None
-    
-    items = root.findall(".//item")[:max_items]
-    
-    articles = []
-    for item in items:
-        title = item.findtext("title", default="").strip()
-        link = item.findtext("link", default="").strip()
-        description = item.findtext("description", default="").strip()
-        pub_date_str = item.findtext("pubDate", default="").strip()
-        
-        # Parse publication date if available
-        pub_date = None
-        if pub_date_str:
-            try:
-                pub_date = datetime.strptime(pub_date_str, "%a, %d %b %Y %H:%M:%S %Z")
-            except ValueError:
-                try:
-                    pub_date = datetime.strptime(pub_date_str, "%a, %d %b %Y %H:%M:%S %z")
-                except ValueError:
-                    pass
-        
-        if title:
-            articles.append({
-                "title": title,
-                "link": link or "#",
-                "description": description,
-                "pub_date": pub_date
-            })
-    
-    return articles
+def build_analysis_prompt(headlines: list) -> str:
+    return (
+        "You are a financial analyst. Here are recent financial news headlines:\n\n"
+        + "\n".join(f"- {h}" for h in headlines)
+        + "\n\nProvide a brief summary (2-3 sentences) of "
+        "what these headlines suggest about current market conditions and "
+        "potential implications for investors. "
+        "Important: Frame this as educational analysis, not investment advice. "
+    )
 
-def get_cached_news(source: str) -> Optional[List[Dict]]:
-    if source in _finance_cache:
-        articles, cached_time = _finance_cache[source]
-        age = datetime.now(timezone.utc) - cached_time
-        if age.total_seconds() < CACHE_DURATION_MINUTES * 60:
-            return articles
-    return None
+def build_summary_prompt(headlines: list) -> str:
+    return (
+        "Here are recent financial news headlines:\n\n"
+        + "\n".join(f"- {h}" for h in headlines)
+        + "\n\nProvide a brief (2-3 sentence) summary of the main themes in these headlines."
+    )
 
-def cache_news(source: str, articles: List[Dict]) -> None:
-    _finance_cache[source] = (articles, datetime.now(timezone.utc))
+finance_feeds.register_summarizer("analysis", build_analysis_prompt, use_personality=False, temperature=0.7, max_tokens=300)
+finance_feeds.register_summarizer("summary", build_summary_prompt, use_personality=True, temperature=0.7, max_tokens=200)
 
 @client.tree.command(name="finance", description="Get financial news and market analysis")
 @app_commands.describe(
@@ -100,36 +47,19 @@ async def finance(
         )
         return
 
-    # Check cache first
-    articles = get_cached_news(source)
+    # Served from the background prefetcher's in-memory cache
+    articles = await finance_feeds.get_articles(source)
     
     if articles is None:
-        # Fetch from RSS feed
-        url = FINANCE_SOURCES[source]
-        xml_text = await fetch_rss_feed(url, source)
-        
-        if xml_text is None:
-            await interaction.followup.send(
-                f"⚠️ Failed to fetch financial news from {source.upper()}. Please try again later.",
-                ephemeral=True
-            )
-            return
-        
-        articles = parse_rss_items(xml_text, source, max_items=5)
-        
-        if articles is None:
-            await interaction.followup.send(
-                f"⚠️ Failed to parse RSS feed from {source.upper()}.",
-                ephemeral=True
-            )
-            return
-        
-        if not articles:
-            await interaction.followup.send("No headlines found.", ephemeral=True)
-            return
-        
-        # Cache the results
-        cache_news(source, articles)
+        await interaction.followup.send(
+            f"⚠️ Failed to fetch financial news from {source.upper()}. Please try again later.",
+            ephemeral=True
+        )
+        return
+    
+    if not articles:
+        await interaction.followup.send("No headlines found.", ephemeral=True)
+        return
 
     # Build embed with financial theme
     embed = Embed(
@@ -163,28 +93,18 @@ async def finance(
         else:
             break
 
-    # Generate AI analysis if requested
+    # Use pre-generated text when available, otherwise generate live
+    personality = resolve_server_personality(str(interaction.guild.id) if interaction.guild else None)
+
     if analysis and headlines:
-        analysis_prompt = (
-            "You are a financial analyst. Here are recent financial news headlines:\n\n"
-            + "\n".join(f"- {h}" for h in headlines)
-            + "\n\nProvide a brief summary (2-3 sentences) of "
-            "what these headlines suggest about current market conditions and "
-            "potential implications for investors. "
-            "Important: Frame this as educational analysis, not investment advice. "
-        )
+        analysis_text = finance_feeds.get_summary(source, "analysis")
 
-        try:
-            analysis_text = await generate_command_response(
-                prompt=analysis_prompt,
-                server_id=str(interaction.guild.id),
-                use_personality=False,
-                temperature=0.7,
-                max_tokens=300
-            )
-        except Exception as e:
-            logger.error(f"[FINANCE ERROR] Failed to generate analysis: {e}")
-            analysis_text = "Analysis currently unavailable."
+        if analysis_text is None:
+            try:
+                analysis_text = await finance_feeds.generate_summary(source, "analysis")
+            except Exception as e:
+                logger.error(f"[FINANCE ERROR] Failed to generate analysis: {e}")
+                analysis_text = "Analysis currently unavailable."
 
         if len(analysis_text) > 1024:
             analysis_text = analysis_text[:1021] + "..."
@@ -198,23 +118,14 @@ async def finance(
         )
         embed.add_field(name="Disclaimer", value=disclaimer, inline=False)
     else:
-        summary_prompt = (
-            "Here are recent financial news headlines:\n\n"
-            + "\n".join(f"- {h}" for h in headlines)
-            + "\n\nProvide a brief (2-3 sentence) summary of the main themes in these headlines."
-        )
+        summary = finance_feeds.get_summary(source, "summary", personality)
 
-        try:
-            summary = await generate_command_response(
-                prompt=summary_prompt,
-                server_id=str(interaction.guild.id),
-                use_personality=True,
-                temperature=0.7,
-                max_tokens=200
-            )
-        except Exception as e:
-            logger.error(f"[FINANCE ERROR] Failed to generate summary: {e}")
-            summary = "Summary currently unavailable."
+        if summary is None:
+            try:
+                summary = await finance_feeds.generate_summary(source, "summary", personality)
+            except Exception as e:
+                logger.error(f"[FINANCE ERROR] Failed to generate summary: {e}")
+                summary = "Summary currently unavailable."
 
         if len(summary) > 1024:
             summary = summary[:1021] + "..."
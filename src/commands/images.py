@@ -1,8 +1,10 @@
-from io import BytesIO
-from discord import Interaction, Attachment, app_commands, Color, Embed, File
+from discord import Interaction, Attachment, app_commands, Color, Embed
 from src.aclient import client
-from src.utils.vision_util import (is_image_attachment, get_image_metadata, analyze_discord_attachment, encode_image_to_base64)
+from src.utils.vision_util import (is_image_attachment, get_image_metadata, analyze_discord_attachment)
 from src.utils.image_generation_util import (generate_image_for_discord, get_available_styles, generate_image_from_image, generate_with_style)
+from src.utils.image_buffer import ImageBuffer
+from src.utils.image_queue import image_queue, describe_job, ImageJobCancelled, ImageQueueFull, MAX_JOBS_PER_USER
+from src.utils.rate_limiter import image_limiter
 from src.moderation.logging import logger
 
 @client.tree.command(name="analyze", description="Analyze an image")
@@ -16,6 +18,14 @@ async def analyze_image(
     question: str = "Describe this image in detail."
 ):
     await interaction.response.defer()
+    status = None
+    
+    async def report(content: str):
+        # Failures before the status message exists still need an answer
+        if status is not None:
+            await status.edit(content=content)
+        else:
+            await interaction.followup.send(content, ephemeral=True)
     
     try:
         if not is_image_attachment(image):
@@ -48,6 +58,40 @@ async def analyze_image(
             ephemeral=True
         )
 
+def make_status_updater(status_message):
+    # Edits the placeholder message with queue position and progress
+    last_text = None
+
+    async def on_update(job):
+        nonlocal last_text
+        if job.future.done():
+            return  # Final result is already being posted
+        text = describe_job(job)
+        if text != last_text:
+            last_text = text
+            await status_message.edit(content=text)
+
+    return on_update
+
+async def check_image_limit(interaction: Interaction) -> bool:
+    # Per-user generation cap; servers can override it with /rate_limit
+    user_id = str(interaction.user.id)
+    guild_id = str(interaction.guild.id) if interaction.guild else None
+    if image_limiter.try_acquire(user_id, guild_id):
+        return True
+
+    if image_limiter.limit_for(guild_id) == 0:
+        await interaction.response.send_message("🚫 Image generation is disabled on this server.", ephemeral=True)
+        return False
+
+    wait = image_limiter.retry_after(user_id, guild_id)
+    await interaction.response.send_message(
+        f"⏳ You've hit the image generation limit. Try again in {wait / 60:.0f} min." if wait >= 60
+        else f"⏳ You've hit the image generation limit. Try again in {wait:.0f}s.",
+        ephemeral=True
+    )
+    return False
+
 @client.tree.command(name="imagine", description="Generate an image from text")
 @app_commands.describe(
     prompt="Describe the image you want to create",
@@ -58,7 +102,16 @@ async def imagine(
     prompt: str,
     style: str = None
 ):
+    if not await check_image_limit(interaction):
+        return
+
     await interaction.response.defer()
+    status = await interaction.followup.send("⏳ Queued...", wait=True)
+    queue_args = {
+        "guild_id": str(interaction.guild.id) if interaction.guild else None,
+        "user_id": str(interaction.user.id),
+        "on_update": make_status_updater(status)
+    }
     
     try:
         logger.info(f"Generating image: {prompt[:50]}")
@@ -66,24 +119,25 @@ async def imagine(
         # Generate with or without style
         if style and style.lower() in get_available_styles():
             
-            image_bytes = await generate_with_style(prompt, style.lower())
-            image_file = File(BytesIO(image_bytes), filename="generated.png")
+            image = await generate_with_style(prompt, style.lower(), **queue_args)
+            image_file = image.to_file("generated.png")
         else:
-            image_file = await generate_image_for_discord(prompt)
+            image_file = await generate_image_for_discord(prompt, **queue_args)
         
         embed = Embed(title="🎨 Generated Image", description=f"**Prompt:** {prompt}", color=Color.green())
         if style:
             embed.add_field(name="Style", value=style.title())
 
-        await interaction.followup.send(embed=embed, file=image_file)
+        await status.edit(content=None, embed=embed, attachments=[image_file])
         logger.info("Image generation successful")
         
+    except ImageJobCancelled:
+        await status.edit(content="🛑 Image generation cancelled.")
+    except ImageQueueFull:
+        await status.edit(content=f"⏳ You already have {MAX_JOBS_PER_USER} images in the queue. Wait for one to finish or use `/imagine_cancel`.")
     except Exception as e:
         logger.exception(f"[Imagine Error] {e}")
-        await interaction.followup.send(
-            "❌ Failed to generate image. Make sure the image generation model is loaded.",
-            ephemeral=True
-        )
+        await status.edit(content="❌ Failed to generate image. Make sure the image generation model is loaded.")
 
 @imagine.autocomplete("style")
 async def style_autocomplete(interaction: Interaction, current: str):
@@ -104,24 +158,37 @@ async def reimagine(
     image: Attachment,
     changes: str = "Create a new artistic interpretation"
 ):
+    if not await check_image_limit(interaction):
+        return
+
     await interaction.response.defer()
+    status = None
+    
+    async def report(content: str):
+        # Failures before the status message exists still need an answer
+        if status is not None:
+            await status.edit(content=content)
+        else:
+            await interaction.followup.send(content, ephemeral=True)
     
     try:
         if not is_image_attachment(image):
             await interaction.followup.send("❌ Please upload an image!", ephemeral=True)
             return
         
-        image_bytes = await image.read()
-        image_base64 = await encode_image_to_base64(image_bytes)
+        init_image = ImageBuffer.from_bytes(await image.read())
         
-        await interaction.followup.send("🎨 Generating new image...")
+        status = await interaction.followup.send("⏳ Queued...", wait=True)
         image_file = await generate_image_from_image(
             prompt=changes,
-            init_image_base64=image_base64,
+            init_image=init_image,
             negative_prompt="low quality, blurry, distorted, ugly, bad anatomy",
             size="512x512",
             denoising_strength=0.7,
-            resize_input=True
+            resize_input=True,
+            guild_id=str(interaction.guild.id) if interaction.guild else None,
+            user_id=str(interaction.user.id),
+            on_update=make_status_updater(status)
             )
         
         embed = Embed(
@@ -131,8 +198,21 @@ async def reimagine(
         )
         embed.set_thumbnail(url=image.url)
         
-        await interaction.followup.send(embed=embed, file=image_file)
+        await status.edit(content=None, embed=embed, attachments=[image_file])
         
+    except ImageJobCancelled:
+        await report("🛑 Reimagine cancelled.")
+    except ImageQueueFull:
+        await report(f"⏳ You already have {MAX_JOBS_PER_USER} images in the queue. Wait for one to finish or use `/imagine_cancel`.")
     except Exception as e:
         logger.exception(f"[Reimagine Error] {e}")
-        await interaction.followup.send("❌ Failed to reimagine image.", ephemeral=True)
\ No newline at end of file
+        await report("❌ Failed to reimagine image.")
+
+@client.tree.command(name="imagine_cancel", description="Cancel your queued image generations")
+async def imagine_cancel(interaction: Interaction):
+    cancelled = image_queue.cancel_user_jobs(str(interaction.user.id))
+    
+    if cancelled:
+        await interaction.response.send_message(f"🛑 Cancelled {cancelled} image job(s).", ephemeral=True)
+    else:
+        await interaction.response.send_message("You have no image jobs in the queue.", ephemeral=True)
\ No newline at end of file
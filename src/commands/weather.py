@@ -1,11 +1,15 @@
+import asyncio
 import aiohttp
 from discord import app_commands, Embed, Color, Interaction
 from src.aclient import client
 from src.utils.response_generator import generate_command_response
+from src.utils.personality_manager import resolve_server_personality
+from src.utils.weather_util import (
+    weather_client, normalize_location, conditions_bucket,
+    WeatherAPIError, WeatherRateLimited
+)
 from src.moderation.logging import logger
 
-WEATHER_API_KEY = client.weatherAPI
-
 @client.tree.command(name="weather", description="Get the weather for a location")
 @app_commands.describe(
     city="City name",
@@ -26,17 +30,22 @@ async def weather(
     location_parts = [postal_code, city, region, country]
     location = ", ".join(part for part in location_parts if part.strip())
 
-    # Call WeatherAPI
-    async with aiohttp.ClientSession() as session:
-        url = f"http://api.weatherapi.com/v1/current.json?key={WEATHER_API_KEY}&q={location}"
-        async with session.get(url) as resp:
-            if resp.status != 200:
-                await interaction.followup.send(
-                    "⚠️ Could not fetch weather data. Try refining your location."
-                )
-                logger.error(f"[WEATHER ERROR] API response {resp.status} for location={location}")
-                return
-            data = await resp.json()
+    # Call WeatherAPI (cached per normalized location)
+    try:
+        data = await weather_client.get_current(location)
+    except WeatherRateLimited:
+        await interaction.followup.send("⚠️ This location was looked up too often. Try again in a few minutes.")
+        return
+    except WeatherAPIError as e:
+        await interaction.followup.send(
+            "⚠️ Could not fetch weather data. Try refining your location."
+        )
+        logger.error(f"[WEATHER ERROR] API response {e.status} for location={location}")
+        return
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        await interaction.followup.send("⚠️ Weather service is unreachable right now. Please try again later.")
+        logger.error(f"[WEATHER ERROR] Request failed for location={location}: {e}")
+        return
 
     # Extract fields
     city = data["location"]["name"]
@@ -57,13 +66,23 @@ async def weather(
         f"humidity {humidity}%, wind {wind_kph} kph. "
     )
 
+    # Same place, same conditions bucket, same voice -> reuse the commentary
+    personality = resolve_server_personality(str(interaction.guild.id) if interaction.guild else None)
+    commentary_key = (
+        f"current:{normalize_location(city, region, country)}:"
+        f"{conditions_bucket(condition, temp, wind_kph)}:{personality.name}"
+    )
+
     try:
-        ai_summary = await generate_command_response(
-            prompt=prompt,
-            server_id=str(interaction.guild.id),
-            use_personality=True,
-            temperature=0.85,
-            max_tokens=200
+        ai_summary = await weather_client.get_commentary(
+            commentary_key,
+            lambda: generate_command_response(
+                prompt=prompt,
+                use_personality=True,
+                temperature=0.85,
+                max_tokens=200,
+                personality=personality
+            )
         )
     except Exception as e:
         logger.error(f"[Weather AI Error] {e}")
@@ -107,15 +126,20 @@ async def forecast(
     location_parts = [postal_code, city, region, country]
     location = ", ".join(part for part in location_parts if part.strip())
 
-    # Call WeatherAPI forecast
-    async with aiohttp.ClientSession() as session:
-        url = f"http://api.weatherapi.com/v1/forecast.json?key={WEATHER_API_KEY}&q={location}&days={days}&aqi=no&alerts=no"
-        async with session.get(url) as resp:
-            if resp.status != 200:
-                await interaction.followup.send("⚠️ Could not fetch forecast data. Try refining your location.")
-                logger.error(f"[FORECAST ERROR] API response {resp.status} for location={location}")
-                return
-            data = await resp.json()
+    # Call WeatherAPI forecast (cached per normalized location and day count)
+    try:
+        data = await weather_client.get_forecast(location, days)
+    except WeatherRateLimited:
+        await interaction.followup.send("⚠️ This location was looked up too often. Try again in a few minutes.")
+        return
+    except WeatherAPIError as e:
+        await interaction.followup.send("⚠️ Could not fetch forecast data. Try refining your location.")
+        logger.error(f"[FORECAST ERROR] API response {e.status} for location={location}")
+        return
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        await interaction.followup.send("⚠️ Weather service is unreachable right now. Please try again later.")
+        logger.error(f"[FORECAST ERROR] Request failed for location={location}: {e}")
+        return
 
     # Extract location info
     city = data["location"]["name"]
@@ -149,12 +173,23 @@ async def forecast(
         f"Provide a friendly summary highlighting trends (e.g., rain, temperature shifts)."
     )
 
+    # Forecast text only changes when the upstream forecast does
+    personality = resolve_server_personality(str(interaction.guild.id) if interaction.guild else None)
+    commentary_key = (
+        f"forecast:{days}:{normalize_location(city, region, country)}:"
+        f"{hash(joined_forecast)}:{personality.name}"
+    )
+
     try:
-        ai_summary = await generate_command_response(
-            prompt=prompt,
-            use_personality=True,
-            temperature=0.85,
-            max_tokens=200
+        ai_summary = await weather_client.get_commentary(
+            commentary_key,
+            lambda: generate_command_response(
+                prompt=prompt,
+                use_personality=True,
+                temperature=0.85,
+                max_tokens=200,
+                personality=personality
+            )
         )
     except Exception as e:
         logger.error(f"[Forecast AI Error] {e}")
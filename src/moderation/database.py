@@ -4,9 +4,13 @@ import asyncio
 import datetime
 import time
 import re
+from collections import OrderedDict
 from contextlib import asynccontextmanager
-from src.utils.koboldcpp_util import get_kobold_response
+from src.utils.koboldcpp_util import get_kobold_response, llm_lane
 from src.utils.memory_util import significant_change
+from src.personalities import extract_note_traits
+from src.utils.perf_trace import span
+from src.utils.metrics import db_pool_wait
 from src.moderation.logging import logger
 
 DB_PATH =  "data/user_data.db"
@@ -80,7 +84,10 @@ class ConnectionPool:
     
     @asynccontextmanager
     async def get_connection(self):
-        conn = await self.acquire()
+        start = time.perf_counter()
+        with span("db.pool_wait"):
+            conn = await self.acquire()
+        db_pool_wait.observe(time.perf_counter() - start)
         try:
             yield conn
         finally:
@@ -152,6 +159,14 @@ async def init_db():
                 last_updated TEXT
             )
         """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS server_rate_limits (
+                server_id TEXT,
+                kind TEXT,
+                limit_count INTEGER NOT NULL,
+                PRIMARY KEY (server_id, kind)
+            )
+        """)
         await db.execute("""
             CREATE TABLE IF NOT EXISTS criminal_records (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -207,6 +222,7 @@ async def reset_database():
         await db.commit()
     
     user_log_cache.clear()
+    clear_world_context_cache()
 
     await init_db()
 
@@ -481,6 +497,9 @@ async def generate_personality_notes(user_id: str, username:str, history: list):
     return notes
 
 async def update_personality_notes(user_id: str, notes: str):
+    # Extract trait flags once here instead of on every prompt
+    extract_note_traits(notes)
+
     async with db_pool.get_connection() as db:
         await db.execute("""
             INSERT INTO user_logs (user_id, personality_notes)
@@ -494,6 +513,7 @@ async def update_personality_notes(user_id: str, notes: str):
         del user_log_cache[user_id]
 
 async def update_personality_notes_with_username(user_id: str, username: str, notes: str):
+    extract_note_traits(notes)
 
     async with db_pool.get_connection() as db:
         # Check if user exists
@@ -573,11 +593,12 @@ async def maybe_queue_notes_update(user_id: str, username: str, history: list, i
             await update_personality_notes_with_username(user_id, username, notes)
 
 async def get_user_log(user_id: str):
-    async with db_pool.get_connection() as db:
-        cursor = await db.execute("SELECT * FROM user_logs WHERE user_id = ?", (user_id,))
-        row = await cursor.fetchone()
-        await cursor.close()
-        return row
+    with span("db.user_log"):
+        async with db_pool.get_connection() as db:
+            cursor = await db.execute("SELECT * FROM user_logs WHERE user_id = ?", (user_id,))
+            row = await cursor.fetchone()
+            await cursor.close()
+            return row
     
 async def get_user_log_cached(user_id: str):
     now = time.time()
@@ -775,6 +796,34 @@ async def get_server_personality_lock(server_id: str) -> bool:
             return bool(row[0])
         return False
     
+# ============================================================================
+# RATE LIMIT CONFIGURATION
+# ============================================================================
+
+async def load_all_rate_limits() -> dict:
+    limits = {}
+    
+    async with db_pool.get_connection() as db:
+        async with db.execute("SELECT server_id, kind, limit_count FROM server_rate_limits") as cursor:
+            async for row in cursor:
+                limits.setdefault(row[0], {})[row[1]] = row[2]
+    
+    return limits
+
+async def save_rate_limit(server_id: str, kind: str, limit: int):
+    async with db_pool.get_connection() as db:
+        await db.execute("""
+            INSERT INTO server_rate_limits (server_id, kind, limit_count)
+            VALUES (?, ?, ?)
+            ON CONFLICT(server_id, kind) DO UPDATE SET limit_count = excluded.limit_count
+        """, (server_id, kind, limit))
+        await db.commit()
+
+async def delete_rate_limit(server_id: str, kind: str):
+    async with db_pool.get_connection() as db:
+        await db.execute("DELETE FROM server_rate_limits WHERE server_id = ? AND kind = ?", (server_id, kind))
+        await db.commit()
+
 # ============================================================================
 # CRIMINAL RECORD FUNCTIONS
 # ============================================================================
@@ -990,45 +1039,90 @@ async def get_civil_record(user_id: str, server_id: str):
 # ============================================================================
 # WORLD MEMORY SYSTEM
 # ============================================================================
-world_histories = {} # {server_id: [ {author, content}, ... ]}
+world_histories = OrderedDict() # {server_id: [ {author, content}, ... ]} (LRU)
 world_update_cooldowns = {}
+world_memory_stats = {}  # {server_id: {backlog, last_message, last_run, runs, skipped, deferred}}
+world_update_in_progress = set()
 WORLD_UPDATE_MESSAGE_THRESHOLD = 25
 WORLD_UPDATE_COOLDOWN = 120
+WORLD_UPDATE_MAX_BACKOFF = 1800     # Cap on the doubling cooldown after consecutive failures
+WORLD_UPDATE_DEBOUNCE = 30          # Quiet period before summarizing a burst of messages
+WORLD_WORKER_INTERVAL = 10          # How often the worker scans for due servers
+MAX_WORLD_HISTORY = 50              # Messages kept per server
+MAX_TRACKED_WORLD_SERVERS = 100     # Servers tracked before LRU eviction
+
+# Formatted world context cache, invalidated on every world_state write
+world_context_cache = {}  # {(server_id, max_facts): context_str}
+world_context_versions = {}  # {server_id: version}
+
+async def add_world_fact(server_id: str, key: str, value: str, db=None):
+    query = """
+        INSERT INTO world_state (server_id, key, value, last_updated)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(server_id, key) DO UPDATE SET
+            value = excluded.value,
+            last_updated = excluded.last_updated
+    """
+    params = (server_id, key, value, datetime.datetime.now(datetime.timezone.utc))
+
+    # Caller owns the transaction (and cache invalidation) when passing a connection
+    if db is not None:
+        await db.execute(query, params)
+        return
 
-async def add_world_fact(server_id: str, key: str, value: str):
     async with db_pool.get_connection() as db:
-        await db.execute("""
-            INSERT INTO world_state (server_id, key, value, last_updated)
-            VALUES (?, ?, ?, ?)
-            ON CONFLICT(server_id, key) DO UPDATE SET
-                value = excluded.value,
-                last_updated = excluded.last_updated
-        """, (server_id, key, value, datetime.datetime.now(datetime.timezone.utc)))
+        await db.execute(query, params)
         await db.commit()
 
-async def get_world_context(server_id: str, max_facts: int = 15) -> str:    
-    async with db_pool.get_connection() as db:
-        async with db.execute("""
-            SELECT key, value, last_updated 
-            FROM world_state 
-            WHERE server_id = ?
-            ORDER BY last_updated DESC
-            LIMIT ?
-        """, (server_id, max_facts)) as cursor:
-            facts = []
-            async for row in cursor:
-                key = row[0].replace("_", " ").title()
-                value = row[1]
-                facts.append(f"• {key}: {value}")
-    
-    if not facts:
-        return ""
+    invalidate_world_context_cache(server_id)
+
+def invalidate_world_context_cache(server_id: str):
+    for cache_key in [k for k in world_context_cache if k[0] == server_id]:
+        del world_context_cache[cache_key]
+    world_context_versions[server_id] = world_context_versions.get(server_id, 0) + 1
+
+def clear_world_context_cache():
+    world_context_cache.clear()
+    for server_id in world_context_versions:
+        world_context_versions[server_id] += 1
+
+def get_world_version(server_id: str) -> int:
+    return world_context_versions.get(server_id, 0)
+
+async def get_world_context(server_id: str, max_facts: int = 15) -> str:
+    cache_key = (server_id, max_facts)
+    if cache_key in world_context_cache:
+        return world_context_cache[cache_key]
+
+    # Snapshot the version so a write during the query doesn't get cached over
+    version = get_world_version(server_id)
+
+    with span("db.world_context"):
+        async with db_pool.get_connection() as db:
+            async with db.execute("""
+                SELECT key, value, last_updated 
+                FROM world_state 
+                WHERE server_id = ?
+                ORDER BY last_updated DESC
+                LIMIT ?
+            """, (server_id, max_facts)) as cursor:
+                facts = []
+                async for row in cursor:
+                    key = row[0].replace("_", " ").title()
+                    value = row[1]
+                    facts.append(f"• {key}: {value}")
     
-    return "Current World State:\n" + "\n".join(facts)
+    context = "Current World State:\n" + "\n".join(facts) if facts else ""
+
+    if get_world_version(server_id) == version:
+        world_context_cache[cache_key] = context
+
+    return context
 
-async def summarize_world_and_update(server_id: str, recent_messages: list):
+async def summarize_world_and_update(server_id: str, recent_messages: list) -> int | None:
+    # Number of facts written, or None if the run failed and should be retried
     if not recent_messages or len(recent_messages) < 10:
-        return
+        return 0
 
     # Take last 30 messages
     snippet = "\n".join([
@@ -1061,51 +1155,175 @@ async def summarize_world_and_update(server_id: str, recent_messages: list):
 
         if cleaned in ["", "no changes", "none", "no updates"]:
             logger.debug(f"[World] No updates for server {server_id}")
-            return
+            return 0
 
         # Parse key:value pairs
-        updates_count = 0
+        updates = []
         for line in response.splitlines():
             match = re.match(r"^\s*([^:]+)\s*:\s*(.+)$", line)
             if match:
                 key, value = match.groups()
                 key_clean = key.strip().lower().replace(" ", "_")
-                await add_world_fact(server_id, key_clean, value.strip())
-                updates_count += 1
+                updates.append((key_clean, value.strip()))
+
+        if not updates:
+            return 0
+
+        # Write all facts from this run in a single transaction
+        async with db_pool.get_connection() as db:
+            for key_clean, value in updates:
+                await add_world_fact(server_id, key_clean, value, db=db)
+            await db.commit()
 
-        if updates_count > 0:
-            logger.info(f"[World Updated] Server {server_id}: {updates_count} facts")
+        invalidate_world_context_cache(server_id)
+
+        logger.info(f"[World Updated] Server {server_id}: {len(updates)} facts")
+        return len(updates)
 
     except Exception as e:
         logger.exception(f"[World Summarizer Error] {e}")
+        return None
+
+def _get_world_stats(server_id: str) -> dict:
+    if server_id not in world_memory_stats:
+        world_memory_stats[server_id] = {
+            "backlog": 0,
+            "last_message": 0.0,
+            "last_run": None,
+            "runs": 0,
+            "failed": 0,
+            "failure_streak": 0,
+            "skipped": 0,
+            "deferred": False
+        }
+    return world_memory_stats[server_id]
 
 def add_to_world_history(server_id: str, author: str, content: str):
-    if server_id not in world_histories:
+    if server_id in world_histories:
+        world_histories.move_to_end(server_id)
+    else:
+        # Evict least recently active server if at capacity
+        if len(world_histories) >= MAX_TRACKED_WORLD_SERVERS:
+            evicted_id, _ = world_histories.popitem(last=False)
+            world_memory_stats.pop(evicted_id, None)
+            world_update_cooldowns.pop(evicted_id, None)
+            logger.debug(f"[World] LRU evicted server {evicted_id}")
         world_histories[server_id] = []
-    world_histories[server_id].append({"author": author, "content": content})
-    if len(world_histories[server_id]) > 50:
-        world_histories[server_id] = world_histories[server_id][-50:]
 
-async def maybe_update_world(server_id: str):    
-    history = world_histories.get(server_id, [])
-    
-    # Need minimum messages
-    if len(history) < WORLD_UPDATE_MESSAGE_THRESHOLD:
+    history = world_histories[server_id]
+    history.append({"author": author, "content": content})
+    if len(history) > MAX_WORLD_HISTORY:
+        del history[:-MAX_WORLD_HISTORY]
+
+    stats = _get_world_stats(server_id)
+    stats["backlog"] += 1
+    stats["last_message"] = time.time()
+
+def clear_world_tracking(server_id: str | None = None):
+    if server_id is None:
+        world_histories.clear()
+        world_update_cooldowns.clear()
+        world_memory_stats.clear()
         return
 
-    now = datetime.datetime.now(datetime.timezone.utc).timestamp()
+    world_histories.pop(server_id, None)
+    world_update_cooldowns.pop(server_id, None)
+    world_memory_stats.pop(server_id, None)
+
+def _is_world_update_due(server_id: str, now: float) -> bool:
+    stats = world_memory_stats.get(server_id)
+    if not stats or server_id in world_update_in_progress:
+        return False
+
+    # Need enough new messages since the last run
+    if stats["backlog"] < WORLD_UPDATE_MESSAGE_THRESHOLD:
+        return False
+
+    # Debounce: wait for the conversation to settle
+    if now - stats["last_message"] < WORLD_UPDATE_DEBOUNCE:
+        return False
+
+    # Check cooldown, doubled per consecutive failure (count each blocked burst once)
+    cooldown = min(WORLD_UPDATE_COOLDOWN * 2 ** max(0, stats["failure_streak"] - 1), WORLD_UPDATE_MAX_BACKOFF)
     last_update = world_update_cooldowns.get(server_id, 0)
+    if now - last_update < cooldown:
+        if not stats["deferred"]:
+            stats["skipped"] += 1
+            stats["deferred"] = True
+        return False
+
+    return True
 
-    # Check cooldown
-    if now - last_update < WORLD_UPDATE_COOLDOWN:
+async def maybe_update_world(server_id: str):
+    if not _is_world_update_due(server_id, time.time()):
         return
 
-    # Perform update
-    await summarize_world_and_update(server_id, history)
+    history = list(world_histories.get(server_id, []))
+    stats = _get_world_stats(server_id)
+
+    backlog = stats["backlog"]
+
+    world_update_in_progress.add(server_id)
+    try:
+        # Perform update in the background lane so replies are never delayed
+        facts = await llm_lane.run_background(summarize_world_and_update, server_id, history)
+    except Exception as e:
+        logger.error(f"[World] Update failed for server {server_id}: {e}")
+        facts = None
+    finally:
+        world_update_in_progress.discard(server_id)
+
+    now = time.time()
     world_update_cooldowns[server_id] = now
-    
-    # Keep some history for context
-    world_histories[server_id] = world_histories[server_id][-10:]
+
+    if facts is None:
+        # Keep the backlog for the retry, but back off so a failing summarizer
+        # isn't hit again on every worker pass
+        stats["failed"] += 1
+        stats["failure_streak"] += 1
+        stats["deferred"] = True
+        return
+
+    stats["failure_streak"] = 0
+    stats["last_run"] = now
+    stats["runs"] += 1
+    stats["backlog"] = max(0, stats["backlog"] - backlog)  # Messages that arrived mid-run still count
+    stats["deferred"] = False
+
+    # Drop only what was summarized, keeping its last 10 messages for context
+    live = world_histories.get(server_id)
+    if live is not None:
+        del live[:max(0, len(history) - 10)]
+
+async def world_memory_worker():
+    while True:
+        await asyncio.sleep(WORLD_WORKER_INTERVAL)
+
+        try:
+            now = time.time()
+            due = [sid for sid in list(world_histories.keys()) if _is_world_update_due(sid, now)]
+
+            for server_id in due:
+                await maybe_update_world(server_id)
+
+        except Exception as e:
+            logger.exception(f"[World Worker Error] {e}")
+
+def get_world_memory_stats() -> dict:
+    return {
+        "tracked_servers": len(world_histories),
+        "max_servers": MAX_TRACKED_WORLD_SERVERS,
+        "in_progress": len(world_update_in_progress),
+        "servers": {
+            server_id: {
+                "backlog": stats["backlog"],
+                "last_run": stats["last_run"],
+                "runs": stats["runs"],
+                "skipped": stats["skipped"]
+            }
+            for server_id, stats in world_memory_stats.items()
+        }
+    }
 
 async def delete_world_entry(server_id: str, key: str):
     async with db_pool.get_connection() as db:
@@ -1115,11 +1333,15 @@ async def delete_world_entry(server_id: str, key: str):
         )
         await db.commit()
 
+    invalidate_world_context_cache(server_id)
+
 async def delete_world_context(server_id: str):
     async with db_pool.get_connection() as db:
         await db.execute("DELETE FROM world_state WHERE server_id = ?", (server_id,))
         await db.commit()
 
+    invalidate_world_context_cache(server_id)
+
 async def list_world_facts(server_id: str) -> list:    
     async with db_pool.get_connection() as db:
         async with db.execute("""
@@ -1,5 +1,38 @@
+from functools import lru_cache
+
+CONVERSATION_TYPES = ("question", "emotional", "roleplay", "request", "creative", "casual")
+
+# User-note keywords mapped to trait flags, in the order their hints are emitted
+NOTE_TRAIT_KEYWORDS = (
+    ("technical", ("technical", "developer")),
+    ("humor", ("humor", "jokes")),
+    ("concise", ("concise", "short")),
+)
+
+@lru_cache(maxsize=1024)
+def extract_note_traits(user_notes: str) -> frozenset:
+    if not user_notes:
+        return frozenset()
+
+    notes_lower = user_notes.lower()
+    return frozenset(
+        trait for trait, keywords in NOTE_TRAIT_KEYWORDS
+        if any(keyword in notes_lower for keyword in keywords)
+    )
+
 class ChopperbotPersonality:
+    # Compiled once at construction; instances are shared and read-only
+    __slots__ = (
+        "name", "prompt", "temperature", "formality", "verbosity", "emotional_range",
+        "creativity", "max_tokens_preferred", "repetition_penalty", "can_use_slang",
+        "can_be_edgy", "bypass_context_adaptation", "can_search_web",
+        "_context_hints", "_adapted_prompts", "_generation_params", "_trait_hints", "_frozen"
+    )
+
     def __init__(self, name: str, prompt: str, **kwargs):
+        set_attr = object.__setattr__
+        set_attr(self, "_frozen", False)
+
         self.name = name
         self.prompt = prompt
         self.temperature = kwargs.get('temperature', 0.8)
@@ -15,48 +48,55 @@ class ChopperbotPersonality:
         self.can_be_edgy = kwargs.get('can_be_edgy', True)
         self.bypass_context_adaptation = kwargs.get('bypass_context_adaptation', False)
         self.can_search_web = kwargs.get('can_search_web', False)
-    
-    def get_base_prompt(self) -> str:
-        return self.prompt
-    
-    def adapt_for_context(self, conversation_type: str, user_notes: str = None) -> str:
-        adapted_prompt = self.prompt
-
-        # Add context-specific instructions
-        if not self.bypass_context_adaptation:
-            if conversation_type == "question":
-                if self.verbosity < 0.5:
-                    adapted_prompt += "\n\nKeep your answer brief and to the point."
-                else:
-                    adapted_prompt += "\n\nProvide a thorough answer with details."
-            
-            elif conversation_type == "emotional":
-                if self.emotional_range > 0.5:
-                    adapted_prompt += "\n\nBe empathetic and supportive in this conversation."
-                else:
-                    adapted_prompt += "\n\nAcknowledge their feelings but stay grounded and practical."
-            
-            elif conversation_type == "roleplay":
-                adapted_prompt += "\n\nEngage naturally with the roleplay scenario."
+
+        self._compile()
+        set_attr(self, "_frozen", True)
+
+    def __setattr__(self, key, value):
+        if self._frozen:
+            raise AttributeError(f"Personality '{self.name}' is read-only")
+        object.__setattr__(self, key, value)
+
+    def _compile(self):
+        self._context_hints = {
+            conversation_type: self._build_context_hint(conversation_type)
+            for conversation_type in CONVERSATION_TYPES
+        }
+        self._adapted_prompts = {
+            conversation_type: f"{self.prompt}\n\n{hint}" if hint else self.prompt
+            for conversation_type, hint in self._context_hints.items()
+        }
+        self._generation_params = {
+            conversation_type: self._build_generation_params(conversation_type)
+            for conversation_type in CONVERSATION_TYPES
+        }
+        self._trait_hints = {
+            "technical": "\nThis user appreciates technical accuracy.",
+            "humor": "\nThis user enjoys your edgy humor." if self.can_be_edgy else "",
+            "concise": "\nThis user prefers shorter responses.",
+        }
+
+    def _build_context_hint(self, conversation_type: str) -> str:
+        if self.bypass_context_adaptation:
+            return ""
+
+        # Context-specific instructions
+        if conversation_type == "question":
+            if self.verbosity < 0.5:
+                return "Keep your answer brief and to the point."
+            return "Provide a thorough answer with details."
         
-        # Add user-specific adaptations
-        if user_notes:
-            adapted_prompt += f"\n\nNote about this user: {user_notes}"
-            
-            # Smart adaptations based on user preferences
-            if "technical" in user_notes.lower() or "developer" in user_notes.lower():
-                adapted_prompt += "\nThis user appreciates technical accuracy."
-            
-            if "humor" in user_notes.lower() or "jokes" in user_notes.lower():
-                if self.can_be_edgy:
-                    adapted_prompt += "\nThis user enjoys your edgy humor."
-            
-            if "concise" in user_notes.lower() or "short" in user_notes.lower():
-                adapted_prompt += "\nThis user prefers shorter responses."
+        elif conversation_type == "emotional":
+            if self.emotional_range > 0.5:
+                return "Be empathetic and supportive in this conversation."
+            return "Acknowledge their feelings but stay grounded and practical."
         
-        return adapted_prompt
-    
-    def get_generation_params(self, conversation_type: str = "casual") -> dict:
+        elif conversation_type == "roleplay":
+            return "Engage naturally with the roleplay scenario."
+
+        return ""
+
+    def _build_generation_params(self, conversation_type: str) -> dict:
         params = {
             "temperature": self.temperature,
             "repetition_penalty": self.repetition_penalty,
@@ -75,6 +115,38 @@ class ChopperbotPersonality:
             params["max_tokens"] = 450
         
         return params
+    
+    def get_base_prompt(self) -> str:
+        return self.prompt
+    
+    def get_context_hint(self, conversation_type: str) -> str:
+        return self._context_hints.get(conversation_type, "")
+    
+    def get_user_note_prompt(self, user_notes: str = None) -> str:
+        if not user_notes:
+            return ""
+
+        # Trait flags are memoized per notes text (warmed when notes are saved)
+        traits = extract_note_traits(user_notes)
+        return f"Note about this user: {user_notes}" + "".join(
+            self._trait_hints[trait] for trait, _ in NOTE_TRAIT_KEYWORDS if trait in traits
+        )
+    
+    def adapt_for_context(self, conversation_type: str, user_notes: str = None) -> str:
+        adapted_prompt = self._adapted_prompts.get(conversation_type, self.prompt)
+
+        note_prompt = self.get_user_note_prompt(user_notes)
+        if note_prompt:
+            return f"{adapted_prompt}\n\n{note_prompt}"
+        
+        return adapted_prompt
+    
+    def get_generation_params(self, conversation_type: str = "casual") -> dict:
+        # Copy so callers can adjust temperature on retries
+        params = self._generation_params.get(conversation_type)
+        if params is None:
+            params = self._generation_params["casual"]
+        return dict(params)
 
 
 # Your original personalities, now enhanced
@@ -188,6 +260,7 @@ Remember: You're the architect of adventure. Make every choice feel meaningful,
 # CUSTOM PERSONALITIES
 # ============================================================================
 
+@lru_cache(maxsize=128)
 def custom_personalities(character: str) -> ChopperbotPersonality:
     prompt = f"""Fully embody {character}. Respond exactly as {character} would, using their voice, tone, mannerisms, and worldview. 
 Do not reveal you are an AI, break character, or provide out-of-role explanations. 
@@ -1,7 +1,9 @@
 from typing import List, Dict, Optional
-from src.utils.personality_manager import get_server_personality
+from src.personalities import ChopperbotPersonality
+from src.utils.personality_manager import get_server_personality, resolve_server_personality
 from src.moderation.database import get_user_log_cached, build_context as db_build_context
-from src.utils.history_util import trim_history
+from src.utils.prompt_layout import build_layout, prefix_tracker
+from src.utils.perf_trace import span
 
 async def build_message_context(
     history: List[Dict],
@@ -9,35 +11,45 @@ async def build_message_context(
     user_name: str,
     server_id: Optional[str],
     conversation_type: str,
-    max_tokens: int = 2000
+    max_tokens: int = 2000,
+    channel_key: Optional[str] = None,
+    personality: Optional[ChopperbotPersonality] = None
 ) -> List[Dict]:
     # Get user notes for personalization
-    user_log = await get_user_log_cached(user_id)
+    with span("user_log"):
+        user_log = await get_user_log_cached(user_id)
     user_notes = user_log[4] if user_log and user_log[4] else None
 
-    personality = await get_server_personality(server_id)
-    
-    # Build system prompt with context awareness
-    system_content = personality.adapt_for_context(conversation_type, user_notes)
-    
-    messages = [{"role": "system", "content": system_content}]
-    
-    # Add personality notes and world context from database
-    context_msgs = await db_build_context(user_id, user_name, server_id)
-    if context_msgs:
-        messages.extend(context_msgs)
-    
-    # Add conversation history
-    messages.extend(history)
-    
-    # Trim to token limit
-    return trim_history(messages, max_tokens=max_tokens)
+    if personality is None:
+        personality = resolve_server_personality(server_id)
+    
+    # World context from database
+    with span("world_context"):
+        context_msgs = await db_build_context(user_id, user_name, server_id)
+    
+    # Stable segments first so the prompt prefix is reusable across requests
+    with span("prompt_layout"):
+        messages = build_layout(
+            personality,
+            conversation_type,
+            history,
+            world_msgs=context_msgs,
+            user_notes=user_notes,
+            max_tokens=max_tokens
+        )
+
+    if channel_key:
+        prefix_tracker.record(channel_key, messages)
+
+    return messages
 
 async def build_dm_context(
     history: List[Dict],
     user_id: str,
     user_name: str,
-    conversation_type: str
+    conversation_type: str,
+    channel_key: Optional[str] = None,
+    personality: Optional[ChopperbotPersonality] = None
 ) -> List[Dict]:
     return await build_message_context(
         history=history,
@@ -45,7 +57,9 @@ async def build_dm_context(
         user_name=user_name,
         server_id=None,  # No server context for DMs
         conversation_type=conversation_type,
-        max_tokens=2000
+        max_tokens=2000,
+        channel_key=channel_key,
+        personality=personality
     )
 
 async def build_server_context(
@@ -53,7 +67,9 @@ async def build_server_context(
     user_id: str,
     user_name: str,
     server_id: str,
-    conversation_type: str
+    conversation_type: str,
+    channel_key: Optional[str] = None,
+    personality: Optional[ChopperbotPersonality] = None
 ) -> List[Dict]:
     return await build_message_context(
         history=history,
@@ -61,7 +77,9 @@ async def build_server_context(
         user_name=user_name,
         server_id=server_id,
         conversation_type=conversation_type,
-        max_tokens=2000
+        max_tokens=2000,
+        channel_key=channel_key,
+        personality=personality
     )
 
 def format_user_message(
@@ -131,33 +149,34 @@ async def build_hierarchical_context(
 
     personality = await get_server_personality(server_id)
     
-    # Build system prompt with context awareness
-    system_content = personality.adapt_for_context(conversation_type, user_notes)
-    
-    messages = [{"role": "system", "content": system_content}]
-    
-    # Add personality and world context
+    # Add world context
     context_msgs = await db_build_context(user_id, user_name, server_id)
-    if context_msgs:
-        messages.extend(context_msgs)
     
     # Check if we should compress history
     if should_compress_history(history):
         older, recent = get_recent_and_older_history(history)
         
+        compressed = []
+        
         # Add summary of older conversation
         if older:
             summary = create_history_summary(older)
-            messages.append({
+            compressed.append({
                 "role": "system",
                 "content": f"Previous conversation context: {summary}"
             })
         
         # Add recent messages in full
-        messages.extend(recent)
+        compressed.extend(recent)
     else:
         # All messages are recent enough
-        messages.extend(history)
-    
-    # Final trim to token limit
-    return trim_history(messages, max_tokens=2000)
\ No newline at end of file
+        compressed = history
+    
+    return build_layout(
+        personality,
+        conversation_type,
+        compressed,
+        world_msgs=context_msgs,
+        user_notes=user_notes,
+        max_tokens=2000
+    )
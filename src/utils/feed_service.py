@@ -0,0 +1,341 @@
+import aiohttp
+import asyncio
+import hashlib
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from typing import Optional, List, Dict, Set
+from src.utils.news_sources import NEWS_SOURCES, FINANCE_SOURCES
+from src.utils.koboldcpp_util import llm_lane
+from src.utils.personality_manager import resolve_server_personality
+from src.utils.response_generator import generate_command_response
+from src.moderation.logging import logger
+
+# Feed refresh configuration
+NEWS_REFRESH_SECONDS = 600      # Matches the old 10 minute /news cache
+FINANCE_REFRESH_SECONDS = 300   # Matches the old 5 minute /finance cache
+FEED_TIMEOUT_SECONDS = 10
+FEED_CHUNK_SIZE = 8192
+MAX_FEED_ITEMS = 5
+SUMMARY_DEMAND_WINDOW = 6 * 3600  # Pre-generate variants requested in the last 6 hours
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+def _parse_pub_date(pub_date_str: str) -> Optional[datetime]:
+    if not pub_date_str:
+        return None
+    try:
+        return datetime.strptime(pub_date_str, "%a, %d %b %Y %H:%M:%S %Z")
+    except ValueError:
+        try:
+            # Alternative format with numeric timezone
+            return datetime.strptime(pub_date_str, "%a, %d %b %Y %H:%M:%S %z")
+        except ValueError:
+            return None
+
+def _item_to_article(item: ET.Element) -> Optional[Dict]:
+    # Plain RSS elements win over namespaced extras like <media:title> or an
+    # empty <media:description/>; those only fill fields the item lacks
+    fields, extras = {}, {}
+    for child in item:
+        text = (child.text or "").strip()
+        if child.tag.startswith("{"):
+            if text:
+                extras.setdefault(_local_name(child.tag), text)
+        else:
+            fields.setdefault(child.tag, text)
+    fields = {**extras, **fields}
+
+    title = fields.get("title", "")
+    if not title:
+        return None
+
+    return {
+        "title": title,
+        "link": fields.get("link") or "#",
+        "description": fields.get("description", ""),
+        "pub_date": _parse_pub_date(fields.get("pubDate", ""))
+    }
+
+class RSSItemParser:
+    def __init__(self, max_items: int = MAX_FEED_ITEMS):
+        # Incremental parser: stops collecting once max_items items are seen
+        self.max_items = max_items
+        self.articles: List[Dict] = []
+        self._parser = ET.XMLPullParser(events=("end",))
+
+    @property
+    def done(self) -> bool:
+        return len(self.articles) >= self.max_items
+
+    def feed(self, chunk: bytes | str):
+        self._parser.feed(chunk)
+        for _, element in self._parser.read_events():
+            if _local_name(element.tag) != "item":
+                continue
+
+            article = _item_to_article(element)
+            element.clear()
+
+            if article:
+                self.articles.append(article)
+                if self.done:
+                    return
+
+def parse_rss_items(xml_text: str, source: str, max_items: int = MAX_FEED_ITEMS) -> Optional[List[Dict]]:
+    parser = RSSItemParser(max_items)
+    try:
+        parser.feed(xml_text)
+    except ET.ParseError as e:
+        if not parser.articles:
+            logger.error(f"XML parse error for {source.upper()}: {str(e)}")
+            return None
+    return parser.articles
+
+def headline_hash(articles: List[Dict]) -> str:
+    return hashlib.sha1("\n".join(a["title"] for a in articles).encode("utf-8")).hexdigest()
+
+class FeedSummarizer:
+    __slots__ = ("kind", "build_prompt", "use_personality", "temperature", "max_tokens")
+
+    def __init__(self, kind: str, build_prompt, use_personality: bool = True, temperature: float = 0.8, max_tokens: int = 300):
+        self.kind = kind
+        self.build_prompt = build_prompt  # (headlines: List[str]) -> str
+        self.use_personality = use_personality
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+
+class FeedEntry:
+    __slots__ = (
+        "articles", "etag", "last_modified", "refreshed_at", "changed_at",
+        "not_modified_count", "error", "headline_hash", "summaries", "summary_demand"
+    )
+
+    def __init__(self):
+        self.articles: Optional[List[Dict]] = None
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.refreshed_at = 0.0
+        self.changed_at = 0.0
+        self.not_modified_count = 0
+        self.error: Optional[str] = None
+        self.headline_hash: Optional[str] = None
+        self.summaries: Dict[tuple, tuple[str, str]] = {}  # {(kind, personality_name): (headline_hash, text)}
+        self.summary_demand: Dict[tuple, tuple] = {}  # {(kind, personality_name): (personality, last_requested)}
+
+class FeedService:
+    def __init__(self, name: str, sources: Dict[str, str], refresh_seconds: float, max_items: int = MAX_FEED_ITEMS):
+        self.name = name
+        self.sources = sources
+        self.refresh_seconds = refresh_seconds
+        self.max_items = max_items
+        self.entries: Dict[str, FeedEntry] = {key: FeedEntry() for key in sources}
+        self.summarizers: Dict[str, FeedSummarizer] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._pregen_tasks: Set[asyncio.Task] = set()  # Strong refs so running tasks aren't collected
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=FEED_TIMEOUT_SECONDS)
+            )
+        return self._session
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+    async def _fetch(self, key: str) -> bool:
+        entry = self.entries[key]
+        url = self.sources[key]
+
+        # Conditional GET: the server answers 304 when the feed hasn't changed
+        headers = {}
+        if entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+
+        try:
+            async with self._get_session().get(url, headers=headers) as resp:
+                if resp.status == 304 and entry.articles is not None:
+                    entry.refreshed_at = time.time()
+                    entry.not_modified_count += 1
+                    entry.error = None
+                    return True
+
+                if resp.status != 200:
+                    entry.error = f"HTTP {resp.status}"
+                    logger.error(f"Failed to fetch {self.name} feed from {key.upper()}. (HTTP {resp.status})")
+                    return False
+
+                # Parse while streaming and stop reading once we have enough items
+                parser = RSSItemParser(self.max_items)
+                try:
+                    async for chunk in resp.content.iter_chunked(FEED_CHUNK_SIZE):
+                        parser.feed(chunk)
+                        if parser.done:
+                            break
+                except ET.ParseError as e:
+                    if not parser.articles:
+                        entry.error = "Parse error"
+                        logger.error(f"XML parse error for {key.upper()}: {str(e)}")
+                        return False
+
+                entry.articles = parser.articles
+                entry.etag = resp.headers.get("ETag")
+                entry.last_modified = resp.headers.get("Last-Modified")
+                entry.refreshed_at = entry.changed_at = time.time()
+                entry.error = None
+
+                # New headline set: summaries for the old one are stale
+                new_hash = headline_hash(entry.articles)
+                if new_hash != entry.headline_hash:
+                    entry.headline_hash = new_hash
+                    if self.summarizers and entry.articles:
+                        task = asyncio.create_task(self._pregenerate_summaries(key))
+                        self._pregen_tasks.add(task)
+                        task.add_done_callback(self._pregen_tasks.discard)
+                return True
+
+        except aiohttp.ClientError as e:
+            entry.error = "Network error"
+            logger.error(f"Network error fetching from {key.upper()}: {str(e)}")
+        except asyncio.TimeoutError:
+            entry.error = "Timeout"
+            logger.error(f"Timeout error fetching from {key.upper()}")
+        except Exception as e:
+            entry.error = "Unexpected error"
+            logger.error(f"Unexpected error fetching from {key.upper()}: {str(e)}")
+        return False
+
+    async def refresh(self, key: str) -> bool:
+        # Coalesce concurrent refreshes of the same feed
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def refresh_all(self):
+        results = await asyncio.gather(
+            *(self.refresh(key) for key in self.sources),
+            return_exceptions=True
+        )
+        ok = sum(1 for r in results if r is True)
+        logger.debug(f"[Feeds] Refreshed {ok}/{len(results)} {self.name} feeds")
+
+    async def get_articles(self, key: str) -> Optional[List[Dict]]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        # Only the very first request before the prefetcher has run pays a fetch
+        if entry.articles is None:
+            await self.refresh(key)
+
+        return entry.articles
+
+    # ------------------------------------------------------------------------
+    # Headline summaries
+    # ------------------------------------------------------------------------
+
+    def register_summarizer(self, kind: str, build_prompt, **kwargs):
+        self.summarizers[kind] = FeedSummarizer(kind, build_prompt, **kwargs)
+
+    def _variant_key(self, kind: str, personality) -> tuple:
+        use_personality = self.summarizers[kind].use_personality
+        return (kind, personality.name if use_personality and personality else None)
+
+    def get_summary(self, key: str, kind: str, personality=None) -> Optional[str]:
+        entry = self.entries.get(key)
+        if entry is None or kind not in self.summarizers:
+            return None
+
+        variant = self._variant_key(kind, personality)
+        entry.summary_demand[variant] = (personality, time.time())
+
+        cached = entry.summaries.get(variant)
+        if cached and cached[0] == entry.headline_hash:
+            return cached[1]
+        return None
+
+    async def generate_summary(self, key: str, kind: str, personality=None) -> str:
+        entry = self.entries[key]
+        summarizer = self.summarizers[kind]
+        articles = entry.articles or []
+        current_hash = entry.headline_hash
+
+        summary = await generate_command_response(
+            prompt=summarizer.build_prompt([a["title"] for a in articles]),
+            use_personality=summarizer.use_personality,
+            temperature=summarizer.temperature,
+            max_tokens=summarizer.max_tokens,
+            personality=personality
+        )
+
+        # Only store if the headlines didn't change while generating
+        if entry.headline_hash == current_hash:
+            entry.summaries[self._variant_key(kind, personality)] = (current_hash, summary)
+        return summary
+
+    async def _pregenerate_summaries(self, key: str):
+        entry = self.entries[key]
+        now = time.time()
+
+        # Drop variants nobody asked for recently
+        entry.summary_demand = {
+            variant: demand for variant, demand in entry.summary_demand.items()
+            if now - demand[1] < SUMMARY_DEMAND_WINDOW
+        }
+        entry.summaries = {
+            variant: cached for variant, cached in entry.summaries.items()
+            if cached[0] == entry.headline_hash
+        }
+
+        variants = {variant: demand[0] for variant, demand in entry.summary_demand.items()}
+
+        # Always keep the default voice warm for personality-based summaries
+        default = resolve_server_personality(None)
+        for kind, summarizer in self.summarizers.items():
+            if summarizer.use_personality:
+                variants.setdefault(self._variant_key(kind, default), default)
+
+        for (kind, _), personality in variants.items():
+            if kind not in self.summarizers:
+                continue
+            try:
+                await llm_lane.run_background(self.generate_summary, key, kind, personality)
+            except Exception as e:
+                logger.debug(f"[Feeds] Summary pre-generation failed for {key}/{kind}: {e}")
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh_all()
+            except Exception as e:
+                logger.exception(f"[Feeds] {self.name} refresh error: {e}")
+            await asyncio.sleep(self.refresh_seconds)
+
+    def get_stats(self) -> dict:
+        now = time.time()
+        return {
+            key: {
+                "articles": len(entry.articles) if entry.articles else 0,
+                "age_seconds": round(now - entry.refreshed_at) if entry.refreshed_at else None,
+                "not_modified": entry.not_modified_count,
+                "summaries": len(entry.summaries),
+                "error": entry.error
+            }
+            for key, entry in self.entries.items()
+        }
+
+# Global feed services
+news_feeds = FeedService("news", NEWS_SOURCES, NEWS_REFRESH_SECONDS)
+finance_feeds = FeedService("finance", FINANCE_SOURCES, FINANCE_REFRESH_SECONDS)
+
+async def run_feed_prefetcher():
+    await asyncio.gather(news_feeds.run(), finance_feeds.run())
@@ -0,0 +1,115 @@
+from collections import OrderedDict
+from typing import List, Dict, Optional
+from src.utils.history_util import count_tokens
+from src.utils.metrics import llm_tokens
+
+# ============================================================================
+# GENERATION CONTROLLER
+# ============================================================================
+# Replies are cut at the first line where the model starts speaking for
+# someone else, so every token after that is wasted. Stop sequences built
+# from the people actually in the conversation end generation right there,
+# and max_tokens follows how long replies in the channel really are.
+
+BASE_STOP_SEQUENCES = ["\nUser:", "\nSystem:", "\nAssistant:", "\nMe:", "\nYou:", "\n\n\n"]
+MAX_PARTICIPANT_STOPS = 10
+
+# Ceiling per conversation type; the personality's own max_tokens still applies
+TYPE_TOKEN_BUDGETS = {
+    "casual": 200,
+    "emotional": 300,
+    "request": 350,
+    "question": 300,
+    "roleplay": 450,
+    "creative": 450
+}
+MIN_TOKEN_BUDGET = 64
+BUDGET_HEADROOM = 3.0        # Room above the channel's typical reply length
+LENGTH_SMOOTHING = 0.3       # Weight of the newest reply in the running average
+MAX_TRACKED_CHANNELS = 500
+
+def participant_stop_sequences(messages: List[Dict]) -> List[str]:
+    # Most recent speakers first, so the cap keeps the ones likely to be imitated
+    stops = list(BASE_STOP_SEQUENCES)
+    seen = set()
+    for message in reversed(messages):
+        name = message.get("name") if message.get("role") == "user" else None
+        if name and name not in seen:
+            seen.add(name)
+            stops.append(f"\n{name}:")
+            if len(seen) >= MAX_PARTICIPANT_STOPS:
+                break
+    return stops
+
+class GenerationController:
+    def __init__(self, max_channels: int = MAX_TRACKED_CHANNELS):
+        self.max_channels = max_channels
+        self._reply_lengths: "OrderedDict[str, float]" = OrderedDict()  # {channel_key: avg kept tokens}
+        self.stats: Dict[str, Dict[str, int]] = {}  # {personality: counters}
+
+    def token_budget(self, conversation_type: str, channel_key: Optional[str], personality_max: int) -> int:
+        ceiling = min(TYPE_TOKEN_BUDGETS.get(conversation_type, personality_max), personality_max)
+
+        # Short-reply channels get a tighter budget, but never under half the
+        # ceiling so an unusually long answer still has room to finish
+        typical = self._reply_lengths.get(channel_key) if channel_key else None
+        budget = ceiling if typical is None else min(ceiling, max(ceiling // 2, int(typical * BUDGET_HEADROOM)))
+        return max(MIN_TOKEN_BUDGET, budget)
+
+    def apply(
+        self,
+        params: Dict,
+        messages: List[Dict],
+        conversation_type: str,
+        channel_key: Optional[str] = None,
+        adapt_budget: bool = True
+    ) -> Dict:
+        # Personalities that bypass context adaptation (DungeonMaster scenes)
+        # keep their own max_tokens; they only get the stop sequences
+        if adapt_budget:
+            params["max_tokens"] = self.token_budget(conversation_type, channel_key, params.get("max_tokens", 400))
+        params["stop"] = participant_stop_sequences(messages)
+        return params
+
+    def record(self, personality_name: str, channel_key: Optional[str], generated: int, kept_text: str, truncated: bool):
+        kept = count_tokens(kept_text)
+
+        stats = self.stats.setdefault(personality_name, {"replies": 0, "generated": 0, "kept": 0, "truncated": 0})
+        stats["replies"] += 1
+        stats["generated"] += generated
+        stats["kept"] += kept
+        stats["truncated"] += truncated
+        llm_tokens.inc(generated, type="generated")
+        llm_tokens.inc(kept, type="kept")
+
+        if not channel_key:
+            return
+
+        # A reply cut off by the budget was longer than it looks; let the average grow
+        sample = kept * BUDGET_HEADROOM if truncated else kept
+        previous = self._reply_lengths.get(channel_key)
+        if previous is None:
+            if len(self._reply_lengths) >= self.max_channels:
+                self._reply_lengths.popitem(last=False)
+            self._reply_lengths[channel_key] = float(sample)
+        else:
+            self._reply_lengths.move_to_end(channel_key)
+            self._reply_lengths[channel_key] = previous + LENGTH_SMOOTHING * (sample - previous)
+
+    def get_stats(self) -> dict:
+        generated = sum(s["generated"] for s in self.stats.values())
+        kept = sum(s["kept"] for s in self.stats.values())
+        return {
+            "generated": generated,
+            "kept": kept,
+            "kept_ratio": kept / generated if generated else 0.0,
+            "truncated": sum(s["truncated"] for s in self.stats.values()),
+            "tracked_channels": len(self._reply_lengths),
+            "personalities": {
+                name: dict(s, kept_ratio=s["kept"] / s["generated"] if s["generated"] else 0.0)
+                for name, s in self.stats.items()
+            }
+        }
+
+# Global generation controller
+generation_controller = GenerationController()
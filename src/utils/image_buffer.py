@@ -0,0 +1,186 @@
+import io
+import re
+import base64
+import binascii
+from typing import Optional, List
+from discord import File
+from src.utils.image_executor import run_image_task
+
+# ============================================================================
+# IMAGE BUFFER
+# ============================================================================
+class MemoryViewStream(io.RawIOBase):
+    def __init__(self, buffer):
+        # Read-only file object over an existing buffer: no copy of the image bytes
+        self._view = memoryview(buffer).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = min(len(b), len(self._view) - self._pos)
+        if n <= 0:
+            return 0
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        else:
+            self._pos = len(self._view) + offset
+        self._pos = max(0, self._pos)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+class ImageBuffer:
+    __slots__ = ("_data", "_base64")
+
+    def __init__(self, data=None, base64_str: Optional[str] = None):
+        # Raw bytes and base64 are each produced at most once, on first use
+        self._data = data
+        self._base64 = base64_str
+
+    @classmethod
+    def from_bytes(cls, data) -> "ImageBuffer":
+        return cls(data=data)
+
+    @classmethod
+    def from_base64(cls, base64_str: str) -> "ImageBuffer":
+        return cls(base64_str=base64_str)
+
+    @property
+    def view(self) -> memoryview:
+        if self._data is None:
+            self._data = base64.b64decode(self._base64)
+        return memoryview(self._data)
+
+    @property
+    def base64(self) -> str:
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self._data).decode("ascii")
+        return self._base64
+
+    async def get_base64(self) -> str:
+        # Large encodes happen on the image workers
+        if self._base64 is None:
+            self._base64 = await run_image_task(lambda: self.base64)
+        return self._base64
+
+    def __len__(self) -> int:
+        return len(self.view)
+
+    def open(self) -> MemoryViewStream:
+        return MemoryViewStream(self.view)
+
+    def to_file(self, filename: str = "generated.png") -> File:
+        return File(self.open(), filename=filename)
+
+# ============================================================================
+# STREAMING RESPONSE DECODING
+# ============================================================================
+_IMAGES_KEY = re.compile(rb'"images"\s*:\s*\[')
+_KEY_OVERLAP = 32  # Bytes kept between chunks so the key can't be split
+
+# JSON escapes that can appear inside a base64 string: "\/" for "/", line
+# wrapping written as "\n", and the occasional "\u002F"
+_JSON_ESCAPE = re.compile(rb'\\(u[0-9a-fA-F]{4}|.)', re.S)
+_PARTIAL_ESCAPE = re.compile(rb'\\(?:u[0-9a-fA-F]{0,3})?$')  # Escape cut off at a chunk boundary
+_WHITESPACE_ESCAPES = frozenset(b"nrtbf")
+
+def _unescape(match) -> bytes:
+    code = match.group(1)
+    if code[0] == ord("u"):
+        return chr(int(code[1:], 16)).encode("utf-8")
+    if code[0] in _WHITESPACE_ESCAPES:
+        return b""
+    return code
+
+class StreamingImageDecoder:
+    def __init__(self):
+        # Pulls the base64 strings out of {"images": [...]} and decodes them
+        # chunk by chunk, so the full JSON text is never held in memory.
+        self.images: List[bytearray] = []
+        self._state = "key"
+        self._pending = bytearray()
+        self._tail = b""
+        self._escape_tail = b""
+
+    @property
+    def done(self) -> bool:
+        return self._state == "done"
+
+    def _decode(self, segment):
+        if self._escape_tail or b"\\" in segment:
+            segment = self._escape_tail + bytes(segment)
+            partial = _PARTIAL_ESCAPE.search(segment)
+            self._escape_tail = segment[partial.start():] if partial else b""
+            segment = _JSON_ESCAPE.sub(_unescape, segment[:partial.start()] if partial else segment)
+        data = self._tail + segment
+        usable = len(data) - len(data) % 4
+        if usable:
+            self.images[-1] += binascii.a2b_base64(data[:usable])
+        self._tail = bytes(data[usable:])
+
+    def feed(self, chunk: bytes):
+        if self._state == "done":
+            return
+        self._pending += chunk
+        pending = self._pending
+
+        while True:
+            if self._state == "key":
+                match = _IMAGES_KEY.search(pending)
+                if not match:
+                    del pending[:-_KEY_OVERLAP]
+                    return
+                del pending[:match.end()]
+                self._state = "array"
+
+            elif self._state == "array":
+                i = 0
+                while i < len(pending) and pending[i] in b" \t\r\n,":
+                    i += 1
+                del pending[:i]
+                if not pending:
+                    return
+                if pending[0] == ord("]"):
+                    self._state = "done"
+                    pending.clear()
+                    return
+                if pending[0] != ord('"'):
+                    raise ValueError("Unexpected token in images array")
+                del pending[:1]
+                self.images.append(bytearray())
+                self._tail = b""
+                self._escape_tail = b""
+                self._state = "string"
+
+            else:  # inside a base64 string
+                end = pending.find(b'"')
+                if end < 0:
+                    self._decode(pending)
+                    pending.clear()
+                    return
+                self._decode(pending[:end])
+                if self._tail or self._escape_tail:
+                    raise binascii.Error("Truncated base64 image data")
+                del pending[:end + 1]
+                self._state = "array"
+
+async def read_image_response(resp, chunk_size: int = 65536) -> List[ImageBuffer]:
+    decoder = StreamingImageDecoder()
+    async for chunk in resp.content.iter_chunked(chunk_size):
+        decoder.feed(chunk)
+        if decoder.done:
+            break
+    return [ImageBuffer.from_bytes(image) for image in decoder.images if image]
@@ -0,0 +1,47 @@
+import os
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Pillow, zlib and hashlib release the GIL for the heavy lifting, so threads are
+# enough and avoid pickling multi-megabyte buffers into a process pool.
+IMAGE_WORKERS = min(4, os.cpu_count() or 1)
+IMAGE_QUEUE_LIMIT = 16  # Jobs admitted at once; further callers wait their turn
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="image-worker")
+_slots = asyncio.Semaphore(IMAGE_QUEUE_LIMIT)
+
+image_executor_stats = {
+    "jobs": 0,
+    "waiting": 0,
+    "total_ms": 0.0,
+    "max_ms": 0.0
+}
+
+async def run_image_task(func, *args, **kwargs):
+    image_executor_stats["waiting"] += 1
+    try:
+        await _slots.acquire()
+    finally:
+        image_executor_stats["waiting"] -= 1
+
+    start = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, partial(func, *args, **kwargs))
+    finally:
+        _slots.release()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        image_executor_stats["jobs"] += 1
+        image_executor_stats["total_ms"] += elapsed_ms
+        image_executor_stats["max_ms"] = max(image_executor_stats["max_ms"], elapsed_ms)
+
+def get_image_executor_stats() -> dict:
+    jobs = image_executor_stats["jobs"]
+    return {
+        "workers": IMAGE_WORKERS,
+        "jobs": jobs,
+        "waiting": image_executor_stats["waiting"],
+        "avg_ms": image_executor_stats["total_ms"] / jobs if jobs else 0.0,
+        "max_ms": image_executor_stats["max_ms"]
+    }
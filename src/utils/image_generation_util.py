@@ -1,9 +1,12 @@
 import aiohttp
-import base64
 from io import BytesIO
 from typing import Optional, List
 from discord import File
 from src.aclient import client
+from src.utils.vision_cache import vision_cache, cache_scope, fingerprint_image
+from src.utils.image_executor import run_image_task
+from src.utils.image_buffer import ImageBuffer, MemoryViewStream
+from src.utils.image_queue import image_queue
 from src.moderation.logging import logger
 
 # Image generation configuration
@@ -18,8 +21,11 @@ async def generate_image(
     size: str = DEFAULT_IMAGE_SIZE,
     steps: int = DEFAULT_STEPS,
     cfg_scale: float = DEFAULT_CFG_SCALE,
-    seed: Optional[int] = None
-) -> bytes:
+    seed: Optional[int] = None,
+    guild_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    on_update=None
+) -> ImageBuffer:
     
     # Parse size into width and height
     width, height = parse_size(size)
@@ -42,34 +48,16 @@ async def generate_image(
     
     logger.debug(f"Generating image: {prompt[:50]}...")
     
-    # Use txt2img endpoint
-    endpoint = f"{IMAGE_GEN_BASE_URL}/txt2img"
+    # Use txt2img endpoint via the shared job queue
+    images = await image_queue.submit("txt2img", payload, guild_id, user_id, on_update=on_update)
+    image = images[0]
     
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            endpoint, 
-            json=payload,
-            timeout=aiohttp.ClientTimeout(total=300)  # 5 min for image gen
-        ) as resp:
-            if resp.status != 200:
-                error_text = await resp.text()
-                raise Exception(f"Image generation error {resp.status}: {error_text}")
-            
-            data = await resp.json()
-            
-            # KoboldCPP returns images as base64 in "images" array
-            if "images" in data and len(data["images"]) > 0:
-                image_base64 = data["images"][0]
-                image_bytes = base64.b64decode(image_base64)
-            else:
-                raise Exception("No image data in response")
-            
-            logger.info(f"Generated image: {len(image_bytes)} bytes")
-            return image_bytes
+    logger.info(f"Generated image: {len(image)} bytes")
+    return image
 
 async def generate_image_from_image(
     prompt: str,
-    init_image_base64: str,
+    init_image: ImageBuffer,
     negative_prompt: Optional[str] = None,
     size: str = DEFAULT_IMAGE_SIZE,
     steps: int = DEFAULT_STEPS,
@@ -77,7 +65,10 @@ async def generate_image_from_image(
     denoising_strength: float = 0.6,
     seed: Optional[int] = None,
     resize_input: bool = True,
-) -> bytes:
+    guild_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    on_update=None
+) -> File:
     
     # Parse size into width and height
     width, height = parse_size(size)
@@ -87,11 +78,11 @@ async def generate_image_from_image(
     
     # Optionally resize the input image to match target dimensions
     if resize_input:
-        init_image_base64 = await resize_image_base64(init_image_base64, width, height)
+        init_image = await resize_image(init_image, width, height)
 
     payload = {
         "prompt": prompt,
-        "init_images": [init_image_base64],
+        "init_images": [await init_image.get_base64()],
         "width": width,
         "height": height,
         "steps": steps,
@@ -108,36 +99,25 @@ async def generate_image_from_image(
     
     logger.debug(f"Generating image from image: {prompt[:50]}...")
     
-    # Use img2img endpoint
-    endpoint = f"{IMAGE_GEN_BASE_URL}/img2img"
+    # Use img2img endpoint via the shared job queue
+    images = await image_queue.submit("img2img", payload, guild_id, user_id, on_update=on_update)
+    image = images[0]
     
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            endpoint,
-            json=payload,
-            timeout=aiohttp.ClientTimeout(total=300)
-        ) as resp:
-            if resp.status != 200:
-                error_text = await resp.text()
-                raise Exception(f"Image transformation error {resp.status}: {error_text}")
-            
-            data = await resp.json()
-            
-            if "images" in data and len(data["images"]) > 0:
-                image_base64 = data["images"][0]
-                image_bytes = base64.b64decode(image_base64)
-            else:
-                raise Exception("No image data in response")
-            
-            logger.info(f"Generated image from image: {len(image_bytes)} bytes")
+    logger.info(f"Generated image from image: {len(image)} bytes")
+    return image.to_file("generated.png")
 
-            image_io = BytesIO(image_bytes)
-            return File(image_io, filename="generated.png")
-
-async def interrogate_image(image_base64: str, model: str = "clip") -> str:
+async def interrogate_image(image: ImageBuffer, model: str = "clip") -> str:
+    
+    # Same (or near-identical) image interrogated before
+    sha, phash = await run_image_task(fingerprint_image, image.view)
+    scope = cache_scope("interrogate", model)
+    
+    cached = await vision_cache.get(scope, sha, phash)
+    if cached is not None:
+        return cached
     
     payload = {
-        "image": image_base64,
+        "image": await image.get_base64(),
         "model": model
     }
     
@@ -159,6 +139,7 @@ async def interrogate_image(image_base64: str, model: str = "clip") -> str:
             data = await resp.json()
             
             if "caption" in data:
+                await vision_cache.set(scope, sha, phash, data["caption"])
                 return data["caption"]
             else:
                 raise Exception("No caption in response")
@@ -167,14 +148,19 @@ async def generate_image_for_discord(
     prompt: str,
     negative_prompt: Optional[str] = None,
     size: str = DEFAULT_IMAGE_SIZE,
-    filename: str = "generated.png"
+    filename: str = "generated.png",
+    guild_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    on_update=None
 ) -> File:
     
-    image_bytes = await generate_image(prompt, negative_prompt, size)
+    image = await generate_image(
+        prompt, negative_prompt, size,
+        guild_id=guild_id, user_id=user_id, on_update=on_update
+    )
     
-    # Convert to Discord File
-    image_io = BytesIO(image_bytes)
-    return File(image_io, filename=filename)
+    # Convert to Discord File (streams straight from the decoded buffer)
+    return image.to_file(filename)
 
 async def enhance_prompt(prompt: str) -> str:
     
@@ -226,24 +212,25 @@ async def generate_image_variations(
     base_prompt: str,
     num_variations: int = 3,
     size: str = DEFAULT_IMAGE_SIZE
-) -> List[bytes]:
-    
-    variations = []
-    
-    for i in range(num_variations):
-        try:
-            # Use different seeds for variations
-            image_bytes = await generate_image(
-                base_prompt,
-                size=size,
-                seed=None  # Random seed each time
-            )
-            variations.append(image_bytes)
-        except Exception as e:
-            logger.error(f"Failed to generate variation {i+1}: {e}")
-            continue
-    
-    return variations
+) -> List[ImageBuffer]:
+    
+    width, height = parse_size(size)
+    payload = {
+        "prompt": base_prompt,
+        "width": width,
+        "height": height,
+        "steps": DEFAULT_STEPS,
+        "cfg_scale": DEFAULT_CFG_SCALE,
+        "sampler_name": "Euler a"
+    }
+    
+    # One queued job; the backend produces all variations in a single batch
+    # (random seed per image) when it honours batch_size
+    try:
+        return await image_queue.submit("txt2img", payload, count=num_variations)
+    except Exception as e:
+        logger.error(f"Failed to generate variations: {e}")
+        return []
 
 # Preset styles for quick generation
 PRESET_STYLES = {
@@ -267,8 +254,11 @@ PRESET_STYLES = {
 async def generate_with_style(
     prompt: str,
     style: str = "realistic",
-    negative_prompt: Optional[str] = None
-) -> bytes:
+    negative_prompt: Optional[str] = None,
+    guild_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    on_update=None
+) -> ImageBuffer:
     
     # Get style tags
     style_tags = PRESET_STYLES.get(style.lower(), "")
@@ -280,7 +270,10 @@ async def generate_with_style(
     if not negative_prompt:
         negative_prompt = "low quality, blurry, distorted, ugly, bad anatomy"
     
-    return await generate_image(full_prompt, negative_prompt)
+    return await generate_image(
+        full_prompt, negative_prompt,
+        guild_id=guild_id, user_id=user_id, on_update=on_update
+    )
 
 def get_available_styles() -> List[str]:
     return list(PRESET_STYLES.keys())
@@ -288,18 +281,17 @@ def get_available_styles() -> List[str]:
 async def text_to_image_with_analysis(
     description: str,
     analyze_result: bool = False
-) -> tuple[bytes, Optional[str]]:
+) -> tuple[ImageBuffer, Optional[str]]:
     
     # Generate image
-    image_bytes = await generate_image(description)
+    image = await generate_image(description)
     
     analysis = None
     if analyze_result:
         # Analyze the generated image using interrogate
-        image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-        analysis = await interrogate_image(image_base64)
+        analysis = await interrogate_image(image)
     
-    return image_bytes, analysis
+    return image, analysis
 
 async def upscale_prompt(prompt: str, style: str = None) -> str:
     quality_boost = "masterpiece, best quality, highly detailed, sharp focus, professional"
@@ -340,7 +332,7 @@ async def generate_with_options(
     size: str = "512x512",
     quality: str = "standard",
     seed: Optional[int] = None
-) -> bytes:
+) -> ImageBuffer:
     
     # Parse and validate size
     width, height = parse_size(size)
@@ -370,12 +362,17 @@ async def generate_with_options(
         seed=seed
     )
 
-async def resize_image_base64(image_base64: str, target_width: int, target_height: int) -> str:
+async def resize_image(image: ImageBuffer, target_width: int, target_height: int) -> ImageBuffer:
+    # Decode, LANCZOS resize and PNG encode all run on the image workers
+    resized = await run_image_task(_resize_image_sync, image.view, target_width, target_height)
+    logger.debug(f"Resized image to {target_width}x{target_height}")
+    return ImageBuffer.from_bytes(resized)
+
+def _resize_image_sync(image_data: memoryview, target_width: int, target_height: int) -> memoryview:
     from PIL import Image
     
-    # Decode base64 to image
-    image_bytes = base64.b64decode(image_base64)
-    image = Image.open(BytesIO(image_bytes))
+    # Read the raw bytes in place
+    image = Image.open(MemoryViewStream(image_data))
     
     # Convert to RGB if needed
     if image.mode not in ('RGB', 'RGBA'):
@@ -410,10 +407,7 @@ async def resize_image_base64(image_base64: str, target_width: int, target_heigh
     bottom = top + target_height
     image = image.crop((left, top, right, bottom))
     
-    # Convert back to base64
+    # Encode as PNG; hand back the BytesIO buffer without copying it
     buffer = BytesIO()
     image.save(buffer, format='PNG')
-    resized_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-    
-    logger.debug(f"Resized image to {target_width}x{target_height}")
-    return resized_base64
\ No newline at end of file
+    return buffer.getbuffer()
\ No newline at end of file
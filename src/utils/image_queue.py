@@ -0,0 +1,340 @@
+import json
+import time
+import asyncio
+import aiohttp
+import itertools
+from collections import OrderedDict, deque
+from typing import Optional, List, Set
+from src.aclient import client
+from src.utils.image_buffer import ImageBuffer, read_image_response
+from src.moderation.logging import logger
+
+IMAGE_GEN_BASE_URL = client.kobold_img_api
+GENERATION_TIMEOUT_SECONDS = 300
+PROGRESS_POLL_SECONDS = 2.0
+MAX_JOBS_PER_USER = 3
+MAX_BATCH_SIZE = 4
+IMAGE_BATCHING = True  # Merge identical txt2img requests into one batch_size call
+
+class ImageJobCancelled(Exception):
+    pass
+
+class ImageQueueFull(Exception):
+    pass
+
+class ImageJob:
+    __slots__ = (
+        "id", "guild_id", "user_id", "endpoint", "payload", "count", "future",
+        "on_update", "status", "position", "progress", "eta", "created_at", "started_at"
+    )
+
+    def __init__(self, job_id: int, endpoint: str, payload: dict, guild_id: str, user_id: str, count: int, on_update):
+        self.id = job_id
+        self.endpoint = endpoint
+        self.payload = payload
+        self.guild_id = guild_id
+        self.user_id = user_id
+        self.count = count
+        self.future = asyncio.get_running_loop().create_future()
+        self.on_update = on_update  # async (job) -> None
+        self.status = "queued"
+        self.position = 0
+        self.progress = 0.0
+        self.eta: Optional[float] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+
+    def batch_key(self) -> Optional[str]:
+        # Only identical txt2img requests with a random seed can share a call
+        if self.endpoint != "txt2img" or "seed" in self.payload:
+            return None
+        return json.dumps(self.payload, sort_keys=True)
+
+def describe_job(job: ImageJob) -> str:
+    if job.status == "queued":
+        return "⏳ Waiting to start..." if job.position <= 1 else f"⏳ Queued — position **{job.position}**"
+    if job.status == "running":
+        eta = f", ~{job.eta:.0f}s left" if job.eta else ""
+        return f"🎨 Generating... **{job.progress:.0%}**{eta}"
+    return "🎨 Finishing up..."
+
+class ImageJobQueue:
+    def __init__(self):
+        # Per-guild queues served round-robin, so one busy server can't starve the rest
+        self._queues: "OrderedDict[str, deque[ImageJob]]" = OrderedDict()
+        self._running: List[ImageJob] = []
+        self._ids = itertools.count(1)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._tasks: Set[asyncio.Task] = set()  # Strong refs so progress edits aren't collected mid-run
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.backend_calls = 0
+        self.batched_jobs = 0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=GENERATION_TIMEOUT_SECONDS)
+            )
+        return self._session
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _ensure_worker(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    # ------------------------------------------------------------------------
+    # Queue bookkeeping
+    # ------------------------------------------------------------------------
+
+    def _ordered_jobs(self) -> List[ImageJob]:
+        # The order jobs will actually run in: one per guild per round
+        rounds = itertools.zip_longest(*self._queues.values())
+        return [job for round_jobs in rounds for job in round_jobs if job is not None]
+
+    def _pop_next(self) -> Optional[ImageJob]:
+        if not self._queues:
+            return None
+        guild_id, jobs = next(iter(self._queues.items()))
+        job = jobs.popleft()
+        if jobs:
+            self._queues.move_to_end(guild_id)
+        else:
+            del self._queues[guild_id]
+        return job
+
+    def _discard_queued(self, job: ImageJob) -> bool:
+        jobs = self._queues.get(job.guild_id)
+        if not jobs or job not in jobs:
+            return False
+        jobs.remove(job)
+        if not jobs:
+            del self._queues[job.guild_id]
+        return True
+
+    def _take_batch_mates(self, job: ImageJob) -> List[ImageJob]:
+        key = job.batch_key()
+        if not IMAGE_BATCHING or key is None:
+            return [job]
+
+        batch, total = [job], job.count
+        for guild_id in list(self._queues):
+            jobs = self._queues[guild_id]
+            for other in list(jobs):
+                if other.batch_key() == key and total + other.count <= MAX_BATCH_SIZE:
+                    jobs.remove(other)
+                    batch.append(other)
+                    total += other.count
+            if not jobs:
+                del self._queues[guild_id]
+        return batch
+
+    def _notify(self, job: ImageJob):
+        if job.on_update is None:
+            return
+
+        async def _send():
+            try:
+                await job.on_update(job)
+            except Exception as e:
+                logger.debug(f"[Image Queue] Progress update failed for job {job.id}: {e}")
+
+        self._spawn(_send())
+
+    def _refresh_positions(self):
+        for position, job in enumerate(self._ordered_jobs(), start=1 + bool(self._running)):
+            if job.position != position:
+                job.position = position
+                self._notify(job)
+
+    # ------------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------------
+
+    async def submit(
+        self,
+        endpoint: str,
+        payload: dict,
+        guild_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        count: int = 1,
+        on_update=None
+    ) -> List[ImageBuffer]:
+        if user_id is not None:
+            pending = sum(1 for job in self._ordered_jobs() + self._running if job.user_id == user_id)
+            if pending >= MAX_JOBS_PER_USER:
+                raise ImageQueueFull(f"{pending} jobs already queued")
+
+        job = ImageJob(next(self._ids), endpoint, payload, guild_id or "global", user_id, count, on_update)
+        self._queues.setdefault(job.guild_id, deque()).append(job)
+
+        self._ensure_worker()
+        self._refresh_positions()
+        self._wakeup.set()
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            # Nobody is waiting for this image any more; don't spend the backend on it
+            if self._discard_queued(job):
+                self.cancelled += 1
+                self._refresh_positions()
+            elif job in self._running and all(j.future.done() for j in self._running):
+                self.cancelled += 1
+                self._spawn(self._interrupt())
+            raise
+
+    def cancel_user_jobs(self, user_id: str) -> int:
+        cancelled = 0
+
+        for guild_id in list(self._queues):
+            jobs = self._queues[guild_id]
+            for job in [j for j in jobs if j.user_id == user_id]:
+                jobs.remove(job)
+                if not job.future.done():
+                    job.future.set_exception(ImageJobCancelled())
+                cancelled += 1
+            if not jobs:
+                del self._queues[guild_id]
+
+        # A running batch is only interrupted if nobody else is waiting on it
+        if self._running and all(job.user_id == user_id for job in self._running):
+            for job in self._running:
+                if not job.future.done():
+                    job.future.set_exception(ImageJobCancelled())
+                    cancelled += 1
+            self._spawn(self._interrupt())
+
+        self.cancelled += cancelled
+        if cancelled:
+            self._refresh_positions()
+        return cancelled
+
+    def get_stats(self) -> dict:
+        return {
+            "queued": len(self._ordered_jobs()),
+            "running": len(self._running),
+            "guilds_waiting": len(self._queues),
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "backend_calls": self.backend_calls,
+            "batched_jobs": self.batched_jobs
+        }
+
+    # ------------------------------------------------------------------------
+    # Backend calls
+    # ------------------------------------------------------------------------
+
+    async def _post(self, endpoint: str, payload: dict) -> List[ImageBuffer]:
+        self.backend_calls += 1
+        async with self._get_session().post(f"{IMAGE_GEN_BASE_URL}/{endpoint}", json=payload) as resp:
+            if resp.status != 200:
+                error_text = await resp.text()
+                raise Exception(f"Image generation error {resp.status}: {error_text}")
+
+            # KoboldCPP returns images as base64 in "images" array; decode while streaming
+            images = await read_image_response(resp)
+
+        if not images:
+            raise Exception("No image data in response")
+        return images
+
+    async def _interrupt(self):
+        try:
+            async with self._get_session().post(f"{IMAGE_GEN_BASE_URL}/interrupt", timeout=aiohttp.ClientTimeout(total=5)):
+                pass
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.debug(f"[Image Queue] Interrupt failed: {e}")
+
+    async def _poll_progress(self, jobs: List[ImageJob]):
+        url = f"{IMAGE_GEN_BASE_URL}/progress?skip_current_image=true"
+        while True:
+            await asyncio.sleep(PROGRESS_POLL_SECONDS)
+            try:
+                async with self._get_session().get(url, timeout=aiohttp.ClientTimeout(total=5)) as resp:
+                    if resp.status != 200:
+                        return  # Backend has no progress endpoint
+                    data = await resp.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                return
+
+            progress = float(data.get("progress") or 0.0)
+            eta = data.get("eta_relative")
+            for job in jobs:
+                if abs(progress - job.progress) >= 0.05:
+                    job.progress = progress
+                    job.eta = eta
+                    self._notify(job)
+
+    async def _run_batch(self, jobs: List[ImageJob]):
+        lead = jobs[0]
+        total = sum(job.count for job in jobs)
+        payload = dict(lead.payload)
+        if total > 1:
+            payload["batch_size"] = total
+
+        for job in jobs:
+            job.status = "running"
+            job.started_at = time.time()
+            self._notify(job)
+
+        poller = asyncio.create_task(self._poll_progress(jobs))
+        try:
+            images = await self._post(lead.endpoint, payload)
+
+            # Backends that ignore batch_size return a single image; fill the rest one by one
+            payload["batch_size"] = 1
+            while len(images) < total:
+                if all(job.future.done() for job in jobs):
+                    return
+                images.extend(await self._post(lead.endpoint, payload))
+        except Exception as e:
+            for job in jobs:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            self.failed += len(jobs)
+            return
+        finally:
+            poller.cancel()
+
+        offset = 0
+        for job in jobs:
+            if not job.future.done():
+                job.status = "done"
+                job.future.set_result(images[offset:offset + job.count])
+                self.completed += 1
+            offset += job.count
+
+        if len(jobs) > 1:
+            self.batched_jobs += len(jobs)
+            logger.info(f"[Image Queue] Batched {len(jobs)} requests into one {total}-image call")
+
+    async def _run(self):
+        while True:
+            job = self._pop_next()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            self._running = self._take_batch_mates(job)
+            self._refresh_positions()
+            try:
+                await self._run_batch(self._running)
+            except Exception as e:
+                logger.exception(f"[Image Queue] Worker error: {e}")
+            finally:
+                self._running = []
+                self._refresh_positions()
+
+# Global image job queue
+image_queue = ImageJobQueue()
@@ -1,6 +1,74 @@
 import aiohttp
+import asyncio
 import re
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from src.aclient import client
+from src.utils.metrics import llm_requests, llm_latency
+
+# ============================================================================
+# LLM LANES
+# ============================================================================
+_in_background_lane = ContextVar("in_background_lane", default=False)
+
+class LLMLane:
+    def __init__(self, concurrency: int = 1):
+        # Background jobs (notes, world memory, pre-generated summaries) share one
+        # model with user replies, so they run one at a time and only when no
+        # reply is being generated.
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._foreground_active = 0
+        self._foreground_idle = asyncio.Event()
+        self._foreground_idle.set()
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+
+    @asynccontextmanager
+    async def foreground(self):
+        # Background jobs reuse the same API helpers; don't count them as replies
+        if _in_background_lane.get():
+            yield
+            return
+
+        self._foreground_active += 1
+        self._foreground_idle.clear()
+        try:
+            yield
+        finally:
+            self._foreground_active -= 1
+            if self._foreground_active == 0:
+                self._foreground_idle.set()
+
+    async def run_background(self, coro_fn, *args, **kwargs):
+        self.queued += 1
+        try:
+            async with self._semaphore:
+                await self._foreground_idle.wait()
+                token = _in_background_lane.set(True)
+                try:
+                    result = await coro_fn(*args, **kwargs)
+                finally:
+                    _in_background_lane.reset(token)
+                self.completed += 1
+                return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.queued -= 1
+
+    def get_stats(self) -> dict:
+        return {
+            "foreground_active": self._foreground_active,
+            "background_queued": self.queued,
+            "background_completed": self.completed,
+            "background_failed": self.failed
+        }
+
+# Global lane instance
+llm_lane = LLMLane()
 
 async def get_kobold_response(messages):
     url = client.kobold_text_api
@@ -15,10 +83,18 @@ async def get_kobold_response(messages):
         "max_tokens": 512,
         "stop": ["\nUser:", "\nSystem:", "\nAssistant:"]
     }
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, json=payload) as resp:
-            data = await resp.json()
-            return data["choices"][0]["message"]["content"]
+    result = "error"
+    start = time.perf_counter()
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.post(url, json=payload) as resp:
+                data = await resp.json()
+                content = data["choices"][0]["message"]["content"]
+        result = "ok"
+        return content
+    finally:
+        llm_requests.inc(kind="background", result=result)
+        llm_latency.observe(time.perf_counter() - start, kind="background")
         
 def sanitize_bot_output(text: str, bot_name: str = "Chopperbot") -> str:
     # Keep only the assistant's first reply before it starts imitating others
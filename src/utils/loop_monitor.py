@@ -0,0 +1,131 @@
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from bisect import bisect_left
+from collections import deque
+from typing import Optional
+from src.moderation.logging import logger
+
+# Upper bounds (ms) of the lag histogram buckets; the last bucket is open-ended
+LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+LOOP_SAMPLE_INTERVAL = 0.25
+SLOW_STEP_THRESHOLD = 0.5    # Seconds a single step may block before it is reported
+MAX_SLOW_STEPS = 20          # Recent slow steps kept for /health
+STACK_DEPTH = 8
+
+class LoopLatencyMonitor:
+    def __init__(self, interval: float = LOOP_SAMPLE_INTERVAL):
+        # Schedules a sleep and measures how late it wakes up: any callback that
+        # blocks the loop shows up directly as lag.
+        self.interval = interval
+        self.histogram = [0] * (len(LAG_BUCKETS_MS) + 1)
+        self.samples = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+        # Slow-step watchdog state
+        self.threshold = SLOW_STEP_THRESHOLD
+        self.slow_steps: deque = deque(maxlen=MAX_SLOW_STEPS)
+        self.slow_step_count = 0
+        self._heartbeat = time.monotonic()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def record(self, lag_ms: float):
+        self.histogram[bisect_left(LAG_BUCKETS_MS, lag_ms)] += 1
+        self.samples += 1
+        self.total_ms += lag_ms
+        self.max_ms = max(self.max_ms, lag_ms)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self.start_watchdog(loop)
+        while True:
+            start = loop.time()
+            self._heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (loop.time() - start - self.interval) * 1000)
+            self.record(lag_ms)
+            if self.slow_steps and self.slow_steps[-1]["open"]:
+                # The stall is over; now the full blocking time is known
+                self.slow_steps[-1].update(blocked_ms=lag_ms, open=False)
+
+    # ========================================================================
+    # SLOW-STEP WATCHDOG
+    # ========================================================================
+    # The sampler only sees a stall after it ends. A daemon thread watches the
+    # heartbeat instead and, while the loop is still stuck, captures the stack
+    # of the loop thread and the task that is running, so the report points at
+    # the blocking call itself (count_tokens, difflib, Pillow, sync HTTP, ...).
+
+    def start_watchdog(self, loop: asyncio.AbstractEventLoop):
+        if self._watchdog is not None:
+            return  # on_ready fires again after reconnects
+        self._watchdog = threading.Thread(
+            target=self._watch, args=(loop, threading.get_ident()),
+            name="loop-watchdog", daemon=True
+        )
+        self._watchdog.start()
+
+    def _watch(self, loop: asyncio.AbstractEventLoop, loop_thread_id: int):
+        reported = None
+        while not loop.is_closed():
+            time.sleep(self.interval)
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled >= self.threshold and heartbeat != reported:
+                reported = heartbeat  # One report per stall
+                self._report_stall(loop, loop_thread_id, stalled)
+
+    def _report_stall(self, loop: asyncio.AbstractEventLoop, loop_thread_id: int, stalled: float):
+        frame = sys._current_frames().get(loop_thread_id)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame)[-STACK_DEPTH:]
+        task = asyncio.current_task(loop)
+        coro = task.get_coro() if task else None
+        where = stack[-1] if stack else None
+
+        step = {
+            "time": time.time(),
+            "task": getattr(coro, "__qualname__", None) or (task.get_name() if task else "callback"),
+            "location": f"{where.filename.rsplit('/', 1)[-1]}:{where.lineno} in {where.name}" if where else "unknown",
+            "blocked_ms": stalled * 1000,
+            "open": True
+        }
+        self.slow_steps.append(step)
+        self.slow_step_count += 1
+        logger.warning(
+            f"[Event Loop] Blocked for {step['blocked_ms']:.0f}ms+ in {step['task']} at {step['location']}\n"
+            + "".join(traceback.format_list(stack))
+        )
+
+    def percentile(self, pct: float) -> float:
+        # Upper bound of the bucket the percentile falls into, never above the
+        # exact max (a run with every sample under 2ms shouldn't report p99 5ms)
+        if not self.samples:
+            return 0.0
+        target = self.samples * pct / 100
+        seen = 0
+        for i, count in enumerate(self.histogram):
+            seen += count
+            if seen >= target:
+                return min(float(LAG_BUCKETS_MS[i]), self.max_ms) if i < len(LAG_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def get_stats(self) -> dict:
+        labels = [f"<={b}ms" for b in LAG_BUCKETS_MS] + [f">{LAG_BUCKETS_MS[-1]}ms"]
+        return {
+            "samples": self.samples,
+            "avg_ms": self.total_ms / self.samples if self.samples else 0.0,
+            "p50_ms": self.percentile(50),
+            "p99_ms": self.percentile(99),
+            "max_ms": self.max_ms,
+            "histogram": dict(zip(labels, self.histogram)),
+            "slow_steps": self.slow_step_count,
+            "last_slow_step": dict(self.slow_steps[-1]) if self.slow_steps else None
+        }
+
+# Global event loop monitor
+loop_monitor = LoopLatencyMonitor()
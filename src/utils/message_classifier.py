@@ -0,0 +1,124 @@
+import re
+from functools import lru_cache
+
+# ============================================================================
+# KEYWORD SIGNALS
+# ============================================================================
+# Substring keywords, matched anywhere in the lowercased message (same
+# semantics as the old `word in content_lower` checks)
+SIGNAL_KEYWORDS = {
+    "question": ["?", "what", "how", "why", "who", "when", "where", "explain"],
+    "emotional": ["sad", "happy", "angry", "worried", "excited", "scared", "depressed", "anxious"],
+    "roleplay": ["*"],
+    "request": ["please", "can you", "could you", "would you", "help me"],
+    "search_question": ["?", "what", "who", "when", "how"],
+    "explicit_search": [
+        "search for", "look up", "find information about",
+        "what's happening", "latest news", "recent news",
+        "current events", "breaking news"
+    ],
+    "time_sensitive": [
+        "today", "this week", "this month", "right now",
+        "currently", "recent", "latest", "new"
+    ],
+    "current_topic": [
+        "score", "election", "weather forecast", "stock price",
+        "who won", "who's winning", "game result"
+    ]
+}
+
+# Whole words only
+DATE_WORDS = [
+    "2024", "2025", "january", "february", "march", "april", "may", "june", "july",
+    "august", "september", "october", "november", "december"
+]
+
+def _trie_pattern(words) -> str:
+    # Factor shared prefixes ("who", "who won", "who's winning") so the regex
+    # engine walks each position once instead of trying every keyword in turn
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        return group + "?" if "" in node else group
+
+    return build(trie)
+
+def _build_matcher():
+    keyword_signals = {}
+    for signal, keywords in SIGNAL_KEYWORDS.items():
+        for keyword in keywords:
+            keyword_signals.setdefault(keyword, set()).add(signal)
+
+    # Only the longest keyword starting at each position is reported, so it
+    # carries the signals of every keyword it contains ("who won" -> "who")
+    expanded = {
+        keyword: frozenset().union(*(keyword_signals[other] for other in keyword_signals if other in keyword))
+        for keyword in keyword_signals
+    }
+    for word in DATE_WORDS:
+        expanded.setdefault(word, frozenset())  # Confirmed as whole words separately
+
+    # Lookahead so overlapping keywords ("whereexcited") are all reported
+    return re.compile(f"(?=({_trie_pattern(expanded)}))"), expanded
+
+_MATCHER, _KEYWORD_SIGNALS = _build_matcher()
+_DATE_WORDS = frozenset(DATE_WORDS)
+_DATE_PATTERN = re.compile(rf"\b(?:{'|'.join(DATE_WORDS)})\b")
+
+# ============================================================================
+# CLASSIFICATION
+# ============================================================================
+class MessageSignals:
+    __slots__ = ("signals", "word_count")
+
+    def __init__(self, signals: frozenset, word_count: int):
+        self.signals = signals
+        self.word_count = word_count
+
+    def __contains__(self, signal: str) -> bool:
+        return signal in self.signals
+
+    @property
+    def conversation_type(self) -> str:
+        # Same priority order detect_conversation_type always used
+        for conversation_type in ("question", "emotional", "roleplay", "request"):
+            if conversation_type in self.signals:
+                return conversation_type
+        return "casual"
+
+    @property
+    def search_worthy(self) -> bool:
+        signals = self.signals
+        if "explicit_search" in signals:
+            return True
+        if "search_question" not in signals:
+            return False
+        if "date" in signals or "current_topic" in signals:
+            return True
+        return "time_sensitive" in signals and self.word_count >= 6
+
+@lru_cache(maxsize=256)
+def classify_message(content: str) -> MessageSignals:
+    # One scan for every signal; cached because the bot classifies the same
+    # message for both the conversation type and the web search decision
+    content_lower = content.lower()
+    found = set(_MATCHER.findall(content_lower))
+
+    signals = set()
+    for keyword in found:
+        signals |= _KEYWORD_SIGNALS[keyword]
+    if not found.isdisjoint(_DATE_WORDS) and _DATE_PATTERN.search(content_lower):
+        signals.add("date")
+
+    return MessageSignals(frozenset(signals), len(content.split()))
@@ -0,0 +1,189 @@
+from bisect import bisect_left
+from typing import Optional, Dict, Tuple
+from aiohttp import web
+from src.moderation.logging import logger
+
+# ============================================================================
+# METRICS REGISTRY
+# ============================================================================
+# Minimal Prometheus-style metrics served in the text exposition format.
+# Hot-path updates are a dict lookup and an addition; queue depths, cache
+# stats and loop lag are read from the existing stats helpers at scrape time.
+
+METRICS_HOST = "127.0.0.1"   # Local only; put a reverse proxy in front to expose it
+METRIC_PREFIX = "chopperbot_"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry: Dict[str, "Metric"] = {}
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = METRIC_PREFIX + name
+        self.help = help_text
+        self.label_names = labels
+        self._values: Dict[Tuple, object] = {}
+        _registry[self.name] = self
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in list(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {value}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, (counts, total, count) in list(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _format_labels(self.label_names, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+# ============================================================================
+# BOT METRICS
+# ============================================================================
+messages_processed = Counter("messages_processed_total", "Messages handled by the bot", ("source",))
+llm_requests = Counter("llm_requests_total", "Requests sent to the text model", ("kind", "result"))
+llm_latency = Histogram("llm_request_seconds", "Text model request latency", ("kind",))
+llm_tokens = Counter("llm_tokens_total", "Reply tokens generated by the model vs kept after cleanup", ("type",))
+db_pool_wait = Histogram("db_pool_wait_seconds", "Time spent waiting for a database connection")
+
+queue_depth = Gauge("queue_depth", "Items waiting in background queues", ("queue",))
+cache_entries = Gauge("cache_entries", "Entries held in in-memory caches", ("cache",))
+cache_hit_ratio = Gauge("cache_hit_ratio", "Lifetime hit ratio of caches", ("cache",))
+db_pool_connections = Gauge("db_pool_connections", "Database pool connections", ("state",))
+loop_lag = Gauge("event_loop_lag_milliseconds", "Event loop scheduling lag", ("stat",))
+loop_slow_steps = Gauge("event_loop_slow_steps", "Steps that blocked the event loop past the threshold since startup")
+stage_latency = Gauge("stage_latency_milliseconds", "Recent reply pipeline stage latency", ("stage", "quantile"))
+rate_limit_denied = Gauge("rate_limit_denied", "Requests refused by rate limiters since startup", ("limiter",))
+
+def _collect_runtime():
+    # Point-in-time values come straight from the stats helpers /health uses
+    from src.moderation.database import get_pool_stats, user_log_queue, user_log_cache, world_context_cache
+    from src.utils.loop_monitor import loop_monitor
+    from src.utils.websearch_util import get_search_cache_stats
+    from src.utils.vision_cache import vision_cache
+    from src.utils.weather_util import weather_client
+    from src.utils.image_queue import image_queue
+    from src.utils.koboldcpp_util import llm_lane
+    from src.utils.perf_trace import perf_tracer
+    from src.utils.rate_limiter import rate_limiters
+
+    pool = get_pool_stats()
+    if pool:
+        queue_depth.set(pool["write_queue_size"], queue="write_queue")
+        queue_depth.set(pool["pending_notes_queue_size"], queue="pending_notes_queue")
+        db_pool_connections.set(pool["pool_size"] - pool["available_connections"], state="in_use")
+        db_pool_connections.set(pool["available_connections"], state="available")
+    queue_depth.set(len(user_log_queue), queue="user_log_queue")
+    queue_depth.set(llm_lane.get_stats()["background_queued"], queue="llm_background")
+    queue_depth.set(image_queue.get_stats()["queued"], queue="image_generation")
+
+    search = get_search_cache_stats()
+    weather = weather_client.get_stats()
+    cache_entries.set(search["entries"], cache="web_search")
+    cache_entries.set(len(user_log_cache), cache="user_log")
+    cache_entries.set(len(world_context_cache), cache="world_context")
+    cache_entries.set(weather["data"]["entries"], cache="weather")
+    cache_hit_ratio.set(search["hit_rate"], cache="web_search")
+    cache_hit_ratio.set(weather["data"]["hit_rate"], cache="weather")
+    cache_hit_ratio.set(weather["commentary"]["hit_rate"], cache="weather_commentary")
+    cache_hit_ratio.set(vision_cache.get_stats()["hit_rate"], cache="vision")
+
+    lag = loop_monitor.get_stats()
+    for stat in ("p50_ms", "p99_ms", "max_ms"):
+        loop_lag.set(lag[stat], stat=stat[:-3])
+    loop_slow_steps.set(lag["slow_steps"])
+
+    for stage, stats in perf_tracer.get_stats().items():
+        for quantile in ("p50", "p95", "p99"):
+            stage_latency.set(stats[f"{quantile}_ms"], stage=stage, quantile=f"0.{quantile[1:]}")
+
+    for name, limiter in rate_limiters.items():
+        rate_limit_denied.set(limiter.denied, limiter=name)
+
+def render_metrics() -> str:
+    try:
+        _collect_runtime()
+    except Exception as e:
+        logger.error(f"[Metrics] Collection failed: {e}")
+    lines = []
+    for metric in list(_registry.values()):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# ============================================================================
+# HTTP ENDPOINT
+# ============================================================================
+_runner: Optional[web.AppRunner] = None
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8",
+                        headers={"X-Content-Type-Options": "nosniff"})
+
+async def start_metrics_server(port: int, host: str = METRICS_HOST):
+    global _runner
+    if _runner is not None:
+        return  # on_ready fires again after reconnects
+
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+
+async def stop_metrics_server():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
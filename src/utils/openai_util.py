@@ -3,6 +3,7 @@ from os import remove
 from pathlib import Path
 import openai
 import aiohttp
+import asyncio
 import json
 from src.aclient import client
 
@@ -23,7 +24,9 @@ async def generate_img(description):
     DATA_DIR = Path.cwd() / "responses"
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     
-    response = openai.Image.create(
+    # The openai SDK call and the file I/O are blocking; keep them off the event loop
+    response = await asyncio.to_thread(
+        openai.Image.create,
         model="dall-e-2",
         prompt=description,
         size="1024x1024",
@@ -35,12 +38,18 @@ async def generate_img(description):
     file_name = f"{description[:5]}-{response['created']}.json"
     file_path = DATA_DIR / file_name
 
-    with open(file_path, mode="w", encoding="utf-8") as file:
-        json.dump(response, file)
+    await asyncio.to_thread(_write_json, file_path, response)
 
     return await conversion(file_path)
 
+def _write_json(file_path, data):
+    with open(file_path, mode="w", encoding="utf-8") as file:
+        json.dump(data, file)
+
 async def conversion(json_path):
+    return await asyncio.to_thread(_convert_to_png, json_path)
+
+def _convert_to_png(json_path):
     JSON_FILE = Path(json_path)
     IMAGE_DIR = Path.cwd() / "images"
     IMAGE_DIR.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import itertools
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional, Dict, List
+
+# ============================================================================
+# PIPELINE TRACING
+# ============================================================================
+# Each stage keeps a rolling window of durations for /perf percentiles. While a
+# message is being handled its spans are also collected into a trace, and the
+# most recent traces can be exported in Chrome trace event format (open the
+# file in chrome://tracing or ui.perfetto.dev).
+
+STAGE_WINDOW = 1000          # Durations kept per stage
+MAX_RECENT_TRACES = 200
+TRACE_EXPORT_DIR = "data/traces"
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+_trace_ids = itertools.count(1)
+
+class Trace:
+    __slots__ = ("id", "name", "start_ns", "end_ns", "spans")
+
+    def __init__(self, name: str):
+        self.id = next(_trace_ids)
+        self.name = name
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns: Optional[int] = None
+        self.spans: List[tuple] = []  # (stage, start_ns, duration_ns)
+
+class PerfTracer:
+    def __init__(self, window: int = STAGE_WINDOW):
+        self.window = window
+        self._durations: Dict[str, deque] = {}  # {stage: deque of ms}
+        self._counts: Dict[str, int] = {}
+        self.recent_traces: deque = deque(maxlen=MAX_RECENT_TRACES)
+
+    def record(self, stage: str, duration_ms: float):
+        durations = self._durations.get(stage)
+        if durations is None:
+            durations = self._durations[stage] = deque(maxlen=self.window)
+            self._counts[stage] = 0
+        durations.append(duration_ms)
+        self._counts[stage] += 1
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter_ns() - start
+            self.record(stage, duration / 1e6)
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.spans.append((stage, start, duration))
+
+    @contextmanager
+    def trace(self, name: str):
+        # Spans from any coroutine awaited inside this block join the trace
+        trace = Trace(name)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+            trace.end_ns = time.perf_counter_ns()
+            self.record(name, (trace.end_ns - trace.start_ns) / 1e6)
+            self.recent_traces.append(trace)
+
+    def get_stats(self) -> Dict[str, dict]:
+        stats = {}
+        for stage, durations in self._durations.items():
+            ordered = sorted(durations)
+            last = len(ordered) - 1
+            stats[stage] = {
+                "count": self._counts[stage],
+                "p50_ms": ordered[int(last * 0.50)],
+                "p95_ms": ordered[int(last * 0.95)],
+                "p99_ms": ordered[int(last * 0.99)],
+                "max_ms": ordered[last]
+            }
+        return stats
+
+    def reset(self):
+        self._durations.clear()
+        self._counts.clear()
+        self.recent_traces.clear()
+
+    def to_chrome_trace(self) -> dict:
+        events = []
+        for trace in list(self.recent_traces):
+            events.append({
+                "name": trace.name, "ph": "X", "pid": os.getpid(), "tid": trace.id,
+                "ts": trace.start_ns / 1000, "dur": (trace.end_ns - trace.start_ns) / 1000
+            })
+            for stage, start, duration in trace.spans:
+                events.append({
+                    "name": stage, "ph": "X", "pid": os.getpid(), "tid": trace.id,
+                    "ts": start / 1000, "dur": duration / 1000
+                })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, directory: str = TRACE_EXPORT_DIR) -> str:
+        # Blocking file write; call through asyncio.to_thread from the bot
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"trace_{time.strftime('%Y%m%d_%H%M%S')}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f)
+        return path
+
+# Global tracer
+perf_tracer = PerfTracer()
+span = perf_tracer.span
@@ -1,5 +1,6 @@
 import asyncio
-from typing import Optional, Dict
+from types import MappingProxyType
+from typing import Optional, Dict, Mapping
 from src.personalities import ChopperbotPersonality, personalities, custom_personalities
 from src.moderation.database import (
     load_all_server_personalities,
@@ -10,12 +11,22 @@ from src.moderation.logging import logger
 
 class ServerPersonalityManager:
     def __init__(self):
-        self.server_personalities: Dict[str, tuple[str, bool]] = {}
+        # Copy-on-write snapshot: readers never lock, writers swap in a new mapping
+        self.server_personalities: Mapping[str, tuple[str | ChopperbotPersonality, bool]] = MappingProxyType({})
         # Format: {server_id: (personality_name_or_object, is_custom)}
         self._lock = asyncio.Lock()
         self._default = ("Default", False)
         self._loaded = False
     
+    async def _update(self, server_id: str, entry: tuple | None):
+        async with self._lock:
+            updated = dict(self.server_personalities)
+            if entry is None:
+                updated.pop(server_id, None)
+            else:
+                updated[server_id] = entry
+            self.server_personalities = MappingProxyType(updated)
+    
     async def load_from_database(self):
         if self._loaded:
             return
@@ -24,14 +35,16 @@ class ServerPersonalityManager:
             db_personalities = await load_all_server_personalities()
             
             async with self._lock:
+                updated = dict(self.server_personalities)
                 for server_id, data in db_personalities.items():
                     if data["is_custom"]:
                         # Create custom personality object
                         personality_obj = custom_personalities(data["value"])
-                        self.server_personalities[server_id] = (personality_obj, True)
+                        updated[server_id] = (personality_obj, True)
                     else:
                         # Standard personality
-                        self.server_personalities[server_id] = (data["value"], False)
+                        updated[server_id] = (data["value"], False)
+                self.server_personalities = MappingProxyType(updated)
             
             self._loaded = True
             logger.info(f"Loaded {len(db_personalities)} server personalities from database")
@@ -39,32 +52,31 @@ class ServerPersonalityManager:
         except Exception as e:
             logger.error(f"Failed to load server personalities from database: {e}")
     
-    async def get_personality(self, server_id: Optional[str]) -> ChopperbotPersonality:
+    def resolve_personality(self, server_id: Optional[str]) -> ChopperbotPersonality:
         
         # DMs use default personality
         if server_id is None or server_id == "dm":
             return personalities["Default"]
         
-        async with self._lock:
-            personality_data = self.server_personalities.get(server_id, self._default)
-            personality_name, is_custom = personality_data
-            
-            if is_custom:
-                # Custom roleplay personality
-                if isinstance(personality_name, ChopperbotPersonality):
-                    return personality_name
-                else:
-                    return custom_personalities(personality_name)
-            else:
-                # Standard personality
-                return personalities.get(personality_name, personalities["Default"])
+        personality_name, is_custom = self.server_personalities.get(server_id, self._default)
+        
+        if is_custom:
+            # Custom roleplay personality
+            if isinstance(personality_name, ChopperbotPersonality):
+                return personality_name
+            return custom_personalities(personality_name)
+        
+        # Standard personality
+        return personalities.get(personality_name, personalities["Default"])
+    
+    async def get_personality(self, server_id: Optional[str]) -> ChopperbotPersonality:
+        return self.resolve_personality(server_id)
     
     async def set_personality(self, server_id: str, personality_name: str) -> bool:
         if personality_name not in personalities:
             return False
         
-        async with self._lock:
-            self.server_personalities[server_id] = (personality_name, False)
+        await self._update(server_id, (personality_name, False))
 
         # Persist to database
         await save_server_personality(
@@ -79,9 +91,8 @@ class ServerPersonalityManager:
     
     async def set_custom_personality(self, server_id: str, character: str):        
 
-        async with self._lock:
-            personality_obj = custom_personalities(character)
-            self.server_personalities[server_id] = (personality_obj, True)
+        personality_obj = custom_personalities(character)
+        await self._update(server_id, (personality_obj, True))
         
         # Persist to database (store character name, not object)
         await save_server_personality(
@@ -95,9 +106,7 @@ class ServerPersonalityManager:
 
     async def reset_personality(self, server_id: str):
         
-        async with self._lock:
-            if server_id in self.server_personalities:
-                del self.server_personalities[server_id]
+        await self._update(server_id, None)
         
         # Remove from database
         await delete_server_personality(server_id)
@@ -138,6 +147,9 @@ personality_manager = ServerPersonalityManager()
 async def get_server_personality(server_id: Optional[str]) -> ChopperbotPersonality:
     return await personality_manager.get_personality(server_id)
 
+def resolve_server_personality(server_id: Optional[str]) -> ChopperbotPersonality:
+    return personality_manager.resolve_personality(server_id)
+
 async def set_server_personality(server_id: str, personality_name: str) -> bool:
     return await personality_manager.set_personality(server_id, personality_name)
 
@@ -0,0 +1,107 @@
+import os
+from collections import OrderedDict
+from typing import List, Dict, Optional
+from src.utils.history_util import count_tokens, trim_history
+
+# ============================================================================
+# PROMPT LAYOUT
+# ============================================================================
+# Segments are ordered from most stable to most volatile so consecutive
+# requests in a channel share a byte-identical prefix and KoboldCPP can reuse
+# its processed context instead of re-reading the whole prompt:
+#
+#   1. personality   (changes only when an admin switches personality)
+#   2. world         (changes a few times per hour)
+#   3. user notes    (changes with the speaker)
+#   4. history       (append-only, trimmed from the front)
+#   5. turn hints    (conversation-type instructions for this message only)
+
+MAX_TRACKED_PREFIX_CHANNELS = 200
+
+def build_layout(
+    personality,
+    conversation_type: str,
+    history: List[Dict],
+    world_msgs: Optional[List[Dict]] = None,
+    user_notes: Optional[str] = None,
+    max_tokens: int = 2000
+) -> List[Dict]:
+    head = [{"role": "system", "content": personality.get_base_prompt()}]
+
+    if world_msgs:
+        head.extend(world_msgs)
+
+    note_prompt = personality.get_user_note_prompt(user_notes)
+    if note_prompt:
+        head.append({"role": "system", "content": note_prompt})
+
+    tail = []
+    context_hint = personality.get_context_hint(conversation_type)
+    if context_hint:
+        tail.append({"role": "system", "content": context_hint})
+
+    # Only history is trimmed; the fixed segments always stay in place
+    fixed_tokens = sum(count_tokens(m["content"]) for m in head + tail)
+    history_budget = max(0, max_tokens - fixed_tokens)
+
+    return head + trim_history(history, max_tokens=history_budget) + tail
+
+def serialize_messages(messages: List[Dict]) -> str:
+    parts = []
+    for msg in messages:
+        content = msg.get("content", "")
+        if not isinstance(content, str):
+            content = repr(content)
+        parts.append(f"{msg.get('role', '')}\x1f{content}\x1e")
+    return "".join(parts)
+
+class PrefixStabilityTracker:
+    def __init__(self, max_channels: int = MAX_TRACKED_PREFIX_CHANNELS):
+        self.max_channels = max_channels
+        self._last_prompts = OrderedDict()  # {channel_key: serialized prompt}
+        self._totals = {}  # {channel_key: [ratio_sum, samples]}
+        self.total_ratio = 0.0
+        self.total_samples = 0
+
+    def record(self, channel_key: str, messages: List[Dict]) -> float:
+        serialized = serialize_messages(messages)
+        previous = self._last_prompts.get(channel_key)
+
+        if channel_key in self._last_prompts:
+            self._last_prompts.move_to_end(channel_key)
+        elif len(self._last_prompts) >= self.max_channels:
+            evicted_key, _ = self._last_prompts.popitem(last=False)
+            self._totals.pop(evicted_key, None)
+
+        self._last_prompts[channel_key] = serialized
+
+        # First prompt in a channel has nothing to reuse
+        if previous is None or not serialized:
+            return 0.0
+
+        shared = len(os.path.commonprefix([previous, serialized]))
+        ratio = shared / len(serialized)
+
+        totals = self._totals.setdefault(channel_key, [0.0, 0])
+        totals[0] += ratio
+        totals[1] += 1
+        self.total_ratio += ratio
+        self.total_samples += 1
+
+        return ratio
+
+    def get_stats(self) -> dict:
+        average = self.total_ratio / self.total_samples if self.total_samples else 0.0
+        return {
+            "average_stability": average,
+            "samples": self.total_samples,
+            "tracked_channels": len(self._last_prompts),
+            "channels": {
+                key: ratio_sum / samples
+                for key, (ratio_sum, samples) in self._totals.items()
+                if samples
+            }
+        }
+
+# Global tracker instance
+prefix_tracker = PrefixStabilityTracker()
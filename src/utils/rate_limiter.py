@@ -0,0 +1,101 @@
+import time
+from collections import OrderedDict, deque
+from typing import Optional, Dict
+
+# All limiters by name, for per-guild configuration and /health
+rate_limiters: Dict[str, "SlidingWindowLimiter"] = {}
+
+class SlidingWindowLimiter:
+    def __init__(self, name: str, limit: int, window_seconds: float, max_keys: int = 10000):
+        # One deque of monotonic timestamps per key. Keys are kept in last-use
+        # order, so idle ones sit at the front and are evicted in O(1).
+        self.name = name
+        self.default_limit = limit
+        self.window = window_seconds
+        self.max_keys = max_keys
+        self.guild_limits: Dict[str, int] = {}
+        self._events: "OrderedDict[str, deque]" = OrderedDict()
+        self.allowed = 0
+        self.denied = 0
+        rate_limiters[name] = self
+
+    def limit_for(self, guild_id: Optional[str] = None) -> int:
+        return self.guild_limits.get(guild_id, self.default_limit)
+
+    def set_guild_limit(self, guild_id: str, limit: Optional[int]):
+        if limit is None:
+            self.guild_limits.pop(guild_id, None)
+        else:
+            self.guild_limits[guild_id] = limit
+
+    def _prune(self, events: deque, now: float):
+        cutoff = now - self.window
+        while events and events[0] <= cutoff:
+            events.popleft()
+
+    def _evict_idle(self, now: float):
+        while self._events:
+            key, events = next(iter(self._events.items()))
+            if len(self._events) > self.max_keys or not events or now - events[-1] >= self.window:
+                self._events.popitem(last=False)
+            else:
+                break
+
+    def remaining(self, key: str, guild_id: Optional[str] = None) -> int:
+        limit = self.limit_for(guild_id)
+        events = self._events.get(key)
+        if not events:
+            return limit
+        self._prune(events, time.monotonic())
+        return max(0, limit - len(events))
+
+    def can_acquire(self, key: str, guild_id: Optional[str] = None) -> bool:
+        return self.remaining(key, guild_id) > 0
+
+    def record(self, key: str):
+        now = time.monotonic()
+        events = self._events.get(key)
+        if events is None:
+            events = self._events[key] = deque()
+        else:
+            self._events.move_to_end(key)
+        events.append(now)
+        self._evict_idle(now)
+
+    def try_acquire(self, key: str, guild_id: Optional[str] = None) -> bool:
+        if self.can_acquire(key, guild_id):
+            self.record(key)
+            self.allowed += 1
+            return True
+        self.denied += 1
+        return False
+
+    def retry_after(self, key: str, guild_id: Optional[str] = None) -> float:
+        events = self._events.get(key)
+        if not events or self.can_acquire(key, guild_id):
+            return 0.0
+        # Wait for enough old events to slide out of the window
+        excess = len(events) - self.limit_for(guild_id)
+        oldest = events[min(excess, len(events) - 1)]
+        return max(0.0, oldest + self.window - time.monotonic())
+
+    def get_stats(self) -> dict:
+        return {
+            "limit": self.default_limit,
+            "window_seconds": self.window,
+            "tracked_keys": len(self._events),
+            "guild_overrides": len(self.guild_limits),
+            "allowed": self.allowed,
+            "denied": self.denied
+        }
+
+def apply_guild_limits(limits: Dict[str, Dict[str, int]]):
+    # {server_id: {limiter_name: limit}} as loaded from the database
+    for server_id, kinds in limits.items():
+        for name, limit in kinds.items():
+            if name in rate_limiters:
+                rate_limiters[name].set_guild_limit(server_id, limit)
+
+# Per-user limiters (search is per channel, see search_rate_limiter)
+image_limiter = SlidingWindowLimiter("image", limit=10, window_seconds=600)
+llm_limiter = SlidingWindowLimiter("llm", limit=15, window_seconds=60)
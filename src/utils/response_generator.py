@@ -1,32 +1,29 @@
 import aiohttp
+import asyncio
 import re
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache
 from typing import List, Dict, Optional
-from src.utils.personality_manager import get_server_personality
-from src.utils.websearch_util import perform_web_search, format_results_for_prompt
-from src.utils.search_rate_limiter import should_trigger_web_search, sanitize_message_for_search, search_limiter
+from src.personalities import ChopperbotPersonality
+from src.utils.personality_manager import resolve_server_personality
+from src.utils.websearch_util import perform_web_search, get_cached_search, format_results_for_prompt
+from src.utils.message_classifier import classify_message
+from src.utils.search_rate_limiter import (is_search_worthy, sanitize_message_for_search, search_limiter,
+                                          guild_of_channel_key)
+from src.utils.koboldcpp_util import llm_lane
+from src.utils.generation_controller import generation_controller
+from src.utils.history_util import count_tokens
+from src.utils.perf_trace import span
+from src.utils.metrics import llm_requests, llm_latency
 from src.aclient import client
 from src.moderation.logging import logger
 
+# Replies wait at most this long (from when the search started) for web results
+SEARCH_DEADLINE_SECONDS = 4.0
+
 def detect_conversation_type(content: str) -> str:
-    content_lower = content.lower()
-    
-    # Question detection
-    if "?" in content or any(q in content_lower for q in ["what", "how", "why", "who", "when", "where", "explain"]):
-        return "question"
-    
-    # Emotional/Support detection
-    if any(word in content_lower for word in ["sad", "happy", "angry", "worried", "excited", "scared", "depressed", "anxious"]):
-        return "emotional"
-    
-    # Roleplay detection
-    if "*" in content or content.startswith("*") or content.count("*") >= 2:
-        return "roleplay"
-    
-    # Request detection
-    if any(word in content_lower for word in ["please", "can you", "could you", "would you", "help me"]):
-        return "request"
-    
-    return "casual"
+    return classify_message(content).conversation_type
 
 def check_response_quality(response: str) -> tuple[bool, Optional[str]]:
     if not response or not response.strip():
@@ -56,33 +53,132 @@ def check_response_quality(response: str) -> tuple[bool, Optional[str]]:
     
     return True, None
 
+# N-best sampling: one request asks for several candidates and the best one is
+# kept, instead of paying for a full regeneration when a reply is rejected
+N_BEST_CANDIDATES = 2
+PARALLEL_SLOTS = 1  # Set >1 if the backend runs several generations at once (e.g. --multiuser slots)
+
+generation_stats = {
+    "requests": 0,
+    "candidates": 0,
+    "rescued": 0,        # Rejected first choice replaced by another candidate
+    "regenerations": 0   # Every candidate rejected, new request needed
+}
+_backend_supports_n: Optional[bool] = None  # Unknown until the first multi-candidate request
+N_REJECTED_STATUSES = (400, 422)  # How servers that don't accept the n parameter answer
+
+class LLMAPIError(Exception):
+    def __init__(self, status: int, error_text: str):
+        super().__init__(f"API error {status}: {error_text}")
+        self.status = status
+
+def pick_best_candidate(candidates: List[str], channel_key: Optional[str] = None) -> tuple[Optional[str], bool, Optional[str]]:
+    # Valid candidates win; among them the one least like recent replies
+    best, best_score, last_error = None, None, None
+    for candidate in candidates:
+        is_valid, error = check_response_quality(candidate)
+        if not is_valid:
+            last_error = error
+            continue
+        score = response_tracker.similarity(channel_key, candidate) if channel_key else 0.0
+        if best is None or score < best_score:
+            best, best_score = candidate, score
+
+    repetitive = best is not None and channel_key is not None and response_tracker.is_repetitive(channel_key, best)
+    return best, repetitive, last_error
+
+async def _generate_candidates(messages: List[Dict], params: Dict, n: int, usage: Optional[Dict] = None) -> List[str]:
+    global _backend_supports_n
+
+    if n > 1 and _backend_supports_n is not False:
+        try:
+            candidates = await _request_choices(messages, params, n, usage)
+        except LLMAPIError as e:
+            # Only a rejected request says anything about n support; outages,
+            # 5xx and malformed responses go through the normal retry path
+            if _backend_supports_n or e.status not in N_REJECTED_STATUSES:
+                raise
+            _backend_supports_n = False
+            logger.info(f"LLM backend rejected n={n} candidates per request ({e}); using single requests")
+        else:
+            if _backend_supports_n is None:
+                _backend_supports_n = len(candidates) >= n
+                logger.info(f"LLM backend {'supports' if _backend_supports_n else 'ignores'} n={n} candidates per request")
+            return candidates
+
+    if n == 1 or PARALLEL_SLOTS <= 1:
+        return await _request_choices(messages, params, usage=usage)
+
+    # Backend ignores n but has spare slots: sample candidates side by side
+    variants = [
+        dict(params, temperature=min(0.95, params.get("temperature", 0.8) + 0.05 * i))
+        for i in range(min(n, PARALLEL_SLOTS))
+    ]
+    results = await asyncio.gather(*(_request_choices(messages, v, usage=usage) for v in variants), return_exceptions=True)
+    candidates = [text for result in results if not isinstance(result, BaseException) for text in result]
+    if not candidates:
+        raise results[0]
+    return candidates
+
 async def generate_response(
     messages: List[Dict],
     conversation_type: str,
     server_id: Optional[str] = None,
-    max_retries: int = 2
+    max_retries: int = 2,
+    personality: Optional[ChopperbotPersonality] = None,
+    channel_key: Optional[str] = None
 ) -> str:
     last_error = None
+    fallback = None
+    usage = {"generated": 0, "truncated": set()}
+    
+    # Resolve once; the personality can't change mid-request
+    if personality is None:
+        personality = resolve_server_personality(server_id)
+    
+    def finish(response: str) -> str:
+        # Everything generated across candidates and retries vs what the user sees
+        generation_controller.record(
+            personality.name, channel_key, usage["generated"],
+            sanitize_response(response), response in usage["truncated"]
+        )
+        return response
     
     for attempt in range(max_retries):
         try:
-            # Get personality-specific parameters
-            personality = await get_server_personality(server_id)
-            params = personality.get_generation_params(conversation_type)
+            # Personality parameters, with the budget and stop sequences fitted to this channel
+            params = generation_controller.apply(
+                personality.get_generation_params(conversation_type), messages, conversation_type, channel_key,
+                adapt_budget=not personality.bypass_context_adaptation
+            )
             
             # Adjust temperature slightly on retries to get different output
             if attempt > 0:
                 params["temperature"] = min(0.95, params["temperature"] + (attempt * 0.1))
                 logger.debug(f"Retry {attempt + 1} with temperature {params['temperature']}")
+                generation_stats["regenerations"] += 1
+            
+            # Generate candidates and keep the best one
+            candidates = await _generate_candidates(messages, params, N_BEST_CANDIDATES, usage)
+            generation_stats["requests"] += 1
+            generation_stats["candidates"] += len(candidates)
             
-            # Generate response
-            response = await _call_kobold_api(messages, params)
+            with span("candidate_select"):
+                response, repetitive, error = pick_best_candidate(candidates, channel_key)
             
-            # Quality check
-            is_valid, error = check_response_quality(response)
+            if response is not None and (not repetitive or len(candidates) > 1):
+                if response != candidates[0]:
+                    generation_stats["rescued"] += 1
+                if repetitive:
+                    logger.info(f"All {len(candidates)} candidates repeat recent replies in {channel_key}; using the least similar")
+                return finish(response)
             
-            if is_valid:
-                return response
+            if repetitive:
+                # Single candidate that only repeats itself: try again, but keep it in case
+                logger.warning(f"Repetitive response detected in {channel_key}, regenerating...")
+                fallback = response
+                last_error = "Repetitive response"
+                continue
             
             # Log quality issue and retry
             logger.warning(f"Response quality issue (attempt {attempt + 1}/{max_retries}): {error}")
@@ -92,14 +188,33 @@ async def generate_response(
             logger.error(f"Error generating response (attempt {attempt + 1}/{max_retries}): {e}")
             last_error = str(e)
             
-            if attempt == max_retries - 1:
+            if attempt == max_retries - 1 and fallback is None:
                 raise
     
+    if fallback is not None:
+        return finish(fallback)
+    
     # All retries failed
     logger.error(f"All retries failed. Last error: {last_error}")
     return "I'm having trouble forming a response right now. Could you try rephrasing that?"
 
+def get_generation_stats() -> dict:
+    return {
+        **generation_stats,
+        "n_supported": _backend_supports_n,
+        "avg_candidates": generation_stats["candidates"] / generation_stats["requests"] if generation_stats["requests"] else 0.0
+    }
+
 async def _call_kobold_api(messages: List[Dict], params: Dict) -> str:
+    return (await _request_choices(messages, params, kind="command"))[0]
+
+async def _request_choices(
+    messages: List[Dict],
+    params: Dict,
+    n: int = 1,
+    usage: Optional[Dict] = None,
+    kind: str = "reply"
+) -> List[str]:
     url = client.kobold_text_api
     
     # Build full payload
@@ -112,17 +227,39 @@ async def _call_kobold_api(messages: List[Dict], params: Dict) -> str:
         "presence_penalty": 0.6,
         "repetition_penalty": params.get("repetition_penalty", 1.15),
         "max_tokens": params.get("max_tokens", 400),
-        "stop": ["\nUser:", "\nSystem:", "\nAssistant:", "\n\n\n"]
+        "stop": params.get("stop") or ["\nUser:", "\nSystem:", "\nAssistant:", "\n\n\n"]
     }
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, json=payload, timeout=aiohttp.ClientTimeout(total=60)) as resp:
-            if resp.status != 200:
-                error_text = await resp.text()
-                raise Exception(f"API error {resp.status}: {error_text}")
-            
-            data = await resp.json()
-            return data["choices"][0]["message"]["content"]
+    if n > 1:
+        payload["n"] = n
+    
+    result = "error"
+    start = time.perf_counter()
+    try:
+        async with llm_lane.foreground():
+            with span("llm_request"):
+                async with aiohttp.ClientSession() as session:
+                    async with session.post(url, json=payload, timeout=aiohttp.ClientTimeout(total=60)) as resp:
+                        if resp.status != 200:
+                            error_text = await resp.text()
+                            raise LLMAPIError(resp.status, error_text)
+                        
+                        data = await resp.json()
+        result = "ok"
+    except asyncio.TimeoutError:
+        result = "timeout"
+        raise
+    finally:
+        llm_requests.inc(kind=kind, result=result)
+        llm_latency.observe(time.perf_counter() - start, kind=kind)
+    
+    texts = [choice["message"]["content"] for choice in data["choices"]]
+    if usage is not None:
+        tokens = (data.get("usage") or {}).get("completion_tokens")
+        usage["generated"] += tokens if tokens is not None else sum(count_tokens(text) for text in texts)
+        usage["truncated"].update(
+            text for text, choice in zip(texts, data["choices"]) if choice.get("finish_reason") == "length"
+        )
+    return texts
 
 # ============================================================================
 # COMMAND-SPECIFIC GENERATION (for crystal ball, news, etc.)
@@ -134,13 +271,15 @@ async def generate_command_response(
     use_personality: bool = True,
     temperature: float = 0.9,
     max_tokens: int = 300,
-    custom_params: dict = None
+    custom_params: dict = None,
+    personality: Optional[ChopperbotPersonality] = None
 ) -> str:    
     messages = []
     
     # Optionally include personality for consistent voice
     if use_personality:
-        personality = await get_server_personality(server_id)
+        if personality is None:
+            personality = resolve_server_personality(server_id)
         if personality:
             # Use base personality without context adaptation
             system_prompt = personality.get_base_prompt()
@@ -210,86 +349,185 @@ def sanitize_response(response: str, bot_name: str = "Chopperbot") -> str:
     return first_line.strip()
 
 # Response variety tracking
+FINGERPRINT_BITS = 4096          # Hashed word-set size; collisions stay rare for chat-length replies
+REPETITION_WINDOW = 5            # Recent replies compared per channel
+GUILD_REPETITION_WINDOW = 10     # Recent replies compared across a server's channels
+GUILD_REPETITION_THRESHOLD = 0.85
+MAX_TRACKED_CHANNELS = 500
+
+@lru_cache(maxsize=64)
+def response_fingerprint(response: str) -> tuple[int, int]:
+    # Word set packed into one int: Jaccard similarity becomes two big-int
+    # ops and a popcount instead of building sets for every comparison
+    bits = 0
+    for word in set(response.lower().split()):
+        bits |= 1 << (hash(word) % FINGERPRINT_BITS)
+    return bits, bits.bit_count()
+
+def fingerprint_similarity(a: tuple[int, int], b: tuple[int, int]) -> float:
+    if not a[1] or not b[1]:
+        return 0.0
+    shared = (a[0] & b[0]).bit_count()
+    return shared / (a[1] + b[1] - shared)
+
 class ResponseTracker:
-    def __init__(self, max_history: int = 50):
-        self.history = {}  # {channel_key: [recent_responses]}
-        self.max_history = max_history
+    def __init__(self, window: int = REPETITION_WINDOW, max_channels: int = MAX_TRACKED_CHANNELS):
+        # {key: deque of fingerprints}; channels and guilds share one LRU
+        self.history: "OrderedDict[str, deque]" = OrderedDict()
+        self.window = window
+        self.max_channels = max_channels
+        self.repeats = 0
+        self.guild_repeats = 0
+    
+    def _recent(self, key: str, maxlen: int) -> deque:
+        recent = self.history.get(key)
+        if recent is None:
+            recent = self.history[key] = deque(maxlen=maxlen)
+            while len(self.history) > self.max_channels:
+                self.history.popitem(last=False)
+        else:
+            self.history.move_to_end(key)
+        return recent
     
     def add_response(self, channel_key: str, response: str):
-        if channel_key not in self.history:
-            self.history[channel_key] = []
-        
-        self.history[channel_key].append(response.lower())
+        fingerprint = response_fingerprint(response)
+        self._recent(channel_key, self.window).append(fingerprint)
         
-        # Trim history
-        if len(self.history[channel_key]) > self.max_history:
-            self.history[channel_key] = self.history[channel_key][-self.max_history:]
+        guild_id = guild_of_channel_key(channel_key)
+        if guild_id:
+            self._recent(f"guild_{guild_id}", GUILD_REPETITION_WINDOW).append(fingerprint)
+    
+    def _matches(self, key: str, fingerprint: tuple[int, int], threshold: float) -> bool:
+        return any(fingerprint_similarity(fingerprint, cached) > threshold for cached in self.history.get(key, ()))
+    
+    def _max_similarity(self, key: str, fingerprint: tuple[int, int]) -> float:
+        return max((fingerprint_similarity(fingerprint, cached) for cached in self.history.get(key, ())), default=0.0)
+    
+    def similarity(self, channel_key: str, response: str) -> float:
+        # Highest similarity to any recent reply in this channel or server
+        fingerprint = response_fingerprint(response)
+        score = self._max_similarity(channel_key, fingerprint)
+        guild_id = guild_of_channel_key(channel_key)
+        if guild_id:
+            score = max(score, self._max_similarity(f"guild_{guild_id}", fingerprint))
+        return score
     
     def is_repetitive(self, channel_key: str, response: str, threshold: float = 0.7) -> bool:
-        if channel_key not in self.history or len(self.history[channel_key]) == 0:
-            return False
+        fingerprint = response_fingerprint(response)
         
-        response_lower = response.lower()
-        recent = self.history[channel_key][-5:]  # Check last 5
+        if self._matches(channel_key, fingerprint, threshold):
+            self.repeats += 1
+            return True
         
-        for cached in recent:
-            similarity = self._word_overlap_similarity(response_lower, cached)
-            if similarity > threshold:
-                return True
+        # The same canned reply showing up in several channels of one server
+        guild_id = guild_of_channel_key(channel_key)
+        if guild_id and self._matches(f"guild_{guild_id}", fingerprint, max(threshold, GUILD_REPETITION_THRESHOLD)):
+            self.guild_repeats += 1
+            return True
         
         return False
     
-    def _word_overlap_similarity(self, str1: str, str2: str) -> float:
-        words1 = set(str1.split())
-        words2 = set(str2.split())
-        
-        if not words1 or not words2:
-            return 0.0
-        
-        intersection = words1.intersection(words2)
-        union = words1.union(words2)
-        
-        return len(intersection) / len(union) if union else 0.0
+    def get_stats(self) -> dict:
+        return {
+            "tracked": len(self.history),
+            "repeats": self.repeats,
+            "guild_repeats": self.guild_repeats
+        }
 
 # Global tracker instance
 response_tracker = ResponseTracker()
 
+class SpeculativeSearch:
+    __slots__ = ("query", "task", "started_at", "results")
+
+    def __init__(self, query: str, task: Optional[asyncio.Task] = None, results: Optional[list] = None):
+        self.query = query
+        self.task = task
+        self.started_at = time.monotonic()
+        self.results = results
+
+    async def wait(self, deadline: float = SEARCH_DEADLINE_SECONDS) -> Optional[list]:
+        if self.task is None:
+            return self.results
+
+        remaining = max(0.0, deadline - (time.monotonic() - self.started_at))
+        try:
+            # Shielded: a late search keeps running and lands in the cache for the follow-up
+            return await asyncio.wait_for(asyncio.shield(self.task), timeout=remaining)
+        except asyncio.TimeoutError:
+            logger.info(f"Web search missed the {deadline:.0f}s deadline, replying without it: '{self.query}'")
+        except Exception as e:
+            logger.error(f"Search failed: {e}")
+        return None
+
+def _consume_search_error(task: asyncio.Task):
+    # Late failures nobody waits for anymore shouldn't warn as "never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+_UNSET = object()  # search argument not provided, as opposed to an explicit None
+
+def start_web_search(
+    user_message: str,
+    channel_key: str,
+    personality: Optional[ChopperbotPersonality]
+) -> Optional[SpeculativeSearch]:
+    if not getattr(personality, "can_search_web", False) or not is_search_worthy(user_message):
+        return None
+
+    clean_query = sanitize_message_for_search(user_message)
+
+    # Cached results are free; only real searches count against the channel limit
+    results = get_cached_search(clean_query)
+    if results is not None:
+        logger.info(f"Web search served from cache: '{clean_query}'")
+        return SpeculativeSearch(clean_query, results=results)
+
+    if not search_limiter.can_search(channel_key):
+        return None
+
+    # Count at launch so a burst of concurrent searches can't overshoot the limit
+    search_limiter.record_search(channel_key)
+    logger.info(f"Web search triggered: '{clean_query}'")
+    task = asyncio.create_task(perform_web_search(clean_query))
+    task.add_done_callback(_consume_search_error)
+    return SpeculativeSearch(clean_query, task)
+
 async def generate_and_track_response(
     messages: List[Dict],
     conversation_type: str,
     channel_key: str,
-    server_id: Optional[str] = None
+    server_id: Optional[str] = None,
+    personality: Optional[ChopperbotPersonality] = None,
+    search: Optional[SpeculativeSearch] = _UNSET
 ) -> str:
-    personality = await get_server_personality(server_id)
-
-    if getattr(personality, "can_search_web", False):
-        user_message = messages[-1]["content"] if messages else ""
-
-        if should_trigger_web_search(user_message, channel_key):
-            clean_query = sanitize_message_for_search(user_message)
-            logger.info(f"Web search triggered: '{clean_query}'")
-            try:
-                results = await perform_web_search(clean_query)
-                if results:
-                    snippets = format_results_for_prompt(results)
-                    messages.append({
-                        "role": "system",
-                        "content": f"Web search results:\n{snippets}\nUse these results to answer accurately."
-                    })
-                    search_limiter.record_search(channel_key)
-            except Exception as e:
-                logger.error(f"Search failed: {e}")
-
-    response = await generate_response(messages, conversation_type, server_id)
-    
-    # Check if response is repetitive
-    if response_tracker.is_repetitive(channel_key, response):
-        logger.warning(f"Repetitive response detected in {channel_key}, regenerating...")
-
-        # Try one more time with higher temperature
-        params = personality.get_generation_params(conversation_type)
-        params["temperature"] = min(0.95, params["temperature"] + 0.15)
-        response = await _call_kobold_api(messages, params)
+    if personality is None:
+        personality = resolve_server_personality(server_id)
+
+    # Callers normally start the search early (None means they decided against
+    # one); only callers that didn't pass it get the search started here
+    if search is _UNSET:
+        # Per-turn hints follow the history, so find the latest user turn
+        user_message = next(
+            (m["content"] for m in reversed(messages) if m.get("role") == "user"),
+            ""
+        )
+        search = start_web_search(user_message, channel_key, personality)
+
+    if search:
+        with span("web_search_wait"):
+            results = await search.wait()
+        if results:
+            snippets = format_results_for_prompt(results)
+            messages.append({
+                "role": "system",
+                "content": f"Web search results:\n{snippets}\nUse these results to answer accurately."
+            })
+
+    # Candidates are scored against recent replies, so repeats rarely need a new request
+    response = await generate_response(
+        messages, conversation_type, server_id, personality=personality, channel_key=channel_key
+    )
     
     # Track this response
     response_tracker.add_response(channel_key, response)
@@ -0,0 +1,208 @@
+import os
+import math
+import time
+import hashlib
+import asyncio
+import aiosqlite
+from typing import Optional, Dict
+from PIL import Image, UnidentifiedImageError
+from src.utils.image_buffer import MemoryViewStream
+from src.moderation.logging import logger
+
+VISION_CACHE_DB = "data/vision_cache.db"
+MAX_VISION_CACHE_ENTRIES = 5000
+PHASH_SIZE = 32           # 32x32 difference hash = 1024 bits
+PHASH_MAX_DISTANCE = 4    # Bits that may differ for a near-duplicate (~0.4%)
+ASPECT_BUCKETS_PER_OCTAVE = 8  # Near-duplicates must also share an aspect ratio bucket (~9% wide)
+# Off by default: screenshots that differ in a few words hash closer together
+# than a JPEG re-encode of the same image, so no distance separates them and a
+# cached answer for the wrong image is worse than a fresh request. When enabled
+# it only catches near-identical re-uploads (e.g. slightly resized).
+NEAR_DUPLICATES = False
+
+def content_hash(image_data: bytes) -> str:
+    return hashlib.sha256(image_data).hexdigest()
+
+def _aspect_bucket(width: int, height: int) -> int:
+    return round(math.log2(max(width, 1) / max(height, 1)) * ASPECT_BUCKETS_PER_OCTAVE)
+
+def _parse_phash(phash: Optional[str]) -> Optional[tuple[int, int]]:
+    # "bucket:hex" -> (bucket, bits); hashes from before aspect buckets never match
+    if not phash or ":" not in phash:
+        return None
+    bucket, bits = phash.split(":", 1)
+    return int(bucket), int(bits, 16)
+
+def perceptual_hash(image: Image.Image) -> str:
+    # Difference hash: compare each pixel with its right neighbour on a tiny
+    # greyscale copy, prefixed with the aspect ratio bucket
+    aspect = _aspect_bucket(*image.size)
+    small = image.convert("L").resize((PHASH_SIZE + 1, PHASH_SIZE), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    width = PHASH_SIZE + 1
+
+    bits = 0
+    for row in range(PHASH_SIZE):
+        offset = row * width
+        for col in range(PHASH_SIZE):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{aspect}:{bits:0{PHASH_SIZE * PHASH_SIZE // 4}x}"
+
+def fingerprint_image(image_data) -> tuple[str, Optional[str]]:
+    # CPU-bound; run in an executor
+    try:
+        phash = perceptual_hash(Image.open(MemoryViewStream(image_data)))
+    except (UnidentifiedImageError, OSError):
+        phash = None
+    return content_hash(image_data), phash
+
+def cache_scope(kind: str, prompt: str = "", personality_name: Optional[str] = None) -> str:
+    prompt_key = hashlib.sha1(prompt.strip().lower().encode("utf-8")).hexdigest()[:16]
+    return f"{kind}:{personality_name or '-'}:{prompt_key}"
+
+class VisionCache:
+    def __init__(self, db_path: str = VISION_CACHE_DB, max_entries: int = MAX_VISION_CACHE_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._ready = False
+        self._init_lock = asyncio.Lock()
+        # {scope: {aspect_bucket: {sha: phash_bits}}}, loaded per scope on first
+        # near-duplicate lookup so misses don't scan the table
+        self._phash_index: Dict[str, Dict[int, Dict[str, int]]] = {}
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    async def _init(self):
+        if self._ready:
+            return
+        async with self._init_lock:
+            if self._ready:
+                return
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS vision_cache (
+                        scope TEXT NOT NULL,
+                        sha TEXT NOT NULL,
+                        phash TEXT,
+                        result TEXT NOT NULL,
+                        last_used REAL NOT NULL,
+                        PRIMARY KEY (scope, sha)
+                    )
+                """)
+                await db.execute("CREATE INDEX IF NOT EXISTS idx_vision_cache_last_used ON vision_cache(last_used)")
+                await db.commit()
+            self._ready = True
+
+    async def _scope_index(self, db, scope: str) -> Dict[int, Dict[str, int]]:
+        index = self._phash_index.get(scope)
+        if index is None:
+            index = self._phash_index[scope] = {}
+            cursor = await db.execute(
+                "SELECT sha, phash FROM vision_cache WHERE scope = ? AND phash IS NOT NULL", (scope,)
+            )
+            async for sha, phash in cursor:
+                parsed = _parse_phash(phash)
+                if parsed:
+                    index.setdefault(parsed[0], {})[sha] = parsed[1]
+            await cursor.close()
+        return index
+
+    def _nearest(self, index: Dict[int, Dict[str, int]], parsed: tuple[int, int]) -> Optional[str]:
+        bucket, target = parsed
+        best = None
+        for sha, bits in index.get(bucket, {}).items():
+            distance = (target ^ bits).bit_count()
+            if distance <= PHASH_MAX_DISTANCE and (best is None or distance < best[0]):
+                best = (distance, sha)
+        return best[1] if best else None
+
+    async def get(self, scope: str, sha: str, phash: Optional[str] = None, count_miss: bool = True) -> Optional[str]:
+        try:
+            await self._init()
+            async with aiosqlite.connect(self.db_path) as db:
+                cursor = await db.execute(
+                    "SELECT result FROM vision_cache WHERE scope = ? AND sha = ?", (scope, sha)
+                )
+                row = await cursor.fetchone()
+                await cursor.close()
+                matched_sha = sha if row else None
+
+                # Near-duplicate: recompressed or resized copies of the same image
+                parsed = _parse_phash(phash) if row is None and NEAR_DUPLICATES else None
+                if parsed:
+                    match = self._nearest(await self._scope_index(db, scope), parsed)
+                    if match:
+                        cursor = await db.execute(
+                            "SELECT result FROM vision_cache WHERE scope = ? AND sha = ?", (scope, match)
+                        )
+                        row = await cursor.fetchone()
+                        await cursor.close()
+                        if row:
+                            matched_sha = match
+                            self.near_hits += 1
+
+                if row is None:
+                    if count_miss:
+                        self.misses += 1
+                    return None
+
+                await db.execute(
+                    "UPDATE vision_cache SET last_used = ? WHERE scope = ? AND sha = ?",
+                    (time.time(), scope, matched_sha)
+                )
+                await db.commit()
+                self.hits += 1
+                return row[0]
+        except aiosqlite.Error as e:
+            logger.error(f"[Vision Cache] Lookup failed: {e}")
+            return None
+
+    async def set(self, scope: str, sha: str, phash: Optional[str], result: str):
+        try:
+            await self._init()
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute(
+                    "INSERT OR REPLACE INTO vision_cache (scope, sha, phash, result, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (scope, sha, phash, result, time.time())
+                )
+                # LRU eviction
+                cursor = await db.execute("""
+                    DELETE FROM vision_cache WHERE rowid IN (
+                        SELECT rowid FROM vision_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                    ) RETURNING scope, sha, phash
+                """, (self.max_entries,))
+                evicted = await cursor.fetchall()
+                await cursor.close()
+                await db.commit()
+
+            # Keep loaded scope indexes in step with the table
+            for evicted_scope, evicted_sha, evicted_phash in evicted:
+                evicted_parsed = _parse_phash(evicted_phash)
+                if evicted_parsed and evicted_scope in self._phash_index:
+                    self._phash_index[evicted_scope].get(evicted_parsed[0], {}).pop(evicted_sha, None)
+            parsed = _parse_phash(phash)
+            if parsed and scope in self._phash_index:
+                self._phash_index[scope].setdefault(parsed[0], {})[sha] = parsed[1]
+        except aiosqlite.Error as e:
+            logger.error(f"[Vision Cache] Store failed: {e}")
+
+    async def clear(self):
+        await self._init()
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("DELETE FROM vision_cache")
+            await db.commit()
+        self._phash_index.clear()
+
+    def get_stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0
+        }
+
+# Global vision result cache
+vision_cache = VisionCache()
@@ -1,9 +1,15 @@
 import aiohttp
+import asyncio
 import base64
+import time
+from io import BytesIO
 from typing import List, Dict
+from PIL import Image, ImageOps, UnidentifiedImageError
 from discord import Attachment
 from src.aclient import client
 from src.utils.personality_manager import get_server_personality
+from src.utils.vision_cache import vision_cache, cache_scope, content_hash, perceptual_hash
+from src.utils.image_executor import run_image_task
 from src.moderation.logging import logger
 
 # Vision model configuration
@@ -11,6 +17,35 @@ VISION_API_URL = client.kobold_text_api
 DEFAULT_VISION_TEMPERATURE = 0.7
 DEFAULT_VISION_MAX_TOKENS = 500
 
+# Preprocessing configuration
+VISION_MAX_DIMENSION = 1024      # Longest side the vision projector actually uses
+VISION_OUTPUT_FORMAT = "JPEG"    # JPEG or WEBP (check the backend can decode WebP)
+VISION_QUALITY_STEPS = (85, 75, 60)
+VISION_MAX_BYTES = 300 * 1024    # Quality budget: step quality down until under this
+
+vision_stats = {
+    "images": 0,
+    "bytes_in": 0,
+    "bytes_out": 0,
+    "preprocess_ms": 0.0,
+    "requests": 0,
+    "request_ms": 0.0
+}
+
+class PreparedImage:
+    __slots__ = ("data", "mime_type", "original_size", "width", "height", "phash")
+
+    def __init__(self, data: bytes, mime_type: str, original_size: int, width: int = 0, height: int = 0, phash: str = None):
+        self.data = data
+        self.mime_type = mime_type
+        self.original_size = original_size
+        self.width = width
+        self.height = height
+        self.phash = phash
+
+    def to_data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode('utf-8')}"
+
 async def download_image(url: str) -> bytes:
     async with aiohttp.ClientSession() as session:
         async with session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as resp:
@@ -18,9 +53,93 @@ async def download_image(url: str) -> bytes:
                 raise Exception(f"Failed to download image: {resp.status}")
             return await resp.read()
 
-async def encode_image_to_base64(image_data: bytes) -> str:
+def _encode_base64_sync(image_data: bytes) -> str:
     return base64.b64encode(image_data).decode('utf-8')
 
+async def encode_image_to_base64(image_data: bytes) -> str:
+    return await run_image_task(_encode_base64_sync, image_data)
+
+def _preprocess_sync(image_data: bytes) -> PreparedImage:
+    try:
+        image = Image.open(BytesIO(image_data))
+        source_mime = Image.MIME.get(image.format, "image/jpeg")
+        source_size = image.size
+        # EXIF (GPS, orientation), ICC and XMP only go away if we re-encode
+        has_metadata = bool(image.getexif()) or any(
+            key in image.info for key in ("exif", "icc_profile", "xmp", "XML:com.adobe.xmp")
+        )
+        image = ImageOps.exif_transpose(image)  # Respect camera rotation before dropping EXIF
+
+        # Flatten transparency onto white; vision models expect opaque RGB
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        # thumbnail() keeps aspect ratio and never upscales
+        image.thumbnail((VISION_MAX_DIMENSION, VISION_MAX_DIMENSION), Image.Resampling.LANCZOS)
+        phash = perceptual_hash(image)
+
+        # Re-encode without metadata, lowering quality until it fits the budget
+        for quality in VISION_QUALITY_STEPS:
+            buffer = BytesIO()
+            image.save(buffer, format=VISION_OUTPUT_FORMAT, quality=quality, optimize=True)
+            if buffer.tell() <= VISION_MAX_BYTES:
+                break
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        # Truncated or corrupt uploads go to the model untouched
+        logger.warning(f"[Vision] Could not decode image, sending as-is: {e}")
+        return PreparedImage(image_data, "image/jpeg", len(image_data))
+
+    # An already small, in-bounds upload with nothing to strip is sent as-is
+    # rather than grown by re-encoding
+    if buffer.tell() >= len(image_data) and image.size == source_size and not has_metadata:
+        return PreparedImage(image_data, source_mime, len(image_data), image.width, image.height, phash)
+
+    return PreparedImage(
+        buffer.getvalue(), Image.MIME[VISION_OUTPUT_FORMAT], len(image_data),
+        image.width, image.height, phash
+    )
+
+async def preprocess_image(image_data: bytes) -> PreparedImage:
+    start = time.perf_counter()
+    prepared = await run_image_task(_preprocess_sync, image_data)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    vision_stats["images"] += 1
+    vision_stats["bytes_in"] += prepared.original_size
+    vision_stats["bytes_out"] += len(prepared.data)
+    vision_stats["preprocess_ms"] += elapsed_ms
+
+    logger.debug(
+        f"[Vision] Preprocessed {prepared.original_size / 1024:.1f}KB -> "
+        f"{len(prepared.data) / 1024:.1f}KB ({prepared.width}x{prepared.height}) in {elapsed_ms:.0f}ms"
+    )
+    return prepared
+
+def get_vision_stats() -> Dict:
+    images = vision_stats["images"]
+    requests = vision_stats["requests"]
+    return {
+        "images": images,
+        "bytes_saved": vision_stats["bytes_in"] - vision_stats["bytes_out"],
+        "avg_preprocess_ms": vision_stats["preprocess_ms"] / images if images else 0.0,
+        "requests": requests,
+        "avg_request_ms": vision_stats["request_ms"] / requests if requests else 0.0
+    }
+
+def _record_vision_request(start: float, bytes_in: int, bytes_out: int):
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    vision_stats["requests"] += 1
+    vision_stats["request_ms"] += elapsed_ms
+    logger.info(
+        f"[Vision] Analyzed in {elapsed_ms:.0f}ms, "
+        f"saved {(bytes_in - bytes_out) / 1024:.1f}KB ({bytes_in / 1024:.1f}KB -> {bytes_out / 1024:.1f}KB)"
+    )
+
 async def analyze_image(
     image_data: bytes,
     prompt: str = "Describe this image in detail.",
@@ -29,19 +148,35 @@ async def analyze_image(
     max_tokens: int = DEFAULT_VISION_MAX_TOKENS,
     server_id: int = None
 ) -> str:
-    # Encode image to base64
-    image_base64 = await encode_image_to_base64(image_data)
+    start = time.perf_counter()
+
+    personality = await get_server_personality(server_id) if use_personality else None
+    scope = cache_scope("analyze", prompt, personality.name if personality else None)
+
+    # Exact re-post: skip preprocessing and the model entirely
+    sha = await run_image_task(content_hash, image_data)
+    cached = await vision_cache.get(scope, sha, count_miss=False)
+    if cached is not None:
+        logger.debug(f"[Vision] Cache hit for {sha[:12]}")
+        return cached
+
+    # Downscale and re-encode before shipping to the model
+    prepared = await preprocess_image(image_data)
+
+    # Near-duplicate (recompressed / resized copy)
+    cached = await vision_cache.get(scope, sha, prepared.phash)
+    if cached is not None:
+        logger.debug(f"[Vision] Near-duplicate cache hit for {sha[:12]}")
+        return cached
     
     # Build messages with image
     messages = []
     
-    if use_personality:
-        personality = await get_server_personality(server_id)
-        if personality:
-            messages.append({
-                "role": "system",
-                "content": personality.get_base_prompt()
-            })
+    if personality:
+        messages.append({
+            "role": "system",
+            "content": personality.get_base_prompt()
+        })
     
     # Add user message with image
     messages.append({
@@ -54,7 +189,7 @@ async def analyze_image(
             {
                 "type": "image_url",
                 "image_url": {
-                    "url": f"data:image/jpeg;base64,{image_base64}"
+                    "url": prepared.to_data_url()
                 }
             }
         ]
@@ -74,7 +209,11 @@ async def analyze_image(
                 logger.exception(f"Vision API error {resp.status}: {error_text}")
             
             data = await resp.json()
-            return data["choices"][0]["message"]["content"]
+
+    _record_vision_request(start, prepared.original_size, len(prepared.data))
+    result = data["choices"][0]["message"]["content"]
+    await vision_cache.set(scope, sha, prepared.phash, result)
+    return result
 
 async def analyze_discord_attachment(
     attachment: Attachment,
@@ -98,8 +237,10 @@ async def analyze_multiple_images(
     use_personality: bool = True,
     server_id: int = None
 ) -> str:
-    # Encode all images
-    image_base64_list = [await encode_image_to_base64(img) for img in image_data_list]
+    start = time.perf_counter()
+
+    # Preprocess all images concurrently
+    prepared_list = await asyncio.gather(*(preprocess_image(img) for img in image_data_list))
     
     messages = []
     
@@ -114,11 +255,11 @@ async def analyze_multiple_images(
     # Build content with all images
     content = [{"type": "text", "text": prompt}]
     
-    for img_base64 in image_base64_list:
+    for prepared in prepared_list:
         content.append({
             "type": "image_url",
             "image_url": {
-                "url": f"data:image/jpeg;base64,{img_base64}"
+                "url": prepared.to_data_url()
             }
         })
     
@@ -140,7 +281,13 @@ async def analyze_multiple_images(
                 logger.exception(f"Vision API error {resp.status}: {error_text}")
             
             data = await resp.json()
-            return data["choices"][0]["message"]["content"]
+
+    _record_vision_request(
+        start,
+        sum(p.original_size for p in prepared_list),
+        sum(len(p.data) for p in prepared_list)
+    )
+    return data["choices"][0]["message"]["content"]
 
 def is_image_attachment(attachment: Attachment) -> bool:
     return (attachment.content_type and 
@@ -0,0 +1,239 @@
+import os
+import re
+import json
+import time
+import asyncio
+import aiohttp
+import aiosqlite
+from collections import OrderedDict, deque
+from typing import Optional, Dict
+from src.aclient import client
+from src.moderation.logging import logger
+
+WEATHER_API_BASE = "https://api.weatherapi.com/v1"
+WEATHER_TIMEOUT_SECONDS = 10
+
+# Cache configuration
+CURRENT_TTL = 600            # 10 minutes for current conditions
+FORECAST_TTL = 3600          # 1 hour for forecasts
+COMMENTARY_TTL = 3600        # AI commentary per location + conditions bucket
+MAX_MEMORY_ENTRIES = 256     # In-memory entries before spilling to SQLite
+WEATHER_CACHE_DB = "data/weather_cache.db"  # Set to None to disable the SQLite spill
+
+# Per-location upstream rate cap
+MAX_FETCHES_PER_KEY = 3
+FETCH_WINDOW_SECONDS = 600
+
+class WeatherRateLimited(Exception):
+    pass
+
+class WeatherAPIError(Exception):
+    def __init__(self, status: int):
+        super().__init__(f"WeatherAPI response {status}")
+        self.status = status
+
+def normalize_location(*parts: str) -> str:
+    cleaned = []
+    for part in parts:
+        part = re.sub(r"[^\w\s-]", " ", (part or "").lower())
+        part = re.sub(r"\s+", " ", part).strip()
+        if part:
+            cleaned.append(part)
+    return ",".join(cleaned)
+
+class TTLCache:
+    def __init__(self, max_entries: int = MAX_MEMORY_ENTRIES, spill_path: Optional[str] = WEATHER_CACHE_DB):
+        self.max_entries = max_entries
+        self.spill_path = spill_path
+        self._entries = OrderedDict()  # {key: (value, expires_at)}
+        self._spill_ready = False
+        self.hits = 0
+        self.misses = 0
+        self.spilled = 0
+
+    async def _init_spill(self):
+        if self._spill_ready or not self.spill_path:
+            return
+        os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+        async with aiosqlite.connect(self.spill_path) as db:
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS weather_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            await db.execute("DELETE FROM weather_cache WHERE expires_at < ?", (time.time(),))
+            await db.commit()
+        self._spill_ready = True
+
+    async def _spill(self, items: list):
+        try:
+            await self._init_spill()
+            async with aiosqlite.connect(self.spill_path) as db:
+                await db.executemany(
+                    "INSERT OR REPLACE INTO weather_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    [(key, json.dumps(value), expires_at) for key, value, expires_at in items]
+                )
+                await db.commit()
+            self.spilled += len(items)
+        except (aiosqlite.Error, OSError, TypeError) as e:
+            logger.error(f"[Weather Cache] Spill failed: {e}")
+
+    async def _load_spilled(self, key: str):
+        try:
+            await self._init_spill()
+            async with aiosqlite.connect(self.spill_path) as db:
+                cursor = await db.execute(
+                    "SELECT value, expires_at FROM weather_cache WHERE key = ? AND expires_at > ?",
+                    (key, time.time())
+                )
+                row = await cursor.fetchone()
+                await cursor.close()
+            if row:
+                return json.loads(row[0]), row[1]
+        except (aiosqlite.Error, OSError, ValueError) as e:
+            logger.error(f"[Weather Cache] Spill lookup failed: {e}")
+        return None
+
+    def peek(self, key: str, allow_stale: bool = False):
+        entry = self._entries.get(key)
+        if entry and (allow_stale or entry[1] > time.time()):
+            return entry[0]
+        return None
+
+    async def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry:
+            if entry[1] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+        elif self.spill_path:
+            spilled = await self._load_spilled(key)
+            if spilled:
+                value, expires_at = spilled
+                await self.set(key, value, expires_at - time.time())
+                self.hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value, ttl: float):
+        self._entries[key] = (value, time.time() + ttl)
+        self._entries.move_to_end(key)
+
+        evicted = []
+        while len(self._entries) > self.max_entries:
+            old_key, (old_value, expires_at) = self._entries.popitem(last=False)
+            if expires_at > time.time():
+                evicted.append((old_key, old_value, expires_at))
+
+        if evicted and self.spill_path:
+            await self._spill(evicted)
+
+    def get_stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "spilled": self.spilled
+        }
+
+class WeatherClient:
+    def __init__(self, api_key: Optional[str]):
+        self.api_key = api_key
+        self.cache = TTLCache()
+        self.commentary_cache = TTLCache(spill_path=None)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._fetch_times: Dict[str, deque] = {}
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=WEATHER_TIMEOUT_SECONDS)
+            )
+        return self._session
+
+    def _allow_fetch(self, cache_key: str) -> bool:
+        now = time.monotonic()
+        times = self._fetch_times.setdefault(cache_key, deque())
+        while times and now - times[0] > FETCH_WINDOW_SECONDS:
+            times.popleft()
+
+        if len(times) >= MAX_FETCHES_PER_KEY:
+            return False
+
+        times.append(now)
+
+        # Forget idle keys so the tracker stays bounded
+        if len(self._fetch_times) > MAX_MEMORY_ENTRIES:
+            for key in [k for k, v in self._fetch_times.items() if not v or now - v[-1] > FETCH_WINDOW_SECONDS]:
+                del self._fetch_times[key]
+        return True
+
+    async def _request(self, endpoint: str, params: dict) -> dict:
+        # Key goes in the query params, never in a formatted URL that could end up in logs
+        query = {"key": self.api_key, **params}
+        async with self._get_session().get(f"{WEATHER_API_BASE}/{endpoint}", params=query) as resp:
+            if resp.status != 200:
+                raise WeatherAPIError(resp.status)
+            return await resp.json()
+
+    async def _cached_fetch(self, cache_key: str, ttl: float, endpoint: str, params: dict) -> dict:
+        cached = await self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Coalesce concurrent lookups for the same location
+        task = self._inflight.get(cache_key)
+        if task is None:
+            if not self._allow_fetch(cache_key):
+                stale = self.cache.peek(cache_key, allow_stale=True)
+                if stale is not None:
+                    return stale
+                raise WeatherRateLimited(cache_key)
+
+            task = asyncio.create_task(self._request(endpoint, params))
+            self._inflight[cache_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(cache_key, None))
+
+        data = await asyncio.shield(task)
+        await self.cache.set(cache_key, data, ttl)
+        return data
+
+    async def get_current(self, location: str) -> dict:
+        cache_key = f"current:{normalize_location(location)}"
+        return await self._cached_fetch(cache_key, CURRENT_TTL, "current.json", {"q": location})
+
+    async def get_forecast(self, location: str, days: int) -> dict:
+        cache_key = f"forecast:{days}:{normalize_location(location)}"
+        params = {"q": location, "days": days, "aqi": "no", "alerts": "no"}
+        return await self._cached_fetch(cache_key, FORECAST_TTL, "forecast.json", params)
+
+    async def get_commentary(self, commentary_key: str, generate) -> str:
+        cached = await self.commentary_cache.get(commentary_key)
+        if cached is not None:
+            return cached
+
+        text = await generate()
+        await self.commentary_cache.set(commentary_key, text, COMMENTARY_TTL)
+        return text
+
+    def get_stats(self) -> dict:
+        return {
+            "data": self.cache.get_stats(),
+            "commentary": self.commentary_cache.get_stats(),
+            "inflight": len(self._inflight)
+        }
+
+def conditions_bucket(condition: str, temp_c: float, wind_kph: float) -> str:
+    # Round so commentary is reused while conditions are effectively the same
+    return f"{condition.lower()}|{round(temp_c / 3) * 3}|{round(wind_kph / 10) * 10}"
+
+# Global weather client
+weather_client = WeatherClient(client.weatherAPI)
@@ -1,24 +1,110 @@
+import re
+import time
+import asyncio
 import aiohttp
+from collections import OrderedDict
+from typing import Optional, Dict
 from src.moderation.logging import logger
 from src.aclient import client
+from src.utils.perf_trace import span
 
 # Detect your KoboldCPP endpoint
 WEBSEARCH_API_URL = client.kobold_web_api
 
-async def perform_web_search(query: str) -> list:
+# Search cache configuration
+SEARCH_CACHE_TTL = 1800       # 30 minutes; results for "today" questions go stale
+MAX_SEARCH_CACHE_SIZE = 500
+
+# Articles, auxiliaries and filler only; question words stay in the key so
+# "when is the concert" and "where is the concert" don't share results
+SEARCH_STOPWORDS = frozenset({
+    "a", "an", "the", "is", "are", "was", "were", "be", "been", "am", "do", "does", "did",
+    "of", "in", "on", "at", "to", "for", "from", "by", "with", "about", "into", "and", "or",
+    "can", "could", "would", "should", "will", "you", "me", "i", "my", "your", "we", "us",
+    "it", "its", "this", "that", "there", "any", "some", "please", "tell", "know", "hey",
+    "search", "look", "up", "find", "information"
+})
+
+search_cache = OrderedDict()  # {normalized_query: (results, cached_at)}
+search_cache_stats = {"hits": 0, "misses": 0, "coalesced": 0}
+_inflight_searches: Dict[str, asyncio.Task] = {}
+
+def normalize_query(query: str) -> str:
+    # "Latest news today?" and "today's latest news" map to the same key
+    tokens = re.findall(r"[\w']+", query.lower())
+    kept = {token.strip("'").removesuffix("'s") for token in tokens} - SEARCH_STOPWORDS
+    kept.discard("")
+    return " ".join(sorted(kept)) or query.strip().lower()
+
+def get_cached_search(query: str) -> Optional[list]:
+    key = normalize_query(query)
+    entry = search_cache.get(key)
+    if entry is None:
+        return None
+
+    results, cached_at = entry
+    if time.time() - cached_at > SEARCH_CACHE_TTL:
+        del search_cache[key]
+        return None
+
+    search_cache.move_to_end(key)
+    search_cache_stats["hits"] += 1
+    return results
+
+def _store_search(key: str, results: list):
+    search_cache[key] = (results, time.time())
+    search_cache.move_to_end(key)
+    while len(search_cache) > MAX_SEARCH_CACHE_SIZE:
+        search_cache.popitem(last=False)
+
+async def _fetch_web_search(query: str) -> list:
 
     payload = {
         "q": query,
     }
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(WEBSEARCH_API_URL, json=payload) as resp:
-            if resp.status != 200:
-                error_text = await resp.text()
-                raise Exception(f"WebSearch error {resp.status}: {error_text}")
-            data = await resp.json()
-            logger.info(f"WebSearch fetched {len(data)} results for '{query}'")
-            return data
+    with span("web_search"):
+        async with aiohttp.ClientSession() as session:
+            async with session.post(WEBSEARCH_API_URL, json=payload) as resp:
+                if resp.status != 200:
+                    error_text = await resp.text()
+                    raise Exception(f"WebSearch error {resp.status}: {error_text}")
+                data = await resp.json()
+                logger.info(f"WebSearch fetched {len(data)} results for '{query}'")
+                return data
+
+async def perform_web_search(query: str) -> list:
+    cached = get_cached_search(query)
+    if cached is not None:
+        return cached
+
+    key = normalize_query(query)
+
+    # Coalesce concurrent identical searches into one backend call
+    task = _inflight_searches.get(key)
+    if task is None:
+        search_cache_stats["misses"] += 1
+        task = asyncio.create_task(_fetch_web_search(query))
+        _inflight_searches[key] = task
+        task.add_done_callback(lambda _: _inflight_searches.pop(key, None))
+    else:
+        search_cache_stats["coalesced"] += 1
+
+    results = await asyncio.shield(task)
+    if results:
+        _store_search(key, results)
+    return results
+
+def clear_search_cache():
+    search_cache.clear()
+
+def get_search_cache_stats() -> dict:
+    lookups = search_cache_stats["hits"] + search_cache_stats["misses"]
+    return {
+        "entries": len(search_cache),
+        "hit_rate": search_cache_stats["hits"] / lookups if lookups else 0.0,
+        **search_cache_stats
+    }
 
 def format_results_for_prompt(results: list) -> str:
 